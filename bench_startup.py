@@ -0,0 +1,126 @@
+"""Measure the startup cost of the download filter and of the imports.
+
+Every case runs in a fresh interpreter, so nothing cached by a case is
+counted in another one:
+
+- `filter`: the first `Filter()` with the shipped tables, the first one when
+  the tables have to be generated like before they were shipped (into a temp
+  dir, the shipped tables are not touched), and each further `Filter()`
+- `import`: `python -X importtime -c "import media_downloader"`, the slowest
+  modules by self time, the total, and the heavy optional dependencies
+  which were imported although their features did not run
+
+Usage: `python bench_startup.py [repeat]`, the medians of `repeat` runs,
+5 by default.
+"""
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# imported only by the features which need them
+OPTIONAL_MODULES = ("moviepy", "flask", "aligo", "module.web")
+
+_FILTER_SCRIPT = """
+import sys, tempfile, time
+import module.filter
+generate = sys.argv[1] == "generated"
+if generate:
+    for table in (module.filter.LEXTAB, module.filter.PARSETAB):
+        sys.modules[table] = None
+    temp_dir = tempfile.TemporaryDirectory()
+    module.filter.TABLE_DIR = temp_dir.name
+start = time.perf_counter()
+module.filter.Filter()
+first = time.perf_counter() - start
+start = time.perf_counter()
+for _ in range(100):
+    module.filter.Filter()
+print(first, (time.perf_counter() - start) / 100)
+"""
+
+
+def _run(args: List[str]) -> subprocess.CompletedProcess:
+    """Run python with `args` in the project dir"""
+    return subprocess.run(
+        [sys.executable] + args,
+        cwd=PROJECT_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def bench_filter(repeat: int) -> Dict[str, Tuple[float, float]]:
+    """Median seconds of the first and of a further `Filter()`, by the way
+    the tables are got"""
+    result = {}
+    for mode in ("shipped", "generated"):
+        runs = [
+            tuple(map(float, _run(["-c", _FILTER_SCRIPT, mode]).stdout.split()))
+            for _ in range(repeat)
+        ]
+        result[mode] = (
+            statistics.median(it[0] for it in runs),
+            statistics.median(it[1] for it in runs),
+        )
+    return result
+
+
+def bench_import(repeat: int) -> Tuple[float, List[Tuple[str, float]], List[str]]:
+    """Median microseconds of importing media_downloader, of the slowest
+    modules by self time, and the optional modules which were imported"""
+    totals: List[float] = []
+    self_times: Dict[str, List[float]] = {}
+    imported: List[str] = []
+    for _ in range(repeat):
+        proc = _run(
+            [
+                "-X",
+                "importtime",
+                "-c",
+                "import sys, media_downloader; print(' '.join(sys.modules))",
+            ]
+        )
+        imported = [it for it in OPTIONAL_MODULES if it in proc.stdout.split()]
+        for line in proc.stderr.splitlines():
+            # import time: self [us] | cumulative | imported package
+            parts = line.split("|")
+            if len(parts) != 3 or not parts[1].strip().isdigit():
+                continue
+            name = parts[2].strip()
+            self_times.setdefault(name, []).append(float(parts[0].split(":")[1]))
+            if name == "media_downloader":
+                totals.append(float(parts[1]))
+
+    slowest = sorted(
+        ((name, statistics.median(it)) for name, it in self_times.items()),
+        key=lambda it: it[1],
+        reverse=True,
+    )[:10]
+    return statistics.median(totals), slowest, imported
+
+
+def main():
+    """Print the results"""
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    print(f"python {sys.version.split()[0]}, median of {repeat} runs")
+    for mode, (first, further) in bench_filter(repeat).items():
+        print(
+            f"Filter() with {mode} tables: first {first * 1000:.2f}ms, "
+            f"further {further * 1000:.3f}ms"
+        )
+
+    total, slowest, imported = bench_import(repeat)
+    print(f"import media_downloader: {total / 1000:.0f}ms")
+    for name, self_time in slowest:
+        print(f"  {name}: {self_time / 1000:.1f}ms")
+    print(f"optional modules imported: {', '.join(imported) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,27 @@
-from module.filter import Filter
+"""Generate the lexer and parser tables of the download filter.
 
-Filter()
+The tables are shipped in `module/` and loaded without checking the grammar,
+run this script after changing the tokens or the grammar in `module/filter.py`.
+The new tables are generated into a temp dir and then moved over the shipped
+ones, so a failure leaves the shipped tables as they were.
+"""
+import os
+import sys
+import tempfile
+
+from module.filter import LEXTAB, PARSETAB, TABLE_DIR, BaseFilter
+
+# the rules of the grammar, it may load the shipped tables
+filter_rules = BaseFilter()
+
+# the shipped tables can not be imported any more, so they are generated
+for table in (LEXTAB, PARSETAB):
+    sys.modules[table] = None  # type: ignore
+
+with tempfile.TemporaryDirectory(dir=TABLE_DIR) as temp_dir:
+    filter_rules.build_tables(LEXTAB, PARSETAB, temp_dir)
+    for table in (LEXTAB, PARSETAB):
+        table_file = table.rsplit(".", maxsplit=1)[-1] + ".py"
+        os.replace(
+            os.path.join(temp_dir, table_file), os.path.join(TABLE_DIR, table_file)
+        )
@@ -4,17 +4,35 @@ import logging
 import os
 import shutil
 import time
-from typing import List, Optional, Tuple, Union
+from datetime import timedelta
+from typing import Awaitable, List, Optional, Tuple, Union
 
 import pyrogram
 from loguru import logger
 from pyrogram.types import Audio, Document, Photo, Video, VideoNote, Voice
 from rich.logging import RichHandler
 
-from module.app import Application, ChatDownloadConfig, DownloadStatus, TaskNode
+from module import metrics
+from module.app import (
+    Application,
+    ChatDownloadConfig,
+    DownloadStatus,
+    MessageWatermark,
+    TaskNode,
+)
 from module.bot import start_download_bot, stop_download_bot
-from module.download_stat import update_download_status
-from module.get_chat_history_v2 import get_chat_history_v2
+from module.chunk_download import download_media_parallel
+from module.cloud_drive import CloudDrive
+from module.download_stat import run_download_stat_ticker, update_download_status
+from module.get_chat_history_v2 import (
+    HistoryScanStat,
+    batch_messages,
+    get_chat_history_partitioned,
+    get_chat_history_v2,
+    get_chat_media_history,
+    get_media_search_filters,
+    get_message_id_before,
+)
 from module.language import _t
 from module.pyrogram_extension import (
     HookClient,
@@ -24,9 +42,9 @@ from module.pyrogram_extension import (
     report_bot_download_status,
     set_max_concurrent_transmissions,
     set_meta_data,
+    update_upload_stat,
     upload_telegram_chat,
 )
-from module.web import init_web
 from utils.format import truncate_filename, validate_title
 from utils.log import LogFilter
 from utils.meta import print_meta
@@ -48,6 +66,11 @@ app = Application(CONFIG_NAME, DATA_FILE_NAME, APPLICATION_NAME)
 queue: asyncio.Queue = asyncio.Queue()
 RETRY_TIME_OUT = 3
 
+metrics.DOWNLOAD_QUEUE_SIZE.set_function(queue.qsize)
+metrics.UPLOAD_QUEUE_SIZE.set_function(lambda: app.upload_queue.pending_count)
+metrics.MEDIA_PROCESS_WAITING.set_function(lambda: app.media_processor.waiting)
+metrics.MEDIA_PROCESS_RUNNING.set_function(lambda: app.media_processor.running)
+
 logging.getLogger("pyrogram.session.session").addFilter(LogFilter())
 logging.getLogger("pyrogram.client").addFilter(LogFilter())
 
@@ -142,6 +165,27 @@ def _can_download(_type: str, file_formats: dict, file_format: Optional[str]) ->
     return True
 
 
+def _can_chunk_download(media_size: int) -> bool:
+    """
+    Check if the media should be downloaded by several concurrent chunk requests.
+
+    Parameters
+    ----------
+    media_size: int
+        The size of the media to be downloaded.
+
+    Returns
+    -------
+    bool
+        True if the parallel chunked download is enabled and the media is large enough.
+    """
+    return (
+        app.enable_chunk_download
+        and bool(media_size)
+        and media_size >= app.chunk_download_min_size
+    )
+
+
 def _is_exist(file_path: str) -> bool:
     """
     Check if a file exists and it is not a directory.
@@ -269,6 +313,8 @@ async def add_download_task(
     if message.empty:
         return False
     node.download_status[message.id] = DownloadStatus.Downloading
+    if not node.bot:
+        app.set_download_pending(node, message.id)
     await queue.put((message, node))
     node.total_task += 1
     return True
@@ -277,7 +323,7 @@ async def add_download_task(
 async def download_task(
     client: pyrogram.Client, message: pyrogram.types.Message, node: TaskNode
 ):
-    """Download and Forward media"""
+    """Download media and hand it over to the upload workers"""
 
     download_status, file_name = await download_media(
         client, message, app.media_types, app.file_formats, node
@@ -290,6 +336,38 @@ async def download_task(
 
     file_size = os.path.getsize(file_name) if file_name else 0
 
+    # only the files to upload are kept on the disk until their upload is done
+    pending_size = (
+        file_size
+        if download_status is DownloadStatus.SuccessDownload
+        and (node.upload_telegram_chat_id or app.cloud_drive_config.enable_upload_file)
+        else 0
+    )
+    await app.upload_queue.put(
+        (client, message, node, download_status, file_name, file_size), pending_size
+    )
+
+
+async def record_upload_file(
+    node: TaskNode, message_id: int, file_name: str, upload_result: Awaitable[bool]
+):
+    """Record the file as uploaded if the upload succeeded"""
+    if await upload_result:
+        node.upload_success_count += 1
+        app.set_upload_file(node, message_id, file_name)
+
+
+async def upload_task(
+    client: pyrogram.Client,
+    message: pyrogram.types.Message,
+    node: TaskNode,
+    download_status: DownloadStatus,
+    file_name: str,
+    file_size: int,
+) -> Optional[asyncio.Task]:
+    """Forward and upload the downloaded media, return the task of the
+    delayed upload if the file was added to a zip group or a batch"""
+    delayed_task: Optional[asyncio.Task] = None
     await upload_telegram_chat(
         client,
         node.upload_user if node.upload_user else client,
@@ -305,8 +383,30 @@ async def download_task(
         not node.upload_telegram_chat_id
         and download_status is DownloadStatus.SuccessDownload
     ):
-        if await app.upload_file(file_name):
-            node.upload_success_count += 1
+        delayed_upload = app.add_zip_group_file(
+            file_name, message.media_group_id
+        ) or app.add_rclone_batch_file(file_name)
+        if delayed_upload:
+            # uploaded later with the rest of its group or batch, the worker goes on
+            delayed_task = app.loop.create_task(
+                record_upload_file(node, message.id, file_name, delayed_upload)
+            )
+        else:
+            ui_file_name = (
+                f"****{os.path.splitext(file_name)[-1]}"
+                if app.hide_file_name
+                else file_name
+            )
+            await record_upload_file(
+                node,
+                message.id,
+                file_name,
+                app.upload_file(
+                    file_name,
+                    progress=update_upload_stat,
+                    progress_args=(message.id, ui_file_name, time.time(), node, client),
+                ),
+            )
 
     await report_bot_download_status(
         node.bot,
@@ -314,6 +414,7 @@ async def download_task(
         download_status,
         file_size,
     )
+    return delayed_task
 
 
 # pylint: disable = R0915,R0914
@@ -366,12 +467,14 @@ async def download_media(
     task_start_time: float = time.time()
     media_size = 0
     _media = None
+    media_type: str = ""
     message = await fetch_message(client, message)
     try:
         for _type in media_types:
             _media = getattr(message, _type, None)
             if _media is None:
                 continue
+            media_type = _type
             app.file_num += 1
             file_name, temp_file_name, file_format = await _get_media_meta(
                 node.chat_id, message, _media, _type, app.file_num
@@ -409,31 +512,42 @@ async def download_media(
 
     for retry in range(3):
         try:
-            temp_download_path = await client.download_media(
-                message,
-                file_name=temp_file_name,
-                progress=update_download_status,
-                progress_args=(
-                    message_id,
-                    ui_file_name,
-                    task_start_time,
-                    node,
+            progress_args = (message_id, ui_file_name, task_start_time, node, client)
+            if _can_chunk_download(media_size):
+                temp_download_path = await download_media_parallel(
                     client,
-                ),
-            )
+                    _media,
+                    temp_file_name,
+                    app.max_chunk_download_task,
+                    progress=update_download_status,
+                    progress_args=progress_args,
+                    chat_id=node.chat_id,
+                    message_id=message_id,
+                )
+            else:
+                temp_download_path = await client.download_media(
+                    message,
+                    file_name=temp_file_name,
+                    progress=update_download_status,
+                    progress_args=progress_args,
+                )
 
             if temp_download_path and isinstance(temp_download_path, str):
                 _check_download_finish(media_size, temp_download_path, ui_file_name)
                 await asyncio.sleep(0.5)
                 _move_to_download_path(temp_download_path, file_name)
+                metrics.DOWNLOAD_SECONDS.observe(time.time() - task_start_time)
                 # TODO: if not exist file size or media
                 return DownloadStatus.SuccessDownload, file_name
         except pyrogram.errors.exceptions.bad_request_400.BadRequest:
+            metrics.RETRIES.inc(stage="download", exception="BadRequest")
             logger.warning(
                 f"Message[{message.id}]: {_t('file reference expired, refetching')}..."
             )
             await asyncio.sleep(RETRY_TIME_OUT)
             message = await fetch_message(client, message)
+            # the chunked download needs the media with the new file reference
+            _media = getattr(message, media_type)
             if _check_timeout(retry, message.id):
                 # pylint: disable = C0301
                 logger.error(
@@ -441,10 +555,13 @@ async def download_media(
                     f"{_t('file reference expired for 3 retries, download skipped.')}"
                 )
         except pyrogram.errors.exceptions.flood_420.FloodWait as wait_err:
+            metrics.RETRIES.inc(stage="download", exception="FloodWait")
+            metrics.FLOOD_WAIT_SECONDS.inc(wait_err.value, stage="download")
             await asyncio.sleep(wait_err.value)
             logger.warning("Message[{}]: FlowWait {}", message.id, wait_err.value)
             _check_timeout(retry, message.id)
         except TypeError:
+            metrics.RETRIES.inc(stage="download", exception="TypeError")
             # pylint: disable = C0301
             logger.warning(
                 f"{_t('Timeout Error occurred when downloading Message')}[{message.id}], "
@@ -509,33 +626,115 @@ async def worker(client: pyrogram.client.Client):
             logger.exception(f"{e}")
 
 
-async def download_chat_task(
+async def upload_worker():
+    """Work for upload task"""
+    while app.is_running:
+        try:
+            item, size = await app.upload_queue.get()
+            delayed_task = None
+            try:
+                delayed_task = await upload_task(*item)
+            finally:
+                # the file stays on the disk until its delayed upload is done
+                if delayed_task:
+                    app.upload_queue.hold(delayed_task, size)
+                else:
+                    await app.upload_queue.done(size)
+        except Exception as e:
+            logger.exception(f"{e}")
+
+
+async def get_scan_range(
     client: pyrogram.Client,
     chat_download_config: ChatDownloadConfig,
     node: TaskNode,
+) -> Optional[Tuple[int, int]]:
+    """The `(offset_id, max_id)` of the history scan, narrowed by the
+    `message_id` and `message_date` bounds of the download filter.
+
+    `max_id` is inclusive and 0 if unbounded, None if the filter can not match
+    any message of the range.
+    """
+    offset_id = chat_download_config.last_read_message_id
+    max_id = node.end_offset_id
+    if not chat_download_config.download_filter:
+        return offset_id, max_id
+
+    bounds = app.download_filter.get_bounds(chat_download_config.download_filter)
+    if bounds.min_date:
+        first_id = await get_message_id_before(client, node.chat_id, bounds.min_date)
+        bounds.min_id = max(bounds.min_id or 0, first_id + 1)
+    if bounds.max_date:
+        last_id = await get_message_id_before(
+            client, node.chat_id, bounds.max_date + timedelta(seconds=1)
+        )
+        if bounds.max_id is not None:
+            last_id = min(bounds.max_id, last_id)
+        bounds.max_id = last_id
+
+    if bounds.min_id:
+        offset_id = max(offset_id, bounds.min_id)
+    if bounds.max_id is not None:
+        if bounds.max_id < 1:
+            return None
+        max_id = min(max_id, bounds.max_id) if max_id else bounds.max_id
+
+    if max_id and max_id < offset_id:
+        return None
+    return offset_id, max_id
+
+
+def get_messages_iter(
+    client: pyrogram.Client,
+    node: TaskNode,
+    offset_id: int,
+    max_id: int,
+    stat: HistoryScanStat,
 ):
-    """Download all task"""
-    messages_iter = get_chat_history_v2(
+    """Messages of the chat from `offset_id` to `max_id` in ascending order"""
+    search_filters = (
+        get_media_search_filters(app.media_types) if app.scan_media_only else None
+    )
+    if search_filters:
+        return get_chat_media_history(
+            client,
+            node.chat_id,
+            search_filters,
+            limit=node.limit,
+            max_id=max_id,
+            offset_id=offset_id,
+            stat=stat,
+        )
+    if app.max_scan_history_task > 1 and not node.limit:
+        return get_chat_history_partitioned(
+            client,
+            node.chat_id,
+            max_id=max_id,
+            offset_id=offset_id,
+            max_task=app.max_scan_history_task,
+            stat=stat,
+        )
+    return get_chat_history_v2(
         client,
         node.chat_id,
         limit=node.limit,
-        max_id=node.end_offset_id,
-        offset_id=chat_download_config.last_read_message_id,
+        max_id=max_id,
+        offset_id=offset_id,
         reverse=True,
+        stat=stat,
     )
 
-    chat_download_config.node = node
-
-    if chat_download_config.ids_to_retry:
-        logger.info(f"{_t('Downloading files failed during last run')}...")
-        skipped_messages: list = await client.get_messages(  # type: ignore
-            chat_id=node.chat_id, message_ids=chat_download_config.ids_to_retry
-        )
 
-        for message in skipped_messages:
-            await add_download_task(message, node)
-
-    async for message in messages_iter:  # type: ignore
+async def add_download_tasks(
+    client: pyrogram.Client,
+    chat_download_config: ChatDownloadConfig,
+    node: TaskNode,
+    messages: List[pyrogram.types.Message],
+):
+    """Filter a page of messages and add the download tasks in order"""
+    candidates: list = []
+    metas: List[MetaData] = []
+    for message in messages:
         meta_data = MetaData()
 
         caption = message.caption
@@ -549,10 +748,17 @@ async def download_chat_task(
         if app.need_skip_message(chat_download_config, message.id):
             continue
 
-        if app.exec_filter(chat_download_config, meta_data):
+        candidates.append(message)
+        metas.append(meta_data)
+
+    matches = app.exec_filter_batch(chat_download_config, metas)
+    for message, matched in zip(candidates, matches):
+        if matched:
             await add_download_task(message, node)
         else:
             node.download_status[message.id] = DownloadStatus.SkipDownload
+            if not node.bot:
+                app.set_download_skip(node, message.id)
             await upload_telegram_chat(
                 client,
                 node.upload_user,
@@ -562,6 +768,48 @@ async def download_chat_task(
                 DownloadStatus.SkipDownload,
             )
 
+
+async def download_chat_task(
+    client: pyrogram.Client,
+    chat_download_config: ChatDownloadConfig,
+    node: TaskNode,
+):
+    """Download all task"""
+    scan_stat = HistoryScanStat()
+    scan_range = await get_scan_range(client, chat_download_config, node)
+    if scan_range != (chat_download_config.last_read_message_id, node.end_offset_id):
+        scan_ids = (
+            f"{scan_range[0]} - {scan_range[1] or 'latest'}" if scan_range else "none"
+        )
+        logger.info(
+            f"download_filter of {node.chat_id} bounds the scan to message id "
+            f"{scan_ids}"
+        )
+
+    chat_download_config.node = node
+    chat_download_config.watermark = MessageWatermark(
+        chat_download_config.last_read_message_id - 1
+    )
+
+    if chat_download_config.ids_to_retry:
+        logger.info(f"{_t('Downloading files failed during last run')}...")
+        skipped_messages: list = await client.get_messages(  # type: ignore
+            chat_id=node.chat_id, message_ids=chat_download_config.ids_to_retry
+        )
+
+        for message in skipped_messages:
+            await add_download_task(message, node)
+
+    if scan_range:
+        messages_iter = get_messages_iter(client, node, *scan_range, scan_stat)
+        async for messages in batch_messages(messages_iter):  # type: ignore
+            await add_download_tasks(client, chat_download_config, node, messages)
+
+    logger.info(
+        f"scanned {node.chat_id}: {scan_stat.messages} messages, "
+        f"{scan_stat.pages} pages, {scan_stat.pages_per_second():.2f} pages/s"
+    )
+
     chat_download_config.need_check = True
     chat_download_config.total_task = node.total_task
     node.is_running = True
@@ -587,6 +835,18 @@ async def run_until_all_task_finish():
             if not value.need_check or value.total_task != value.finish_task:
                 finish = False
 
+        if (
+            finish
+            and app.upload_queue.only_held()
+            and app.cloud_drive_config.has_zip_groups()
+        ):
+            # no more files join the zip groups, upload them now
+            await CloudDrive.flush_zip_groups(app.cloud_drive_config)
+
+        # the downloaded files may still be uploading
+        if not app.upload_queue.empty():
+            finish = False
+
         if (not app.bot_token and finish) or app.restart_program:
             break
 
@@ -626,7 +886,12 @@ def main():
     )
     try:
         app.pre_run()
-        init_web(app)
+        if app.enable_web:
+            # flask is only loaded for the web ui
+            # pylint: disable = C0415
+            from module.web import init_web
+
+            init_web(app)
 
         set_max_concurrent_transmissions(client, app.max_concurrent_transmissions)
 
@@ -634,9 +899,20 @@ def main():
         logger.success(_t("Successfully started (Press Ctrl+C to stop)"))
 
         app.loop.create_task(download_all_chat(client))
+        tasks.append(app.loop.create_task(app.checkpoint()))
+        tasks.append(
+            app.loop.create_task(
+                run_download_stat_ticker(
+                    max_completed=app.max_completed_download,
+                    completed_ttl=app.completed_download_ttl,
+                )
+            )
+        )
         for _ in range(app.max_download_task):
             task = app.loop.create_task(worker(client))
             tasks.append(task)
+        for _ in range(app.max_upload_worker):
+            tasks.append(app.loop.create_task(upload_worker()))
 
         if app.bot_token:
             app.loop.run_until_complete(
@@ -652,12 +928,23 @@ def main():
         if app.bot_token:
             app.loop.run_until_complete(stop_download_bot())
         app.loop.run_until_complete(stop_server(client))
+        app.loop.run_until_complete(app.cloud_drive_config.stop())
         for task in tasks:
             task.cancel()
         logger.info(_t("Stopped!"))
         check_for_updates(app.proxy)
         logger.info(f"{_t('update config')}......")
         app.update_config()
+        if app.state_store:
+            app.state_store.close()
+        media_stat = app.media_processor.stat
+        if media_stat.jobs:
+            logger.info(
+                f"processed {media_stat.jobs} videos, "
+                f"average {media_stat.average_time():.2f}s, "
+                f"max {media_stat.max_time:.2f}s, "
+                f"waited {media_stat.total_wait_time:.2f}s in total"
+            )
         logger.success(
             f"{_t('Updated last read message_id to config file')},"
             f"{_t('total download')} {app.total_download_task}, "
@@ -8,8 +8,8 @@ a = Analysis(
     ['media_downloader.py'],
     pathex=[],
     binaries=[],
-    datas=[('./module/templates','./module/templates'),('./module/static/','./module/static'), ('./module/parsetab.py','./module/'),('./module/parser.out','./module/'),('./config.yaml','./'),('./data.yaml','./')],
-    hiddenimports=[],
+    datas=[('./module/templates','./module/templates'),('./module/static/','./module/static'), ('./config.yaml','./'),('./data.yaml','./')],
+    hiddenimports=['module.filter_lextab','module.filter_parsetab'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
@@ -1,25 +1,31 @@
 """Application module"""
 
 import asyncio
+import heapq
 import os
 import time
 from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime
 from enum import Enum
-from typing import List, Optional, Union
+from typing import Callable, List, Optional, Union
 
 from loguru import logger
 from ruamel import yaml
 
+from module.batch_filter import BatchFilter
 from module.cloud_drive import CloudDrive, CloudDriveConfig
 from module.filter import Filter
 from module.language import Language, set_language
-from utils.format import replace_date_time, validate_title
+from module.media_process import MediaProcessor
+from module.metrics import FILTER_SECONDS
+from module.state_store import StateStore
+from module.upload_queue import UploadQueue
+from utils.format import get_byte_from_str, replace_date_time, validate_title
 from utils.meta_data import MetaData
 
 _yaml = yaml.YAML()
-# pylint: disable = R0902
+# pylint: disable = R0902,R0904
 
 
 class DownloadStatus(Enum):
@@ -276,6 +282,48 @@ class LimitCall:
             await asyncio.sleep(1)
 
 
+class MessageWatermark:
+    """Highest message id of a chat below which every queued message finished
+
+    Message ids are scanned in ascending order, so the watermark is just below
+    the oldest message still in flight, or the newest finished one if none.
+    """
+
+    def __init__(self, base: int = 0):
+        """
+        Parameters
+        ----------
+        base: int
+            Every message id up to this is already finished
+        """
+        self.base = base
+        self.max_done = base
+        self._pending: set = set()
+        self._pending_heap: List[int] = []
+
+    def add(self, message_id: int):
+        """A message is queued, ids not above the base are ignored"""
+        if message_id <= self.base or message_id in self._pending:
+            return
+        self._pending.add(message_id)
+        heapq.heappush(self._pending_heap, message_id)
+
+    def done(self, message_id: int):
+        """A message is finished, whatever the result"""
+        self._pending.discard(message_id)
+        self.max_done = max(self.max_done, message_id)
+
+    def value(self) -> int:
+        """The watermark"""
+        while self._pending_heap and self._pending_heap[0] not in self._pending:
+            heapq.heappop(self._pending_heap)
+
+        if self._pending_heap:
+            return max(self.base, self._pending_heap[0] - 1)
+
+        return self.max_done
+
+
 class ChatDownloadConfig:
     """Chat Message Download Status"""
 
@@ -291,6 +339,15 @@ class ChatDownloadConfig:
         self.need_check: bool = False
         self.upload_telegram_chat_id: Union[int, str] = None
         self.node: TaskNode = TaskNode(0)
+        self.watermark: MessageWatermark = MessageWatermark()
+
+
+def _dump_yaml(data, file_name: str):
+    """Write yaml to a temp file and rename it, a kill never leaves half a file"""
+    temp_file_name = file_name + ".tmp"
+    with open(temp_file_name, "w", encoding="utf-8") as yaml_file:
+        _yaml.dump(data, yaml_file)
+    os.replace(temp_file_name, file_name)
 
 
 def get_config(config, key, default=None, val_type=str, verbose=True):
@@ -325,6 +382,7 @@ def get_config(config, key, default=None, val_type=str, verbose=True):
 class Application:
     """Application load config and update config."""
 
+    # pylint: disable = R0915
     def __init__(
             self,
             config_file: str,
@@ -350,6 +408,7 @@ class Application:
         self.app_data_file: str = app_data_file
         self.application_name: str = application_name
         self.download_filter = Filter()
+        self.batch_filter = BatchFilter(self.download_filter)
         self.is_running = True
 
         self.total_download_task = 0
@@ -384,6 +443,10 @@ class Application:
         self.after_upload_telegram_delete: bool = True
         self.web_login_secret: str = ""
         self.debug_web: bool = False
+        self.enable_web: bool = True
+        self.web_metrics_without_login: bool = False
+        self.max_completed_download: int = 1000
+        self.completed_download_ttl: int = 3600
         self.log_level: str = "INFO"
         self.start_timeout: int = 60
         self.allowed_user_ids: yaml.comments.CommentedSeq = yaml.comments.CommentedSeq(
@@ -391,6 +454,19 @@ class Application:
         )
         self.date_format: str = "%Y_%m"
         self.drop_no_audio_video: bool = False
+        self.enable_chunk_download: bool = False
+        self.chunk_download_min_size: int = 100 * 1024 * 1024
+        self.max_chunk_download_task: int = 4
+        self.max_scan_history_task: int = 1
+        self.scan_media_only: bool = False
+        self.state_store_type: str = "yaml"
+        self.state_store: Optional[StateStore] = None
+        self.file_num: int = 0
+        self.checkpoint_interval: int = 60
+        self.checkpoint_task_count: int = 100
+        self._state_dirty: bool = False
+        self._finish_task_since_checkpoint: int = 0
+        self._last_checkpoint_time: float = time.time()
 
         self.forward_limit_call = LimitCall(max_limit_call_times=33)
         self.loop = asyncio.new_event_loop()
@@ -399,8 +475,14 @@ class Application:
         self.executor = ThreadPoolExecutor(
             min(32, (os.cpu_count() or 0) + 4), thread_name_prefix="multi_task"
         )
+        self.max_media_process_task: int = 2
+        self.media_processor = MediaProcessor(
+            self.executor, self.max_media_process_task
+        )
+        self.max_upload_worker: int = 3
+        self.max_upload_pending_size: int = 10 * 1024 * 1024 * 1024
+        self.upload_queue = UploadQueue(self.max_upload_pending_size)
 
-    # pylint: disable = R0915
     def assign_config(self, _config: dict) -> bool:
         """assign config from str.
 
@@ -468,6 +550,47 @@ class Application:
                     "upload_adapter"
                 ]
 
+            self.cloud_drive_config.max_upload_task = get_config(
+                upload_drive_config,
+                "max_upload_task",
+                self.cloud_drive_config.max_upload_task,
+                int,
+            )
+
+            for key in ("rclone_transfers", "rclone_batch_size"):
+                setattr(
+                    self.cloud_drive_config,
+                    key,
+                    get_config(
+                        upload_drive_config,
+                        key,
+                        getattr(self.cloud_drive_config, key),
+                        int,
+                    ),
+                )
+
+            self.cloud_drive_config.rclone_ignore_existing = get_config(
+                upload_drive_config,
+                "rclone_ignore_existing",
+                self.cloud_drive_config.rclone_ignore_existing,
+                bool,
+            )
+
+            self.cloud_drive_config.zip_group = get_config(
+                upload_drive_config, "zip_group", self.cloud_drive_config.zip_group, str
+            )
+            self.cloud_drive_config.zip_group_timeout = get_config(
+                upload_drive_config,
+                "zip_group_timeout",
+                self.cloud_drive_config.zip_group_timeout,
+                float,
+            )
+
+            for key in ("rclone_batch_file_size", "zip_group_max_size"):
+                size = get_byte_from_str(str(upload_drive_config.get(key, "")))
+                if size is not None:
+                    setattr(self.cloud_drive_config, key, size)
+
         self.file_name_prefix_split = _config.get(
             "file_name_prefix_split", self.file_name_prefix_split
         )
@@ -484,6 +607,22 @@ class Application:
             "max_download_task", self.max_download_task
         )
 
+        self.max_media_process_task = get_config(
+            _config, "max_media_process_task", self.max_media_process_task, int
+        )
+        self.media_processor.max_task = self.max_media_process_task
+
+        self.max_upload_worker = get_config(
+            _config, "max_upload_worker", self.max_upload_worker, int
+        )
+
+        max_upload_pending_size = get_byte_from_str(
+            str(_config.get("max_upload_pending_size", ""))
+        )
+        if max_upload_pending_size is not None:
+            self.max_upload_pending_size = max_upload_pending_size
+        self.upload_queue.max_pending_size = self.max_upload_pending_size
+
         language = _config.get("language", "EN")
 
         try:
@@ -499,6 +638,16 @@ class Application:
             _config.get("web_login_secret", self.web_login_secret)
         )
         self.debug_web = _config.get("debug_web", self.debug_web)
+        self.enable_web = get_config(_config, "enable_web", self.enable_web, bool)
+        self.web_metrics_without_login = get_config(
+            _config, "web_metrics_without_login", self.web_metrics_without_login, bool
+        )
+        self.max_completed_download = get_config(
+            _config, "max_completed_download", self.max_completed_download, int
+        )
+        self.completed_download_ttl = get_config(
+            _config, "completed_download_ttl", self.completed_download_ttl, int
+        )
         self.log_level = _config.get("log_level", self.log_level)
 
         self.start_timeout = get_config(
@@ -523,6 +672,40 @@ class Application:
             _config, "drop_no_audio_video", self.drop_no_audio_video, bool
         )
 
+        self.enable_chunk_download = get_config(
+            _config, "enable_chunk_download", self.enable_chunk_download, bool
+        )
+
+        chunk_download_min_size = get_byte_from_str(
+            str(_config.get("chunk_download_min_size", ""))
+        )
+        if chunk_download_min_size is not None:
+            self.chunk_download_min_size = chunk_download_min_size
+
+        self.max_chunk_download_task = get_config(
+            _config, "max_chunk_download_task", self.max_chunk_download_task, int
+        )
+
+        self.max_scan_history_task = get_config(
+            _config, "max_scan_history_task", self.max_scan_history_task, int
+        )
+
+        self.scan_media_only = get_config(
+            _config, "scan_media_only", self.scan_media_only, bool
+        )
+
+        self.state_store_type = get_config(
+            _config, "state_store", self.state_store_type, str
+        )
+
+        self.checkpoint_interval = get_config(
+            _config, "checkpoint_interval", self.checkpoint_interval, int
+        )
+
+        self.checkpoint_task_count = get_config(
+            _config, "checkpoint_task_count", self.checkpoint_task_count, int
+        )
+
         try:
             date = datetime(2023, 10, 31)
             date.strftime(self.date_format)
@@ -596,6 +779,11 @@ class Application:
             self.chat_download_config[key].download_filter = replace_date_time(
                 value.download_filter
             )
+            if value.download_filter:
+                try:
+                    self.download_filter.compile(value.download_filter)
+                except ValueError as e:
+                    raise ValueError(f"download_filter of {key} error: {e}") from e
 
         return True
 
@@ -639,26 +827,42 @@ class Application:
                             ] = True
         return True
 
-    async def upload_file(self, local_file_path: str) -> bool:
-        """Upload file"""
-
-        if not self.cloud_drive_config.enable_upload_file:
-            return False
+    async def upload_file(
+        self,
+        local_file_path: str,
+        progress: Callable = None,
+        progress_args: tuple = (),
+    ) -> bool:
+        """Upload file to the cloud drive, blocking uploads run in `executor`,
+        see `CloudDrive.upload_file`"""
+        return await CloudDrive.upload_file(
+            self.cloud_drive_config,
+            self.save_path,
+            local_file_path,
+            self.executor,
+            progress,
+            progress_args,
+        )
 
-        ret: bool = False
-        if self.cloud_drive_config.upload_adapter == "rclone":
-            ret = await CloudDrive.rclone_upload_file(
-                self.cloud_drive_config, self.save_path, local_file_path
-            )
-        elif self.cloud_drive_config.upload_adapter == "aligo":
-            ret = await self.loop.run_in_executor(
-                self.executor,
-                CloudDrive.aligo_upload_file(
-                    self.cloud_drive_config, self.save_path, local_file_path
-                ),
-            )
+    def add_rclone_batch_file(self, local_file_path: str) -> Optional[asyncio.Future]:
+        """Add the file to a batch job of the rclone rcd,
+        see `CloudDrive.add_rclone_batch_file`"""
+        return CloudDrive.add_rclone_batch_file(
+            self.cloud_drive_config, self.save_path, local_file_path, self.executor
+        )
 
-        return ret
+    def add_zip_group_file(
+        self, local_file_path: str, media_group_id: Optional[str] = None
+    ) -> Optional[asyncio.Future]:
+        """Add the file to its zip group of the cloud drive,
+        see `CloudDrive.add_zip_group_file`"""
+        return CloudDrive.add_zip_group_file(
+            self.cloud_drive_config,
+            self.save_path,
+            local_file_path,
+            media_group_id,
+            self.executor,
+        )
 
     def get_file_save_path(
             self, media_type: str, chat_title: str, media_datetime: str
@@ -769,11 +973,31 @@ class Application:
             bool: The result of executing the filter.
         """
         if download_config.download_filter:
-            self.download_filter.set_meta_data(meta_data)
-            return self.download_filter.exec(download_config.download_filter)
+            with FILTER_SECONDS.time(mode="row"):
+                self.download_filter.set_meta_data(meta_data)
+                return self.download_filter.exec(download_config.download_filter)
 
         return True
 
+    def exec_filter_batch(
+        self, download_config: ChatDownloadConfig, metas: List[MetaData]
+    ) -> List[bool]:
+        """
+        Executes the filter on a page of meta data at once.
+
+        Args:
+            download_config (ChatDownloadConfig): The download configuration object.
+            metas (List[MetaData]): The meta data objects.
+
+        Returns:
+            List[bool]: The result of executing the filter on each meta data.
+        """
+        if download_config.download_filter:
+            with FILTER_SECONDS.time(mode="batch"):
+                return self.batch_filter.exec(download_config.download_filter, metas)
+
+        return [True] * len(metas)
+
     # pylint: disable = R0912
     def update_config(self, immediate: bool = True):
         """update config
@@ -800,8 +1024,13 @@ class Application:
                 ):
                     unfinished_ids.remove(it)
 
+            # ids above the watermark are scanned again on the next run
             for _idx, _value in value.node.download_status.items():
-                if DownloadStatus.SuccessDownload != _value:
+                if (
+                    _value
+                    not in (DownloadStatus.SuccessDownload, DownloadStatus.SkipDownload)
+                    and _idx <= value.last_read_message_id
+                ):
                     unfinished_ids.add(_idx)
 
             self.chat_download_config[key].ids_to_retry = list(unfinished_ids)
@@ -815,7 +1044,15 @@ class Application:
                 )
 
             self.app_data["chat"][idx]["chat_id"] = key
-            self.app_data["chat"][idx]["ids_to_retry"] = value.ids_to_retry
+            if self.state_store:
+                self.state_store.set_retry_ids(key, value.ids_to_retry)
+                # the unfinished ones up to the watermark are in ids_to_retry now
+                self.state_store.prune_message_status(
+                    key, value.last_read_message_id
+                )
+                self.app_data["chat"][idx].pop("ids_to_retry", None)
+            else:
+                self.app_data["chat"][idx]["ids_to_retry"] = value.ids_to_retry
             idx += 1
 
         self.config["save_path"] = self.save_path
@@ -843,12 +1080,11 @@ class Application:
         # self.app_data["already_download_ids"] = list(self.already_download_ids_set)
 
         if immediate:
-            with open(self.config_file, "w", encoding="utf-8") as yaml_file:
-                _yaml.dump(self.config, yaml_file)
+            _dump_yaml(self.config, self.config_file)
+            _dump_yaml(self.app_data, self.app_data_file)
 
-        if immediate:
-            with open(self.app_data_file, "w", encoding="utf-8") as yaml_file:
-                _yaml.dump(self.app_data, yaml_file)
+        if self.state_store:
+            self.state_store.commit()
 
     def set_language(self, language: Language):
         """Set Language"""
@@ -875,6 +1111,42 @@ class Application:
                     self.app_data = app_data
                     self.assign_app_data(self.app_data)
 
+        if self.state_store_type == "sqlite":
+            self.load_state_store()
+
+    def load_state_store(self):
+        """Open the sqlite state store and load the download state from it,
+        `ids_to_retry` of data.yaml is imported on the first run"""
+        db_file = (
+            os.path.splitext(os.path.join(os.path.abspath("."), self.app_data_file))[0]
+            + ".db"
+        )
+        self.state_store = StateStore(db_file)
+        if self.state_store.migrate_app_data(self.app_data, self._chat_id or None):
+            logger.info(f"migrate {self.app_data_file} to {db_file}")
+
+        for chat_id, value in self.chat_download_config.items():
+            # messages finished without success since the last shutdown
+            # are kept in message_status only
+            ids_to_retry = set(value.ids_to_retry)
+            ids_to_retry.update(
+                self.state_store.get_unfinished_message_ids(
+                    chat_id,
+                    (
+                        DownloadStatus.SuccessDownload.value,
+                        DownloadStatus.SkipDownload.value,
+                    ),
+                )
+            )
+            value.ids_to_retry = sorted(ids_to_retry)
+            value.ids_to_retry_dict = {it: True for it in value.ids_to_retry}
+
+            last_read_message_id = self.state_store.get_last_read_message_id(chat_id)
+            if last_read_message_id is not None:
+                value.last_read_message_id = max(
+                    value.last_read_message_id, last_read_message_id + 1
+                )
+
     def pre_run(self):
         """before run application do"""
         self.cloud_drive_config.pre_run()
@@ -937,7 +1209,66 @@ class Application:
             return
 
         self.chat_download_config[node.chat_id].finish_task += 1
+        self._state_dirty = True
+        self._finish_task_since_checkpoint += 1
+
+        watermark = self.chat_download_config[node.chat_id].watermark
+        watermark.done(message_id)
+        self.chat_download_config[node.chat_id].last_read_message_id = watermark.value()
+
+        if self.state_store:
+            self.state_store.set_message_status(
+                node.chat_id, message_id, download_status.value
+            )
+            self.state_store.set_last_read_message_id(
+                node.chat_id,
+                self.chat_download_config[node.chat_id].last_read_message_id,
+            )
+
+    def set_download_pending(self, node: TaskNode, message_id: int):
+        """A message of a configured chat is queued for download"""
+        if node.chat_id in self.chat_download_config:
+            self.chat_download_config[node.chat_id].watermark.add(message_id)
+
+    def set_download_skip(self, node: TaskNode, message_id: int):
+        """A message of a configured chat is scanned but not queued"""
+        if node.chat_id in self.chat_download_config:
+            self.chat_download_config[node.chat_id].watermark.done(message_id)
 
-        self.chat_download_config[node.chat_id].last_read_message_id = max(
-            self.chat_download_config[node.chat_id].last_read_message_id, message_id
+    def need_checkpoint(self) -> bool:
+        """If the download state changed and enough time or tasks passed"""
+        if not self._state_dirty:
+            return False
+
+        if (
+            self.checkpoint_task_count > 0
+            and self._finish_task_since_checkpoint >= self.checkpoint_task_count
+        ):
+            return True
+
+        return (
+            self.checkpoint_interval > 0
+            and time.time() - self._last_checkpoint_time >= self.checkpoint_interval
         )
+
+    def save_checkpoint(self):
+        """Save the download state, the next start resumes from here"""
+        self._state_dirty = False
+        self._finish_task_since_checkpoint = 0
+        self._last_checkpoint_time = time.time()
+        try:
+            self.update_config()
+        except Exception as e:
+            logger.warning(f"save checkpoint error: {e}")
+
+    async def checkpoint(self):
+        """Save the download state in background while running"""
+        while self.is_running:
+            if self.need_checkpoint():
+                self.save_checkpoint()
+            await asyncio.sleep(1)
+
+    def set_upload_file(self, node: TaskNode, message_id: int, file_name: str):
+        """Record a file uploaded to the cloud drive"""
+        if self.state_store:
+            self.state_store.add_uploaded_file(node.chat_id, message_id, file_name)
@@ -0,0 +1,270 @@
+"""Evaluate a download filter over a page of messages at once"""
+
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from module.filter import Filter
+from utils.meta_data import MetaData, ReString
+
+# column kind of each `MetaData` attribute used by filters
+_ATTR_KINDS = {
+    "message_id": "int",
+    "media_file_size": "int",
+    "media_width": "int",
+    "media_height": "int",
+    "media_duration": "int",
+    "sender_id": "int",
+    "reply_to_message_id": "int",
+    "message_date": "datetime",
+    "message_caption": "str",
+    "media_file_name": "str",
+    "media_type": "str",
+    "file_extension": "str",
+    "sender_name": "str",
+}
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _import_numpy():
+    """numpy is optional, without it every message is filtered one by one"""
+    try:
+        # pylint: disable = C0415
+        import numpy
+
+        return numpy
+    except ImportError:
+        return None
+
+
+class _Unsupported(Exception):
+    """The filter or the page can not be evaluated as columns"""
+
+
+def _value_kind(value: Any) -> str:
+    """Column kind of a constant"""
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, int):
+        return "int"
+    if isinstance(value, str):
+        return "str"
+    if isinstance(value, datetime):
+        return "datetime"
+    if isinstance(value, ReString):
+        return "re"
+    raise _Unsupported()
+
+
+def _has_name(node: tuple) -> bool:
+    """If an AST node reads meta data"""
+    if node[0] == "name":
+        return True
+    if node[0] == "const":
+        return False
+    return any(_has_name(it) for it in node[1:] if isinstance(it, tuple))
+
+
+class _Columns:
+    """Columns of a page of `MetaData`, each one is built on first use"""
+
+    def __init__(self, np, metas: List[MetaData]):
+        self.np = np
+        self.metas = metas
+        self.size = len(metas)
+        self._columns: Dict[str, Tuple[Any, Any]] = {}
+
+    def get(self, attr: str) -> Tuple[Any, Any]:
+        """`(values, valid)` of an attribute, `valid` is False for None"""
+        if attr in self._columns:
+            return self._columns[attr]
+
+        np = self.np
+        kind = _ATTR_KINDS[attr]
+        values = [getattr(meta, attr) for meta in self.metas]
+        valid = np.fromiter((it is not None for it in values), bool, self.size)
+
+        if kind == "int":
+            if any(
+                it is not None and (isinstance(it, bool) or not isinstance(it, int))
+                for it in values
+            ):
+                raise _Unsupported()
+            column = np.array(
+                [0 if it is None else it for it in values], dtype=np.int64
+            )
+        elif kind == "datetime":
+            if any(
+                it is not None and (not isinstance(it, datetime) or it.tzinfo)
+                for it in values
+            ):
+                raise _Unsupported()
+            column = np.array(
+                [_EPOCH if it is None else it for it in values],
+                dtype="datetime64[us]",
+            )
+        else:
+            if any(it is not None and not isinstance(it, str) for it in values):
+                raise _Unsupported()
+            column = np.array(["" if it is None else it for it in values], dtype=object)
+
+        self._columns[attr] = (column, valid)
+        return column, valid
+
+
+# (kind, `(columns) -> (values, valid)`)
+_BatchNode = Tuple[str, Callable[[_Columns], Tuple[Any, Any]]]
+
+
+class BatchFilter:
+    """Evaluate a filter str over many `MetaData` with numpy columns.
+
+    Comparisons of meta data with constants or with each other, regex matches
+    and `and`/`or` of them are vectorized. Any other filter, a page with an
+    unexpected value type, or a missing numpy falls back to `Filter.exec` on
+    every message, so the result and the errors are always the same.
+    """
+
+    def __init__(self, download_filter: Filter, cache_size: int = 128):
+        """
+        Parameters
+        ----------
+        download_filter: Filter
+            Filter used to parse the filter str and for the fallback
+
+        cache_size: int
+            How many compiled filter strs are cached
+        """
+        self.filter = download_filter
+        self.compile = lru_cache(maxsize=cache_size)(self._compile)
+
+    def exec(self, filter_str: str, metas: List[MetaData]) -> List[bool]:
+        """Exec filter str on every meta data
+
+        Returns
+        -------
+        List[bool]
+            If each meta data matches the filter
+        """
+        if not metas:
+            return []
+
+        np = _import_numpy()
+        batch_filter = self.compile(filter_str) if np else None
+        if batch_filter:
+            try:
+                return batch_filter(_Columns(np, metas)).tolist()
+            except _Unsupported:
+                pass
+
+        res = []
+        for meta in metas:
+            self.filter.set_meta_data(meta)
+            res.append(self.filter.exec(filter_str))
+        return res
+
+    def _compile(self, filter_str: str) -> Optional[Callable[[_Columns], Any]]:
+        """Compile filter str into `(columns) -> bool array`, None if unsupported"""
+        node = self.filter.filter.parse(filter_str)
+        try:
+            kind, batch_node = self._compile_node(node)
+        except _Unsupported:
+            return None
+
+        if kind != "bool":
+            return None
+
+        def _exec(columns: _Columns):
+            values, _ = batch_node(columns)
+            return columns.np.broadcast_to(values, (columns.size,))
+
+        return _exec
+
+    def _compile_node(self, node: tuple) -> _BatchNode:
+        """Compile an AST node, raise `_Unsupported` if it can not be vectorized"""
+        kind = node[0]
+        if not _has_name(node):
+            try:
+                value = self.filter.filter.compile_node(node)(None)
+            except Exception as e:
+                raise _Unsupported() from e
+            return _value_kind(value), lambda columns: (value, True)
+
+        if kind == "name":
+            attr = node[2]
+            return _ATTR_KINDS[attr], lambda columns: columns.get(attr)
+
+        if kind in ("and", "or"):
+            left_kind, left = self._compile_node(node[1])
+            right_kind, right = self._compile_node(node[2])
+            if left_kind != "bool" or right_kind != "bool":
+                raise _Unsupported()
+
+            if kind == "and":
+                return "bool", lambda columns: (
+                    left(columns)[0] & right(columns)[0],
+                    True,
+                )
+            return "bool", lambda columns: (
+                left(columns)[0] | right(columns)[0],
+                True,
+            )
+
+        if kind in ("cmp", "eq"):
+            return self._compile_compare(node)
+
+        # arithmetic of meta data
+        raise _Unsupported()
+
+    def _compile_compare(self, node: tuple) -> _BatchNode:
+        """`> < >= <= == !=`, a None value never matches"""
+        kind, op = node[0], node[1]
+        left_kind, left = self._compile_node(node[2])
+        right_kind, right = self._compile_node(node[3])
+
+        if kind == "eq" and "re" in (left_kind, right_kind):
+            if right_kind == "re":
+                left_kind, left, right_kind, right = right_kind, right, left_kind, left
+            if right_kind != "str":
+                raise _Unsupported()
+            is_eq = op != "!="
+
+            def _match(columns: _Columns):
+                pattern: ReString = left(columns)[0]
+                values, valid = right(columns)
+                matched = columns.np.fromiter(
+                    (pattern.pattern.fullmatch(it) is not None for it in values),
+                    bool,
+                    columns.size,
+                )
+                return (matched == is_eq) & valid, True
+
+            return "bool", _match
+
+        if left_kind != right_kind or left_kind not in ("int", "str", "datetime"):
+            raise _Unsupported()
+
+        def _compare(columns: _Columns):
+            np = columns.np
+            left_values, left_valid = left(columns)
+            right_values, right_valid = right(columns)
+            if left_kind == "datetime":
+                left_values = np.asarray(left_values, dtype="datetime64[us]")
+                right_values = np.asarray(right_values, dtype="datetime64[us]")
+
+            if op == ">":
+                res = left_values > right_values
+            elif op == "<":
+                res = left_values < right_values
+            elif op == ">=":
+                res = left_values >= right_values
+            elif op == "<=":
+                res = left_values <= right_values
+            elif op == "!=":
+                res = left_values != right_values
+            else:
+                res = left_values == right_values
+            return np.asarray(res, dtype=bool) & left_valid & right_valid, True
+
+        return "bool", _compare
@@ -0,0 +1,421 @@
+"""Parallel chunked download for large media"""
+
+import asyncio
+import base64
+import json
+import os
+import time
+from collections import deque
+from typing import Callable, Deque, List, Optional, Tuple, Union
+
+import pyrogram
+from loguru import logger
+from pyrogram.file_id import FileId
+
+# `upload.GetFile` part size, pyrogram's `get_file` offset is counted in parts
+CHUNK_SIZE = 1024 * 1024
+# How many parts one worker fetches before taking the next segment
+SEGMENT_PARTS = 8
+# Min seconds between two saves of the chunk map while downloading
+CHUNK_MAP_SAVE_INTERVAL = 5
+
+
+def split_segments(
+    file_size: int, segment_parts: int = SEGMENT_PARTS
+) -> List[Tuple[int, int]]:
+    """Split a file into segments
+
+    Parameters
+    ----------
+    file_size: int
+        Total size of the file in bytes
+
+    segment_parts: int
+        Max number of `CHUNK_SIZE` parts in a segment
+
+    Returns
+    -------
+    List[Tuple[int, int]]
+        `(first_part, part_count)` of each segment
+    """
+    total_parts = (file_size + CHUNK_SIZE - 1) // CHUNK_SIZE
+    return [
+        (first_part, min(segment_parts, total_parts - first_part))
+        for first_part in range(0, total_parts, segment_parts)
+    ]
+
+
+def group_segments(
+    parts: List[int], segment_parts: int = SEGMENT_PARTS
+) -> List[Tuple[int, int]]:
+    """Group sorted part indexes into runs of consecutive parts
+
+    Parameters
+    ----------
+    parts: List[int]
+        Sorted part indexes
+
+    segment_parts: int
+        Max number of `CHUNK_SIZE` parts in a segment
+
+    Returns
+    -------
+    List[Tuple[int, int]]
+        `(first_part, part_count)` of each segment
+    """
+    segments: List[Tuple[int, int]] = []
+    for part in parts:
+        if segments:
+            first_part, part_count = segments[-1]
+            if first_part + part_count == part and part_count < segment_parts:
+                segments[-1] = (first_part, part_count + 1)
+                continue
+        segments.append((part, 1))
+    return segments
+
+
+class ChunkMap:
+    """Bitmap of the completed parts of a temp file, saved next to it"""
+
+    def __init__(self, path: str, key: tuple, file_size: int):
+        """
+        Parameters
+        ----------
+        path: str
+            Sidecar file path
+
+        key: tuple
+            `(chat_id, message_id, file_unique_id)` of the media
+
+        file_size: int
+            Total size of the file in bytes
+        """
+        self.path = path
+        self.key = [str(it) for it in key]
+        self.file_size = file_size
+        self.part_count = (file_size + CHUNK_SIZE - 1) // CHUNK_SIZE
+        self.bitmap = bytearray((self.part_count + 7) // 8)
+
+    def load(self) -> bool:
+        """Load the bitmap, False if missing or saved for another file"""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+
+            if (
+                data["key"] != self.key
+                or data["file_size"] != self.file_size
+                or data["part_size"] != CHUNK_SIZE
+            ):
+                return False
+
+            bitmap = bytearray(base64.b64decode(data["bitmap"]))
+            if len(bitmap) != len(self.bitmap):
+                return False
+
+            self.bitmap = bitmap
+            return True
+        except Exception:
+            return False
+
+    def save(self, data_file: str = None):
+        """Write the bitmap with an atomic rename
+
+        Parameters
+        ----------
+        data_file: str
+            The temp file of the parts, synced to the disk before the map, so
+            that the saved map survives a power loss as well
+        """
+        bitmap = base64.b64encode(self.bitmap).decode()
+        if data_file:
+            with open(data_file, "r+b") as f:
+                os.fsync(f.fileno())
+
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "key": self.key,
+                    "file_size": self.file_size,
+                    "part_size": CHUNK_SIZE,
+                    "bitmap": bitmap,
+                },
+                f,
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+
+    def remove(self):
+        """Remove the sidecar file"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def set_done(self, part: int):
+        """Mark a part as completed"""
+        self.bitmap[part >> 3] |= 1 << (part & 7)
+
+    def is_done(self, part: int) -> bool:
+        """If a part is completed"""
+        return bool(self.bitmap[part >> 3] & (1 << (part & 7)))
+
+    def missing_parts(self) -> List[int]:
+        """Parts that still need to be downloaded"""
+        return [part for part in range(self.part_count) if not self.is_done(part)]
+
+    def done_size(self) -> int:
+        """Bytes already downloaded"""
+        size = 0
+        for part in range(self.part_count):
+            if self.is_done(part):
+                size += min(CHUNK_SIZE, self.file_size - part * CHUNK_SIZE)
+        return size
+
+
+# pylint: disable = R0902
+class ChunkDownloader:
+    """Download one file with several concurrent `upload.GetFile` streams"""
+
+    # pylint: disable = R0913
+    def __init__(
+        self,
+        client: pyrogram.Client,
+        file_id: str,
+        file_size: int,
+        file_name: str,
+        max_task: int = 4,
+        progress: Callable = None,
+        progress_args: tuple = (),
+        resume_key: tuple = None,
+    ):
+        self.client = client
+        self.file_id = FileId.decode(file_id)
+        self.file_size = file_size
+        self.file_name = file_name
+        self.temp_file_name = file_name + ".temp"
+        self.chunk_map: Optional[ChunkMap] = None
+        if resume_key:
+            # file_name may change between runs, the resume data must not
+            self.temp_file_name = os.path.join(
+                os.path.dirname(file_name),
+                "_".join(str(it) for it in resume_key) + ".temp",
+            )
+            self.chunk_map = ChunkMap(
+                self.temp_file_name + ".chunk", resume_key, file_size
+            )
+        self.max_task = max(max_task, 1)
+        self.progress = progress
+        self.progress_args = progress_args
+        self.down_byte = 0
+        self.segments: Deque[Tuple[int, int]] = deque()
+        self._last_save_time: float = 0
+        self._save_future: Optional[asyncio.Future] = None
+
+    def _prepare_file(self) -> List[int]:
+        """Preallocate the temp file so every part can be written in place
+
+        Returns
+        -------
+        List[int]
+            Parts that need to be downloaded
+        """
+        directory = os.path.dirname(self.temp_file_name)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        if (
+            self.chunk_map
+            and os.path.exists(self.temp_file_name)
+            and os.path.getsize(self.temp_file_name) == self.file_size
+            and self.chunk_map.load()
+        ):
+            self.down_byte = self.chunk_map.done_size()
+            return self.chunk_map.missing_parts()
+
+        with open(self.temp_file_name, "wb") as f:
+            f.truncate(self.file_size)
+
+        if self.chunk_map:
+            self.chunk_map.save()
+
+        return list(range((self.file_size + CHUNK_SIZE - 1) // CHUNK_SIZE))
+
+    def _remove_temp_file(self):
+        """Remove the temp file and its chunk map"""
+        if os.path.exists(self.temp_file_name):
+            os.remove(self.temp_file_name)
+        if self.chunk_map:
+            self.chunk_map.remove()
+
+    def _save_chunk_map_later(self):
+        """Save the chunk map in the executor, at most once per
+        `CHUNK_MAP_SAVE_INTERVAL` seconds"""
+        if self._save_future and not self._save_future.done():
+            return
+        cur_time = time.monotonic()
+        if cur_time - self._last_save_time < CHUNK_MAP_SAVE_INTERVAL:
+            return
+        self._last_save_time = cur_time
+        self._save_future = asyncio.get_running_loop().run_in_executor(
+            None, self.chunk_map.save, self.temp_file_name  # type: ignore
+        )
+
+    async def _wait_chunk_map_saved(self):
+        """Wait for the save in the executor, if any"""
+        if not self._save_future:
+            return
+        try:
+            await self._save_future
+        except Exception as e:
+            logger.warning(f"Failed to save chunk map {self.chunk_map.path}: {e}")
+        self._save_future = None
+
+    def _segment_size(self, first_part: int, part_count: int) -> int:
+        """Expected bytes of a segment, the last one may be shorter"""
+        offset = first_part * CHUNK_SIZE
+        return min(part_count * CHUNK_SIZE, self.file_size - offset)
+
+    async def _report_progress(self, size: int):
+        """Aggregate the progress of all workers"""
+        self.down_byte += size
+        if self.progress:
+            await self.progress(self.down_byte, self.file_size, *self.progress_args)
+
+    async def _download_segment(self, f, first_part: int, part_count: int):
+        """Download one segment and write it at its own offset"""
+        offset = first_part * CHUNK_SIZE
+        received = 0
+        async for chunk in self.client.get_file(
+            self.file_id, self.file_size, part_count, first_part
+        ):
+            f.seek(offset + received)
+            f.write(chunk)
+            received += len(chunk)
+            if self.chunk_map and (
+                len(chunk) == CHUNK_SIZE or offset + received == self.file_size
+            ):
+                # the part must reach the file before the map says it is done
+                f.flush()
+                self.chunk_map.set_done((offset + received - 1) // CHUNK_SIZE)
+                self._save_chunk_map_later()
+            await self._report_progress(len(chunk))
+
+        if received != self._segment_size(first_part, part_count):
+            # get_file logs and swallows errors such as an expired file reference,
+            # so a short segment is reported the same way as a wrong size file.
+            raise pyrogram.errors.exceptions.bad_request_400.BadRequest()
+
+    async def _worker(self):
+        """Take segments until all of them are downloaded"""
+        with open(self.temp_file_name, "r+b") as f:
+            while self.segments:
+                first_part, part_count = self.segments.popleft()
+                await self._download_segment(f, first_part, part_count)
+
+    async def download(self) -> Optional[str]:
+        """Download the file
+
+        Returns
+        -------
+        Optional[str]
+            The downloaded file path, None if the transmission is stopped
+        """
+        self.segments.extend(group_segments(self._prepare_file()))
+
+        tasks = [
+            asyncio.create_task(self._worker())
+            for _ in range(min(self.max_task, len(self.segments)))
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException as e:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self._wait_chunk_map_saved()
+
+            if isinstance(e, pyrogram.StopTransmission):
+                self._remove_temp_file()
+                return None
+
+            # keep the completed parts for the next retry or run
+            if not self.chunk_map:
+                self._remove_temp_file()
+            else:
+                try:
+                    self.chunk_map.save(self.temp_file_name)
+                except Exception as save_error:
+                    logger.warning(
+                        f"Failed to save chunk map {self.chunk_map.path}: {save_error}"
+                    )
+            raise e
+
+        await self._wait_chunk_map_saved()
+        os.replace(self.temp_file_name, self.file_name)
+        if self.chunk_map:
+            self.chunk_map.remove()
+        return self.file_name
+
+
+async def download_media_parallel(
+    client: pyrogram.Client,
+    media_obj,
+    file_name: str,
+    max_task: int = 4,
+    progress: Callable = None,
+    progress_args: tuple = (),
+    chat_id: Union[int, str] = None,
+    message_id: int = None,
+) -> Optional[str]:
+    """Download a media object with several concurrent chunk requests
+
+    When `chat_id` and `message_id` are given the completed parts are kept in a
+    chunk map next to the temp file, a retry or a restart resumes from them.
+
+    Parameters
+    ----------
+    client: pyrogram.Client
+        Client to interact with Telegram APIs.
+
+    media_obj: Union[Audio, Document, Photo, Video, VideoNote, Voice]
+        Media object to be downloaded, must have `file_id` and `file_size`
+
+    file_name: str
+        Where to save the file
+
+    max_task: int
+        Max concurrent chunk requests of this file
+
+    progress: Callable
+        Same as `pyrogram.Client.download_media`
+
+    progress_args: tuple
+        Same as `pyrogram.Client.download_media`
+
+    chat_id: Union[int, str]
+        Chat of the message, used as the resume key
+
+    message_id: int
+        Message id, used as the resume key
+
+    Returns
+    -------
+    Optional[str]
+        The downloaded file path, None if the transmission is stopped
+    """
+    resume_key = None
+    if chat_id is not None and message_id is not None:
+        resume_key = (chat_id, message_id, media_obj.file_unique_id)
+
+    downloader = ChunkDownloader(
+        client,
+        media_obj.file_id,
+        media_obj.file_size,
+        file_name,
+        max_task,
+        progress,
+        progress_args,
+        resume_key,
+    )
+    return await downloader.download()
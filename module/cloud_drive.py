@@ -1,17 +1,23 @@
 """provide upload cloud drive"""
 import asyncio
 import importlib
+import inspect
 import os
+import re
+import threading
 from asyncio import subprocess
-from subprocess import Popen
-from zipfile import ZipFile
+from concurrent.futures import Executor
+from typing import Callable, Dict, List, Optional
 
 from loguru import logger
 
+from module import metrics
+from module.rclone_rcd import RcloneRcd
+from module.zip_archive import ZipStream, write_zip
 from utils import platform
 
 
-# pylint: disable = R0902
+# pylint: disable = R0902,R0913,R0914
 class CloudDriveConfig:
     """Rclone Config"""
 
@@ -25,6 +31,14 @@ class CloudDriveConfig:
         ),
         remote_dir: str = "",
         upload_adapter: str = "rclone",
+        max_upload_task: int = 2,
+        rclone_transfers: int = 4,
+        rclone_batch_size: int = 20,
+        rclone_batch_file_size: int = 10 * 1024 * 1024,
+        zip_group: str = "",
+        zip_group_timeout: float = 30,
+        zip_group_max_size: int = 1024 * 1024 * 1024,
+        rclone_ignore_existing: bool = True,
     ):
         self.enable_upload_file = enable_upload_file
         self.before_upload_file_zip = before_upload_file_zip
@@ -32,9 +46,57 @@ class CloudDriveConfig:
         self.rclone_path = rclone_path
         self.remote_dir = remote_dir
         self.upload_adapter = upload_adapter
+        self.max_upload_task = max_upload_task
+        # skip the remote files of the same name even if they differ
+        self.rclone_ignore_existing = rclone_ignore_existing
+        # for the rclone_rcd adapter
+        self.rclone_transfers = rclone_transfers
+        self.rclone_batch_size = rclone_batch_size
+        self.rclone_batch_file_size = rclone_batch_file_size
+        self.rclone_rcd: Optional[RcloneRcd] = None
+        # `media_group` or `folder`, files of a group are uploaded in one zip
+        self.zip_group = zip_group
+        self.zip_group_timeout = zip_group_timeout
+        self.zip_group_max_size = zip_group_max_size
+        self.zip_groups: Dict[str, ZipGroup] = {}
+        self.zip_group_tasks: set = set()
         self.dir_cache: dict = {}  # for remote mkdir
+        # aligo uploads run in threads and share the dir cache
+        self.dir_cache_lock = threading.Lock()
         self.total_upload_success_file_count = 0
         self.aligo = None
+        self._upload_semaphore: Optional[asyncio.Semaphore] = None
+
+    @property
+    def upload_semaphore(self) -> asyncio.Semaphore:
+        """Bound of the uploads run at once"""
+        if not self._upload_semaphore:
+            self._upload_semaphore = asyncio.Semaphore(max(self.max_upload_task, 1))
+        return self._upload_semaphore
+
+    def get_rclone_rcd(self, executor: Executor = None) -> RcloneRcd:
+        """The rclone rcd shared by the uploads, started on the first upload"""
+        if not self.rclone_rcd:
+            self.rclone_rcd = RcloneRcd(
+                self.rclone_path,
+                self.rclone_transfers,
+                self.rclone_batch_size,
+                self.rclone_batch_file_size,
+                executor,
+                self.rclone_ignore_existing,
+            )
+        return self.rclone_rcd
+
+    def has_zip_groups(self) -> bool:
+        """If any zip group is gathering files or uploading"""
+        return bool(self.zip_groups or self.zip_group_tasks)
+
+    async def stop(self):
+        """Upload the pending zip groups and stop the rclone rcd if it was
+        started"""
+        await CloudDrive.flush_zip_groups(self)
+        if self.rclone_rcd:
+            await self.rclone_rcd.stop()
 
     def pre_run(self):
         """pre run init aligo"""
@@ -42,6 +104,38 @@ class CloudDriveConfig:
             CloudDrive.init_upload_adapter(self)
 
 
+# rclone `--progress` line of the transferred bytes
+_RCLONE_PROGRESS_RE = re.compile(
+    r"Transferred:\s+[\d.]+\s*\w*B\s*/\s*[\d.]+\s*\w*B,\s*(\d+)%"
+)
+
+
+async def _call_progress(
+    progress: Optional[Callable], current: int, total: int, progress_args: tuple
+):
+    """Call an upload progress callback like the pyrogram one,
+    `progress(current, total, *progress_args)`, it can be a coroutine function"""
+    if not progress:
+        return
+    res = progress(current, total, *progress_args)
+    if inspect.isawaitable(res):
+        await res
+
+
+class ZipGroup:
+    """Files waiting to be uploaded in one zip archive"""
+
+    def __init__(self, save_path: str, name: str, executor: Executor = None):
+        self.save_path = save_path
+        self.name = name
+        self.executor = executor
+        self.file_paths: List[str] = []
+        self.size: int = 0
+        # result of the group upload
+        self.done: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
 class CloudDrive:
     """rclone support"""
 
@@ -53,15 +147,26 @@ class CloudDrive:
             drive_config.aligo = Aligo()
 
     @staticmethod
-    def rclone_mkdir(drive_config: CloudDriveConfig, remote_dir: str):
+    def get_remote_dir(
+        drive_config: CloudDriveConfig, save_path: str, local_file_path: str
+    ) -> str:
+        """Remote dir of a local file, the same layout as under `save_path`"""
+        return (
+            drive_config.remote_dir
+            + "/"
+            + os.path.dirname(local_file_path).replace(save_path, "")
+            + "/"
+        ).replace("\\", "/")
+
+    @staticmethod
+    async def rclone_mkdir(drive_config: CloudDriveConfig, remote_dir: str):
         """mkdir in remote"""
-        with Popen(
+        proc = await asyncio.create_subprocess_shell(
             f'"{drive_config.rclone_path}" mkdir "{remote_dir}/"',
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-        ):
-            pass
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        await proc.wait()
 
     @staticmethod
     def aligo_mkdir(drive_config: CloudDriveConfig, remote_dir: str):
@@ -69,6 +174,19 @@ class CloudDrive:
         if drive_config.aligo and not drive_config.aligo.get_folder_by_path(remote_dir):
             drive_config.aligo.create_folder(name=remote_dir, check_name_mode="refuse")
 
+    @staticmethod
+    def aligo_get_dir_id(drive_config: CloudDriveConfig, remote_dir: str) -> str:
+        """File id of the remote dir, created if not exist, cached after the
+        first lookup"""
+        with drive_config.dir_cache_lock:
+            if not drive_config.dir_cache.get(remote_dir):
+                CloudDrive.aligo_mkdir(drive_config, remote_dir)
+                aligo_dir = drive_config.aligo.get_folder_by_path(remote_dir)
+                if not aligo_dir:
+                    raise ValueError(f"aligo remote dir {remote_dir} not found")
+                drive_config.dir_cache[remote_dir] = aligo_dir.file_id
+            return drive_config.dir_cache[remote_dir]
+
     @staticmethod
     def zip_file(local_file_path: str) -> str:
         """
@@ -78,87 +196,211 @@ class CloudDrive:
         file_path_without_extension = os.path.splitext(local_file_path)[0]
         zip_file_name = file_path_without_extension + ".zip"
 
-        with ZipFile(zip_file_name, "w") as zip_writer:
-            zip_writer.write(local_file_path)
+        write_zip(zip_file_name, [local_file_path])
 
         return zip_file_name
 
+    @staticmethod
+    async def zip_file_in_executor(
+        local_file_path: str, executor: Executor = None
+    ) -> str:
+        """`zip_file` in `executor`, the event loop keeps running"""
+        return await asyncio.get_running_loop().run_in_executor(
+            executor, CloudDrive.zip_file, local_file_path
+        )
+
+    @staticmethod
+    async def rclone_rcat_zip(
+        drive_config: CloudDriveConfig,
+        file_paths: List[str],
+        remote_path: str,
+        executor: Executor = None,
+        progress: Callable = None,
+        progress_args: tuple = (),
+        flat: bool = False,
+    ) -> bool:
+        """Stream a zip archive of the files into `rclone rcat`, the archive is
+        built in `executor` and never written to the local disk
+
+        Returns
+        -------
+        bool
+            If rclone stored the archive at `remote_path`
+        """
+        stream = ZipStream(file_paths, flat)
+        await _call_progress(progress, 0, stream.total_size, progress_args)
+
+        future = asyncio.get_running_loop().run_in_executor(
+            executor,
+            stream.pipe_to,
+            [drive_config.rclone_path, "rcat", remote_path],
+        )
+        try:
+            while not future.done():
+                await asyncio.wait({future}, timeout=1)
+                await _call_progress(
+                    progress,
+                    min(stream.written, stream.total_size),
+                    stream.total_size,
+                    progress_args,
+                )
+        except BaseException:
+            # stopped by the progress callback
+            stream.stop()
+            await asyncio.gather(future, return_exceptions=True)
+            raise
+
+        return await future == 0
+
     @staticmethod
     async def rclone_upload_file(
-        drive_config: CloudDriveConfig, save_path: str, local_file_path: str
+        drive_config: CloudDriveConfig,
+        save_path: str,
+        local_file_path: str,
+        progress: Callable = None,
+        progress_args: tuple = (),
+        executor: Executor = None,
     ) -> bool:
-        """Use Rclone upload file"""
+        """Use Rclone upload file, with `before_upload_file_zip` the zip is
+        streamed into `rclone rcat` instead of written to the disk"""
         upload_status: bool = False
         try:
-            remote_dir = (
-                drive_config.remote_dir
-                + "/"
-                + os.path.dirname(local_file_path).replace(save_path, "")
-                + "/"
-            ).replace("\\", "/")
+            remote_dir = CloudDrive.get_remote_dir(
+                drive_config, save_path, local_file_path
+            )
 
             if not drive_config.dir_cache.get(remote_dir):
-                CloudDrive.rclone_mkdir(drive_config, remote_dir)
+                await CloudDrive.rclone_mkdir(drive_config, remote_dir)
                 drive_config.dir_cache[remote_dir] = True
 
-            zip_file_path: str = ""
-            file_path = local_file_path
             if drive_config.before_upload_file_zip:
-                zip_file_path = CloudDrive.zip_file(local_file_path)
-                file_path = zip_file_path
-            else:
-                file_path = local_file_path
+                zip_name = (
+                    os.path.splitext(os.path.basename(local_file_path))[0] + ".zip"
+                )
+                if await CloudDrive.rclone_rcat_zip(
+                    drive_config,
+                    [local_file_path],
+                    remote_dir + zip_name,
+                    executor,
+                    progress,
+                    progress_args,
+                ):
+                    logger.info(f"upload file {local_file_path} success")
+                    drive_config.total_upload_success_file_count += 1
+                    if drive_config.after_upload_file_delete:
+                        os.remove(local_file_path)
+                    upload_status = True
+                return upload_status
+
+            file_path = local_file_path
+            total_size = os.path.getsize(file_path)
+            await _call_progress(progress, 0, total_size, progress_args)
 
             cmd = (
                 f'"{drive_config.rclone_path}" copy "{file_path}" '
-                f'"{remote_dir}/" --create-empty-src-dirs --ignore-existing --progress'
+                f'"{remote_dir}/" --create-empty-src-dirs --progress'
             )
+            if drive_config.rclone_ignore_existing:
+                cmd += " --ignore-existing"
             proc = await asyncio.create_subprocess_shell(
                 cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT
             )
-            if proc.stdout:
-                async for output in proc.stdout:
-                    s = output.decode(errors="replace")
-                    print(s)
-                    if "Transferred" in s and "100%" in s and "1 / 1" in s:
-                        logger.info(f"upload file {local_file_path} success")
-                        drive_config.total_upload_success_file_count += 1
-                        if drive_config.after_upload_file_delete:
-                            os.remove(local_file_path)
-                        if drive_config.before_upload_file_zip:
-                            os.remove(zip_file_path)
-                        upload_status = True
-
-            await proc.wait()
+            try:
+                if proc.stdout:
+                    async for output in proc.stdout:
+                        s = output.decode(errors="replace")
+                        print(s)
+                        transferred = _RCLONE_PROGRESS_RE.search(s)
+                        if transferred:
+                            await _call_progress(
+                                progress,
+                                total_size * int(transferred.group(1)) // 100,
+                                total_size,
+                                progress_args,
+                            )
+                        if "Transferred" in s and "100%" in s and "1 / 1" in s:
+                            logger.info(f"upload file {local_file_path} success")
+                            drive_config.total_upload_success_file_count += 1
+                            if drive_config.after_upload_file_delete:
+                                os.remove(local_file_path)
+                            upload_status = True
+            finally:
+                # stopped by the progress callback
+                if proc.returncode is None and not upload_status:
+                    proc.kill()
+                await proc.wait()
         except Exception as e:
             logger.error(f"{e.__class__} {e}")
             return False
 
         return upload_status
 
+    @staticmethod
+    async def rclone_rcd_upload_file(
+        drive_config: CloudDriveConfig,
+        save_path: str,
+        local_file_path: str,
+        executor: Executor = None,
+        progress: Callable = None,
+        progress_args: tuple = (),
+    ) -> bool:
+        """Upload file by the jobs of an rclone rcd, see `RcloneRcd`"""
+        try:
+            remote_dir = CloudDrive.get_remote_dir(
+                drive_config, save_path, local_file_path
+            )
+
+            zip_file_path: str = ""
+            file_path = local_file_path
+            if drive_config.before_upload_file_zip:
+                zip_file_path = await CloudDrive.zip_file_in_executor(
+                    local_file_path, executor
+                )
+                file_path = zip_file_path
+
+            total_size = os.path.getsize(file_path)
+            await _call_progress(progress, 0, total_size, progress_args)
+
+            async def _on_poll(stats: dict):
+                await _call_progress(
+                    progress,
+                    min(stats.get("bytes", 0), total_size),
+                    total_size,
+                    progress_args,
+                )
+
+            await drive_config.get_rclone_rcd(executor).copy(
+                file_path, remote_dir, _on_poll if progress else None
+            )
+
+            logger.info(f"upload file {local_file_path} success")
+            drive_config.total_upload_success_file_count += 1
+            if drive_config.after_upload_file_delete:
+                os.remove(local_file_path)
+            if drive_config.before_upload_file_zip:
+                os.remove(zip_file_path)
+            await _call_progress(progress, total_size, total_size, progress_args)
+        except Exception as e:
+            logger.error(f"{e.__class__} {e}")
+            return False
+
+        return True
+
     @staticmethod
     def aligo_upload_file(
         drive_config: CloudDriveConfig, save_path: str, local_file_path: str
-    ):
-        """aliyun upload file"""
+    ) -> bool:
+        """aliyun upload file, blocking, see `aligo_upload`"""
         upload_status: bool = False
         if not drive_config.aligo:
             logger.warning("please config aligo! see README.md")
             return False
 
         try:
-            remote_dir = (
-                drive_config.remote_dir
-                + "/"
-                + os.path.dirname(local_file_path).replace(save_path, "")
-                + "/"
-            ).replace("\\", "/")
-
-            if not drive_config.dir_cache.get(remote_dir):
-                CloudDrive.aligo_mkdir(drive_config, remote_dir)
-                aligo_dir = drive_config.aligo.get_folder_by_path(remote_dir)
-                if aligo_dir:
-                    drive_config.dir_cache[remote_dir] = aligo_dir.file_id
+            remote_dir = CloudDrive.get_remote_dir(
+                drive_config, save_path, local_file_path
+            )
+            parent_file_id = CloudDrive.aligo_get_dir_id(drive_config, remote_dir)
 
             zip_file_path: str = ""
             file_paths = []
@@ -170,12 +412,11 @@ class CloudDrive:
 
             res = drive_config.aligo.upload_files(
                 file_paths=file_paths,
-                parent_file_id=drive_config.dir_cache[remote_dir],
+                parent_file_id=parent_file_id,
                 check_name_mode="refuse",
             )
 
             if len(res) > 0:
-                drive_config.total_upload_success_file_count += len(res)
                 if drive_config.after_upload_file_delete:
                     os.remove(local_file_path)
 
@@ -190,11 +431,55 @@ class CloudDrive:
 
         return upload_status
 
+    @staticmethod
+    async def aligo_upload(
+        drive_config: CloudDriveConfig,
+        save_path: str,
+        local_file_path: str,
+        executor: Executor = None,
+        progress: Callable = None,
+        progress_args: tuple = (),
+    ) -> bool:
+        """aliyun upload file in `executor`, the event loop keeps running.
+
+        aligo reports no progress of a file, so `progress` is called when the
+        upload starts and when it finished.
+        """
+        try:
+            total_size = os.path.getsize(local_file_path)
+            await _call_progress(progress, 0, total_size, progress_args)
+        except Exception as e:
+            logger.error(f"{e.__class__} {e}")
+            return False
+
+        upload_status = await asyncio.get_running_loop().run_in_executor(
+            executor,
+            CloudDrive.aligo_upload_file,
+            drive_config,
+            save_path,
+            local_file_path,
+        )
+        if upload_status:
+            logger.info(f"upload file {local_file_path} success")
+            drive_config.total_upload_success_file_count += 1
+            try:
+                await _call_progress(progress, total_size, total_size, progress_args)
+            except Exception as e:
+                logger.error(f"{e.__class__} {e}")
+
+        return upload_status
+
     @staticmethod
     async def upload_file(
-        drive_config: CloudDriveConfig, save_path: str, local_file_path: str
+        drive_config: CloudDriveConfig,
+        save_path: str,
+        local_file_path: str,
+        executor: Executor = None,
+        progress: Callable = None,
+        progress_args: tuple = (),
     ) -> bool:
-        """Upload file
+        """Upload file, at most `max_upload_task` files are uploaded at once,
+        except by `rclone_rcd` which runs `rclone_transfers` transfers
         Parameters
         ----------
         drive_config: CloudDriveConfig
@@ -206,6 +491,16 @@ class CloudDrive:
         local_file_path: str
             Local file path
 
+        executor: Executor
+            Executor of the blocking aligo upload
+
+        progress: Callable
+            Called as `progress(current, total, *progress_args)` like the
+            pyrogram upload progress, an exception from it stops the upload
+
+        progress_args: tuple
+            Extra args of progress
+
         Returns
         -------
         bool
@@ -214,12 +509,256 @@ class CloudDrive:
         if not drive_config.enable_upload_file:
             return False
 
+        # the file may be deleted after the upload
+        file_size = (
+            os.path.getsize(local_file_path) if os.path.exists(local_file_path) else 0
+        )
+
         ret: bool = False
-        if drive_config.upload_adapter == "rclone":
-            ret = await CloudDrive.rclone_upload_file(
-                drive_config, save_path, local_file_path
+        if drive_config.upload_adapter == "rclone_rcd":
+            # bounded by the transfers of rclone, small files are batched
+            ret = await CloudDrive.rclone_rcd_upload_file(
+                drive_config,
+                save_path,
+                local_file_path,
+                executor,
+                progress,
+                progress_args,
             )
-        elif drive_config.upload_adapter == "aligo":
-            ret = CloudDrive.aligo_upload_file(drive_config, save_path, local_file_path)
-
+        else:
+            async with drive_config.upload_semaphore:
+                if drive_config.upload_adapter == "rclone":
+                    ret = await CloudDrive.rclone_upload_file(
+                        drive_config,
+                        save_path,
+                        local_file_path,
+                        progress,
+                        progress_args,
+                        executor,
+                    )
+                elif drive_config.upload_adapter == "aligo":
+                    ret = await CloudDrive.aligo_upload(
+                        drive_config,
+                        save_path,
+                        local_file_path,
+                        executor,
+                        progress,
+                        progress_args,
+                    )
+
+        if ret:
+            metrics.UPLOAD_BYTES.inc(file_size, target="cloud")
         return ret
+
+    @staticmethod
+    async def finish_rclone_batch_file(
+        drive_config: CloudDriveConfig,
+        local_file_path: str,
+        batch_done: asyncio.Future,
+    ) -> bool:
+        """Wait for the batch job of the file, see `add_rclone_batch_file`"""
+        file_size = os.path.getsize(local_file_path)
+        try:
+            await asyncio.shield(batch_done)
+        except Exception as e:
+            logger.error(f"{e.__class__} {e}")
+            return False
+
+        logger.info(f"upload file {local_file_path} success")
+        drive_config.total_upload_success_file_count += 1
+        metrics.UPLOAD_BYTES.inc(file_size, target="cloud")
+        if drive_config.after_upload_file_delete:
+            os.remove(local_file_path)
+        return True
+
+    @staticmethod
+    def add_rclone_batch_file(
+        drive_config: CloudDriveConfig,
+        save_path: str,
+        local_file_path: str,
+        executor: Executor = None,
+    ) -> Optional[asyncio.Future]:
+        """Add a small file to a batch job of the `rclone_rcd` adapter, the
+        caller goes on while more files join the batch, see
+        `RcloneRcd.add_batch_file`
+
+        Returns
+        -------
+        Optional[asyncio.Future]
+            Result of the upload, None if the file is not batched
+        """
+        if (
+            not drive_config.enable_upload_file
+            or drive_config.upload_adapter != "rclone_rcd"
+            or drive_config.before_upload_file_zip
+        ):
+            return None
+
+        batch_done = drive_config.get_rclone_rcd(executor).add_batch_file(
+            local_file_path,
+            CloudDrive.get_remote_dir(drive_config, save_path, local_file_path),
+        )
+        if not batch_done:
+            return None
+
+        return asyncio.ensure_future(
+            CloudDrive.finish_rclone_batch_file(
+                drive_config, local_file_path, batch_done
+            )
+        )
+
+    @staticmethod
+    def add_zip_group_file(
+        drive_config: CloudDriveConfig,
+        save_path: str,
+        local_file_path: str,
+        media_group_id: Optional[str] = None,
+        executor: Executor = None,
+    ) -> Optional[asyncio.Future]:
+        """Add a file to its zip group, see `zip_group`.
+
+        A group is uploaded when no file joined it for `zip_group_timeout`
+        seconds, or when its files reach `zip_group_max_size`.
+
+        Returns
+        -------
+        Optional[asyncio.Future]
+            Result of the group upload, None if the file is not grouped
+        """
+        if not drive_config.enable_upload_file:
+            return None
+
+        local_dir = os.path.dirname(local_file_path)
+        if drive_config.zip_group == "media_group" and media_group_id:
+            key = os.path.join(local_dir, str(media_group_id))
+            name = f"{media_group_id}.zip"
+        elif drive_config.zip_group == "folder":
+            key = local_dir
+            name = ""
+        else:
+            return None
+
+        group = drive_config.zip_groups.get(key)
+        if not group:
+            if not name:
+                # a folder is uploaded in several archives over time
+                first_name = os.path.splitext(os.path.basename(local_file_path))[0]
+                name = f"{os.path.basename(local_dir)}-{first_name}.zip"
+            group = ZipGroup(save_path, name, executor)
+            drive_config.zip_groups[key] = group
+
+        group.file_paths.append(local_file_path)
+        group.size += os.path.getsize(local_file_path)
+        if group.timer:
+            group.timer.cancel()
+
+        if group.size >= drive_config.zip_group_max_size:
+            CloudDrive.flush_zip_group(drive_config, key)
+        else:
+            group.timer = asyncio.get_running_loop().call_later(
+                drive_config.zip_group_timeout,
+                CloudDrive.flush_zip_group,
+                drive_config,
+                key,
+            )
+
+        return group.done
+
+    @staticmethod
+    def flush_zip_group(drive_config: CloudDriveConfig, key: str):
+        """Stop gathering the files of the group and upload it"""
+        group = drive_config.zip_groups.pop(key, None)
+        if not group:
+            return
+        if group.timer:
+            group.timer.cancel()
+
+        task = asyncio.ensure_future(CloudDrive.upload_zip_group(drive_config, group))
+        drive_config.zip_group_tasks.add(task)
+        task.add_done_callback(drive_config.zip_group_tasks.discard)
+
+    @staticmethod
+    async def flush_zip_groups(drive_config: CloudDriveConfig):
+        """Upload all the groups now and wait for them"""
+        for key in list(drive_config.zip_groups):
+            CloudDrive.flush_zip_group(drive_config, key)
+        if drive_config.zip_group_tasks:
+            await asyncio.gather(*drive_config.zip_group_tasks)
+
+    @staticmethod
+    async def upload_zip_archive(
+        drive_config: CloudDriveConfig,
+        zip_file_path: str,
+        remote_dir: str,
+        executor: Executor = None,
+    ) -> bool:
+        """Upload a zip archive as is by the rclone_rcd or aligo adapter"""
+        if drive_config.upload_adapter == "rclone_rcd":
+            await drive_config.get_rclone_rcd(executor).copy(zip_file_path, remote_dir)
+            return True
+
+        def _aligo_upload() -> bool:
+            if not drive_config.aligo:
+                logger.warning("please config aligo! see README.md")
+                return False
+            res = drive_config.aligo.upload_files(
+                file_paths=[zip_file_path],
+                parent_file_id=CloudDrive.aligo_get_dir_id(drive_config, remote_dir),
+                check_name_mode="refuse",
+            )
+            return len(res) > 0
+
+        return await asyncio.get_running_loop().run_in_executor(executor, _aligo_upload)
+
+    @staticmethod
+    async def upload_zip_group(drive_config: CloudDriveConfig, group: ZipGroup):
+        """Upload the files of the group in one zip archive, the archive is
+        streamed into `rclone rcat` by the rclone adapter, and written next to
+        the files in `executor` by the others"""
+        upload_status: bool = False
+        try:
+            if not drive_config.enable_upload_file:
+                return
+
+            remote_dir = CloudDrive.get_remote_dir(
+                drive_config, group.save_path, group.file_paths[0]
+            )
+            if drive_config.upload_adapter == "rclone":
+                if not drive_config.dir_cache.get(remote_dir):
+                    await CloudDrive.rclone_mkdir(drive_config, remote_dir)
+                    drive_config.dir_cache[remote_dir] = True
+
+                upload_status = await CloudDrive.rclone_rcat_zip(
+                    drive_config,
+                    group.file_paths,
+                    remote_dir + group.name,
+                    group.executor,
+                    flat=True,
+                )
+            else:
+                zip_file_path = os.path.join(
+                    os.path.dirname(group.file_paths[0]), group.name
+                )
+                await asyncio.get_running_loop().run_in_executor(
+                    group.executor, write_zip, zip_file_path, group.file_paths, True
+                )
+                try:
+                    upload_status = await CloudDrive.upload_zip_archive(
+                        drive_config, zip_file_path, remote_dir, group.executor
+                    )
+                finally:
+                    os.remove(zip_file_path)
+
+            if upload_status:
+                logger.info(
+                    f"upload {len(group.file_paths)} files in {group.name} success"
+                )
+                drive_config.total_upload_success_file_count += len(group.file_paths)
+                metrics.UPLOAD_BYTES.inc(group.size, target="cloud")
+                if drive_config.after_upload_file_delete:
+                    for file_path in group.file_paths:
+                        os.remove(file_path)
+        except Exception as e:
+            logger.error(f"{e.__class__} {e}")
+        finally:
+            group.done.set_result(upload_status)
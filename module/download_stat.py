@@ -1,12 +1,24 @@
 """Download Stat"""
 import asyncio
+import heapq
+import json
+import math
+import threading
 import time
+from collections import OrderedDict, deque
 from enum import Enum
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Tuple, Union
 
 from pyrogram import Client
 
+from module import metrics
 from module.app import TaskNode
 
+# seconds of the smoothed download speed
+SPEED_WINDOW = 5
+# diffs kept for the web ui subscribers which fall behind
+EVENT_WINDOW = 60
+
 
 class DownloadState(Enum):
     """Download state"""
@@ -15,16 +27,252 @@ class DownloadState(Enum):
     StopDownload = 2
 
 
-_download_result: dict = {}
+# pylint: disable = R0902
+class TransferStat:
+    """Progress of one downloading file.
+
+    The progress callback only stores `down_byte`, the speed is computed by
+    `tick` once a second from a ring buffer of the bytes downloaded in the
+    last `SPEED_WINDOW` ticks. The bytes of the first callback are the
+    baseline, a resumed download already had them on the disk.
+    """
+
+    __slots__ = (
+        "chat_id",
+        "message_id",
+        "file_name",
+        "total_size",
+        "down_byte",
+        "start_time",
+        "task_id",
+        "download_speed",
+        "finish_time",
+        "_window_bytes",
+        "_window_times",
+        "_window_index",
+        "_window_byte_sum",
+        "_window_time_sum",
+        "_last_byte",
+        "_last_time",
+    )
+
+    def __init__(
+        self,
+        chat_id: int,
+        message_id: int,
+        file_name: str,
+        total_size: int,
+        start_time: float,
+        task_id: int = 0,
+        down_byte: int = 0,
+    ):
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.file_name = file_name
+        self.total_size = total_size
+        self.down_byte = down_byte
+        self.start_time = start_time
+        self.task_id = task_id
+        self.download_speed: int = 0
+        # set when the transfer moves to the completed ones
+        self.finish_time: float = 0
+        self._window_bytes: List[int] = [0] * SPEED_WINDOW
+        self._window_times: List[float] = [0.0] * SPEED_WINDOW
+        self._window_index: int = 0
+        self._window_byte_sum: int = 0
+        self._window_time_sum: float = 0
+        self._last_byte = down_byte
+        self._last_time: float = start_time
+
+    def is_finished(self) -> bool:
+        """If all the bytes are downloaded, never while the size is unknown"""
+        return 0 < self.total_size <= self.down_byte
+
+    def tick(self, cur_time: float) -> int:
+        """Push the bytes downloaded since the last tick into the window and
+        update `download_speed`
+
+        Returns
+        -------
+        int
+            Bytes downloaded since the last tick
+        """
+        down_byte = self.down_byte
+        new_byte = max(down_byte - self._last_byte, 0)
+        elapsed = max(cur_time - self._last_time, 0)
+        self._last_byte = down_byte
+        self._last_time = cur_time
+
+        index = self._window_index
+        self._window_byte_sum += new_byte - self._window_bytes[index]
+        self._window_time_sum += elapsed - self._window_times[index]
+        self._window_bytes[index] = new_byte
+        self._window_times[index] = elapsed
+        self._window_index = (index + 1) % SPEED_WINDOW
+
+        if self._window_time_sum > 0:
+            self.download_speed = int(self._window_byte_sum / self._window_time_sum)
+        return new_byte
+
+    def eta(self) -> Optional[int]:
+        """Whole seconds left at the current speed, None if it is not moving
+        or the size is unknown"""
+        if self.is_finished():
+            return 0
+        if not self.total_size or not self.download_speed:
+            return None
+        return math.ceil((self.total_size - self.down_byte) / self.download_speed)
+
+
+class ChatDownloadStat:
+    """Totals of the completed transfers of a chat, kept after the transfers
+    are evicted"""
+
+    __slots__ = ("completed_count", "completed_byte")
+
+    def __init__(self):
+        self.completed_count: int = 0
+        self.completed_byte: int = 0
+
+
+# (chat_id, message_id) -> TransferStat
+_active_transfers: Dict[Tuple[int, int], TransferStat] = {}
+# in the order of finish_time, bounded by the ticker, see `evict_completed`
+_completed_transfers: "OrderedDict[Tuple[int, int], TransferStat]" = OrderedDict()
+# str(chat_id) -> ChatDownloadStat
+_chat_download_stat: Dict[str, ChatDownloadStat] = {}
 _total_download_speed: int = 0
-_total_download_size: int = 0
-_last_download_time: float = time.time()
+_last_tick_time: float = time.time()
 _download_state: DownloadState = DownloadState.Downloading
 
+# (seq, json) of the diffs published by the ticker, see `publish_download_event`
+_events: Deque[Tuple[int, str]] = deque(maxlen=EVENT_WINDOW)
+_event_seq: int = 0
+_event_condition = threading.Condition()
+# (chat_id, message_id) -> (down_byte, download_speed) last published
+_published: Dict[Tuple[int, int], Tuple[int, int]] = {}
+# transfers completed since the last publish
+_unpublished_completed: List[TransferStat] = []
+
+
+def get_active_transfers() -> Iterator[TransferStat]:
+    """The transfers in progress"""
+    return iter(list(_active_transfers.values()))
+
+
+def get_completed_transfers(since: float = 0) -> Iterator[TransferStat]:
+    """The retained completed transfers which finished after `since`,
+    the latest first"""
+    for stat in reversed(list(_completed_transfers.values())):
+        if stat.finish_time < since:
+            break
+        yield stat
+
+
+def get_transfer_status(stat: TransferStat) -> str:
+    """`downloading`, `finished` or `failed`"""
+    if not stat.finish_time:
+        return "downloading"
+    return "finished" if stat.is_finished() else "failed"
 
-def get_download_result() -> dict:
-    """get global download result"""
-    return _download_result
+
+TRANSFER_SORT_KEYS: Dict[str, Callable[[TransferStat], float]] = {
+    "start_time": lambda stat: stat.start_time,
+    "finish_time": lambda stat: stat.finish_time,
+    "speed": lambda stat: stat.download_speed,
+    "progress": lambda stat: (
+        stat.down_byte / stat.total_size if stat.total_size else 0
+    ),
+    "size": lambda stat: stat.total_size,
+}
+
+
+def get_transfer_sort_key(stat: TransferStat, sort: str) -> Tuple[float, str, int]:
+    """The position of the transfer in the order of `sort`, unique so that it
+    can be the cursor of a page.
+
+    The chat id is compared as a str, a chat may be an int id or a username.
+    """
+    return (TRANSFER_SORT_KEYS[sort](stat), str(stat.chat_id), stat.message_id)
+
+
+# pylint: disable = R0913
+def query_transfers(
+    status: Optional[str] = None,
+    chat_id: Optional[Union[int, str]] = None,
+    task_id: Optional[int] = None,
+    sort: str = "start_time",
+    reverse: bool = True,
+    limit: int = 100,
+    after: Optional[Tuple[float, str, int]] = None,
+) -> Tuple[List[TransferStat], int]:
+    """A page of the transfers.
+
+    `downloading` only looks into the active transfers and `finished` or
+    `failed` only into the retained completed ones. Every query scans them,
+    at most `max_completed_download` plus the active ones.
+
+    Parameters
+    ----------
+    status: Optional[str]
+        `downloading`, `finished` or `failed`, None for all
+
+    chat_id: Optional[Union[int, str]]
+        Chat id or username, matched as a str
+
+    sort: str
+        One of `TRANSFER_SORT_KEYS`
+
+    reverse: bool
+        Descending order
+
+    after: Optional[Tuple[float, str, int]]
+        Sort key of the last transfer of the previous page,
+        see `get_transfer_sort_key`
+
+    Returns
+    -------
+    Tuple[List[TransferStat], int]
+        The transfers of the page and the number of all the matched ones
+    """
+    sort_key = TRANSFER_SORT_KEYS[sort]
+    if chat_id is not None:
+        chat_id = str(chat_id)
+
+    sources: List[Dict[Tuple[int, int], TransferStat]] = []
+    if status in (None, "downloading"):
+        sources.append(_active_transfers)
+    if status in (None, "finished", "failed"):
+        sources.append(_completed_transfers)
+
+    total = 0
+    matched = []
+    for source in sources:
+        for stat in list(source.values()):
+            if chat_id is not None and str(stat.chat_id) != chat_id:
+                continue
+            if task_id is not None and stat.task_id != task_id:
+                continue
+            if status in ("finished", "failed") and (
+                stat.is_finished() != (status == "finished")
+            ):
+                continue
+            total += 1
+            key = (sort_key(stat), str(stat.chat_id), stat.message_id)
+            if after is not None and (key >= after if reverse else key <= after):
+                continue
+            matched.append((key, stat))
+
+    if reverse:
+        page = heapq.nlargest(limit, matched, key=lambda it: it[0])
+    else:
+        page = heapq.nsmallest(limit, matched, key=lambda it: it[0])
+    return [stat for _, stat in page], total
+
+
+def get_chat_download_stat(chat_id: Union[int, str]) -> ChatDownloadStat:
+    """Totals of the completed transfers of the chat, by id or username"""
+    return _chat_download_stat.get(str(chat_id)) or ChatDownloadStat()
 
 
 def get_total_download_speed() -> int:
@@ -44,6 +292,208 @@ def set_download_state(state: DownloadState):
     _download_state = state
 
 
+def finish_transfer(
+    chat_id: int, message_id: int, cur_time: float = None, success: bool = False
+):
+    """Move the transfer to the completed ones, finished or failed.
+
+    A transfer of unknown size is only completed here, it is finished if the
+    download `success`-ed, with the downloaded bytes as its size.
+    """
+    stat = _active_transfers.get((chat_id, message_id))
+    if not stat:
+        return
+
+    cur_time = cur_time or time.time()
+    # the bytes since the last tick
+    metrics.DOWNLOAD_BYTES.inc(stat.tick(cur_time))
+    if success and not stat.total_size:
+        stat.total_size = stat.down_byte
+    _complete_transfer(stat, cur_time)
+
+
+def _complete_transfer(stat: TransferStat, cur_time: float):
+    """Move the transfer to the completed ones and add it to the chat totals"""
+    chat_id, message_id = stat.chat_id, stat.message_id
+    _active_transfers.pop((chat_id, message_id), None)
+    stat.finish_time = cur_time
+    # a retried message is moved to the end
+    _completed_transfers.pop((chat_id, message_id), None)
+    _completed_transfers[(chat_id, message_id)] = stat
+    _unpublished_completed.append(stat)
+
+    if stat.is_finished():
+        chat_stat = _chat_download_stat.get(str(chat_id))
+        if not chat_stat:
+            chat_stat = _chat_download_stat[str(chat_id)] = ChatDownloadStat()
+        chat_stat.completed_count += 1
+        chat_stat.completed_byte += stat.total_size
+
+
+def evict_completed(cur_time: float, max_completed: int, completed_ttl: float):
+    """Drop the oldest completed transfers, over `max_completed` or finished
+    `completed_ttl` seconds ago"""
+    while _completed_transfers:
+        stat = next(iter(_completed_transfers.values()))
+        if (
+            len(_completed_transfers) <= max_completed
+            and stat.finish_time >= cur_time - completed_ttl
+        ):
+            break
+        _completed_transfers.popitem(last=False)
+
+
+def tick_download_stat(
+    cur_time: float = None,
+    max_completed: int = 1000,
+    completed_ttl: float = 3600,
+):
+    """Update the speed of the unfinished downloads and the total speed, and
+    evict the old completed ones, see `run_download_stat_ticker`"""
+    global _total_download_speed
+    global _last_tick_time
+
+    cur_time = cur_time or time.time()
+    elapsed = cur_time - _last_tick_time
+    _last_tick_time = cur_time
+
+    total_new_byte = 0
+    for stat in list(_active_transfers.values()):
+        total_new_byte += stat.tick(cur_time)
+        if stat.is_finished():
+            _complete_transfer(stat, cur_time)
+    metrics.DOWNLOAD_BYTES.inc(total_new_byte)
+
+    if elapsed > 0:
+        _total_download_speed = int(total_new_byte / elapsed)
+
+    evict_completed(cur_time, max_completed, completed_ttl)
+    publish_download_event()
+
+
+def transfer_to_dict(stat: TransferStat) -> dict:
+    """The transfer as sent to the web ui"""
+    return {
+        "chat": stat.chat_id,
+        "id": stat.message_id,
+        "file_name": stat.file_name.replace("\\", "/"),
+        "total_size": stat.total_size,
+        "down_byte": stat.down_byte,
+        "speed": stat.download_speed,
+        "eta": stat.eta(),
+    }
+
+
+def get_download_snapshot() -> Tuple[int, str]:
+    """The active transfers in the format of a diff which creates all of them,
+    with the seq of the last diff it includes"""
+    with _event_condition:
+        seq = _event_seq
+    event = {
+        "seq": seq,
+        "speed": _total_download_speed,
+        "new": [transfer_to_dict(it) for it in get_active_transfers()],
+        "progress": [],
+        "completed": [],
+    }
+    return seq, json.dumps(event)
+
+
+def publish_download_event():
+    """Build the diff of the transfers since the last publish and wake up the
+    subscribers, called once per tick so that the cost does not grow with the
+    number of subscribers.
+
+    The diff holds the absolute values of the changed transfers only:
+    `new` transfers, the `progress` of the ones whose bytes or speed changed
+    and the `completed` ones, so applying a diff twice does no harm.
+    """
+    global _event_seq
+
+    new = []
+    progress = []
+    for stat in list(_active_transfers.values()) + _unpublished_completed:
+        key = (stat.chat_id, stat.message_id)
+        value = (stat.down_byte, stat.download_speed)
+        last_value = _published.get(key)
+        if last_value is None:
+            new.append(transfer_to_dict(stat))
+        elif last_value != value:
+            progress.append(
+                {
+                    "chat": stat.chat_id,
+                    "id": stat.message_id,
+                    "down_byte": stat.down_byte,
+                    "speed": stat.download_speed,
+                    "eta": stat.eta(),
+                }
+            )
+        _published[key] = value
+
+    completed = []
+    for stat in _unpublished_completed:
+        _published.pop((stat.chat_id, stat.message_id), None)
+        completed.append(
+            {
+                "chat": stat.chat_id,
+                "id": stat.message_id,
+                "finished": stat.is_finished(),
+            }
+        )
+    _unpublished_completed.clear()
+
+    with _event_condition:
+        _event_seq += 1
+        event = {
+            "seq": _event_seq,
+            "speed": _total_download_speed,
+            "new": new,
+            "progress": progress,
+            "completed": completed,
+        }
+        _events.append((_event_seq, json.dumps(event)))
+        _event_condition.notify_all()
+
+
+def wait_download_events(
+    after_seq: int, timeout: float
+) -> Optional[List[Tuple[int, str]]]:
+    """Wait up to `timeout` seconds for the diffs published after `after_seq`,
+    for the subscribers in the web threads
+
+    Returns
+    -------
+    Optional[List[Tuple[int, str]]]
+        `(seq, json)` of the diffs, empty on timeout, None if some of them are out of
+        `EVENT_WINDOW` and the subscriber should start over from a snapshot
+    """
+    with _event_condition:
+        _event_condition.wait_for(lambda: _event_seq > after_seq, timeout)
+        if _event_seq <= after_seq:
+            return []
+        if not _events or _events[0][0] > after_seq + 1:
+            return None
+        return [it for it in _events if it[0] > after_seq]
+
+
+async def run_download_stat_ticker(
+    interval: float = 1.0, max_completed: int = 1000, completed_ttl: float = 3600
+):
+    """Tick the download stat every `interval` seconds, forever
+
+    Parameters
+    ----------
+    max_completed: int
+        Max completed transfers kept for the web ui
+
+    completed_ttl: float
+        Seconds a completed transfer is kept
+    """
+    while True:
+        await asyncio.sleep(interval)
+        tick_download_stat(None, max_completed, completed_ttl)
+
+
 async def update_download_status(
     down_byte: int,
     total_size: int,
@@ -54,69 +504,26 @@ async def update_download_status(
     client: Client,
 ):
     """update_download_status"""
-    cur_time = time.time()
-    # pylint: disable = W0603
-    global _total_download_speed
-    global _total_download_size
-    global _last_download_time
-
     if node.is_stop_transmission:
         client.stop_transmission()
 
-    chat_id = node.chat_id
-
     while get_download_state() == DownloadState.StopDownload:
         if node.is_stop_transmission:
             client.stop_transmission()
         await asyncio.sleep(1)
 
-    if not _download_result.get(chat_id):
-        _download_result[chat_id] = {}
-
-    if _download_result[chat_id].get(message_id):
-        last_download_byte = _download_result[chat_id][message_id]["down_byte"]
-        last_time = _download_result[chat_id][message_id]["end_time"]
-        download_speed = _download_result[chat_id][message_id]["download_speed"]
-        each_second_total_download = _download_result[chat_id][message_id][
-            "each_second_total_download"
-        ]
-        end_time = _download_result[chat_id][message_id]["end_time"]
-
-        _total_download_size += down_byte - last_download_byte
-        each_second_total_download += down_byte - last_download_byte
-
-        if cur_time - last_time >= 1.0:
-            download_speed = int(each_second_total_download / (cur_time - last_time))
-            end_time = cur_time
-            each_second_total_download = 0
-
-        download_speed = max(download_speed, 0)
-
-        _download_result[chat_id][message_id]["down_byte"] = down_byte
-        _download_result[chat_id][message_id]["end_time"] = end_time
-        _download_result[chat_id][message_id]["download_speed"] = download_speed
-        _download_result[chat_id][message_id][
-            "each_second_total_download"
-        ] = each_second_total_download
-    else:
-        each_second_total_download = down_byte
-        _download_result[chat_id][message_id] = {
-            "down_byte": down_byte,
-            "total_size": total_size,
-            "file_name": file_name,
-            "start_time": start_time,
-            "end_time": cur_time,
-            "download_speed": down_byte / (cur_time - start_time),
-            "each_second_total_download": each_second_total_download,
-            "task_id": node.task_id,
-        }
-        _total_download_size += down_byte
-
-    if cur_time - _last_download_time >= 1.0:
-        # update speed
-        _total_download_speed = int(
-            _total_download_size / (cur_time - _last_download_time)
+    key = (node.chat_id, message_id)
+    stat = _active_transfers.get(key)
+    if not stat:
+        stat = TransferStat(
+            node.chat_id,
+            message_id,
+            file_name,
+            total_size,
+            start_time,
+            node.task_id,
+            down_byte,
         )
-        _total_download_speed = max(_total_download_speed, 0)
-        _total_download_size = 0
-        _last_download_time = cur_time
+        _active_transfers[key] = stat
+
+    stat.down_byte = down_byte
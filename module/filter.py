@@ -1,43 +1,205 @@
 """Filter for download"""
 
-import re
+import operator
+import os
+from dataclasses import dataclass
 from datetime import datetime
-from typing import Any, Optional, Tuple
+from functools import lru_cache
+from operator import attrgetter
+from typing import Any, Callable, Optional, Tuple
 
 from ply import lex, yacc
 
 from utils.format import get_byte_from_str
 from utils.meta_data import MetaData, NoneObj, ReString
 
+# generated lexer and parser tables, see `gen_filter_cache.py`
+TABLE_DIR = os.path.dirname(os.path.abspath(__file__))
+LEXTAB = "module.filter_lextab"
+PARSETAB = "module.filter_parsetab"
+
 
 # pylint: disable = R0904
 class BaseFilter:
-    """for normal filter"""
+    """for normal filter
+
+    A filter str is parsed once into an AST which is compiled into a closure
+    over `MetaData`, both of the last `cache_size` filter strs are cached.
+    """
+
+    # lexer and parser shared by all filters, loaded from the tables generated
+    # by `gen_filter_cache.py` without validating the grammar again
+    _lexer: Optional[lex.Lexer] = None
+    _parser: Optional[yacc.LRParser] = None
 
-    def __init__(self, debug: bool = False):
+    def __init__(self, debug: bool = False, cache_size: int = 128):
         """
          Parameters
         ----------
         debug: bool
             If output debug info
 
+        cache_size: int
+            How many compiled filter strs are cached
+
         """
-        self.names: dict = {}
+        self.meta_data: Optional[MetaData] = None
         self.debug = debug
-        # Build the lexer and parser
-        # lex.lex(module=self)
-        self.lexer = lex.lex(module=self)
-        self.yacc = yacc.yacc(module=self)
+        if BaseFilter._parser is None:
+            BaseFilter._lexer, BaseFilter._parser = self.build_tables(
+                LEXTAB, PARSETAB, TABLE_DIR
+            )
+        self.lexer = BaseFilter._lexer.clone()
+        self.yacc = BaseFilter._parser
+        self.parse = lru_cache(maxsize=cache_size)(self._parse)
+        self.compile = lru_cache(maxsize=cache_size)(self._compile)
+
+    def build_tables(
+        self, lextab: str, parsetab: str, outputdir: str
+    ) -> Tuple[lex.Lexer, yacc.LRParser]:
+        """Load the lexer and the parser from the `lextab` and `parsetab`
+        modules, or generate them into `outputdir` if they can not be imported"""
+        lexer = lex.lex(module=self, optimize=1, lextab=lextab, outputdir=outputdir)
+        parser = yacc.yacc(
+            module=self,
+            optimize=1,
+            debug=False,
+            tabmodule=parsetab,
+            outputdir=outputdir,
+        )
+        return lexer, parser
+
+    @property
+    def names(self) -> dict:
+        """All symbol"""
+        return self.meta_data.data() if self.meta_data else {}
 
     def reset(self):
         """Reset all symbol"""
-        self.names.clear()
+        self.meta_data = None
+
+    def _parse(self, filter_str: str) -> tuple:
+        """Parse filter str into an AST"""
+        return self.yacc.parse(filter_str, lexer=self.lexer, debug=self.debug)
+
+    def _compile(self, filter_str: str) -> Callable[[MetaData], Any]:
+        """Compile filter str into a closure"""
+        return self.compile_node(self.parse(filter_str))
+
+    # pylint: disable = R0911
+    def compile_node(self, node: tuple) -> Callable[[MetaData], Any]:
+        """Compile an AST node into a closure `(MetaData) -> Any`"""
+        kind = node[0]
+        if kind == "const":
+            value = node[1]
+            return lambda meta: value
+
+        if kind == "name":
+            return attrgetter(node[2])
+
+        if kind == "neg":
+            operand = self.compile_node(node[1])
+            return lambda meta: operator.neg(operand(meta))
+
+        if kind in ("and", "or"):
+            left, right = self.compile_node(node[1]), self.compile_node(node[2])
+
+            # both sides are evaluated, a type error is never hidden
+            def _and(meta: MetaData):
+                lhs, rhs = left(meta), right(meta)
+                return lhs and rhs
+
+            def _or(meta: MetaData):
+                lhs, rhs = left(meta), right(meta)
+                return lhs or rhs
+
+            return _and if kind == "and" else _or
+
+        op = node[1]
+        left, right = self.compile_node(node[2]), self.compile_node(node[3])
+        if kind == "binop":
+            return self._compile_binop(op, left, right)
+        if kind == "cmp":
+            return self._compile_cmp(op, left, right)
+        return self._compile_eq(op, left, right)
+
+    def _compile_binop(self, op: str, left: Callable, right: Callable) -> Callable:
+        """`+ - * /`"""
+
+        def _binop(meta: MetaData):
+            lhs, rhs = left(meta), right(meta)
+            _check_type(lhs, rhs)
+            if isinstance(lhs, NoneObj):
+                lhs = 0
+            if isinstance(rhs, NoneObj):
+                rhs = 0
+
+            if op == "+":
+                res = lhs + rhs
+            elif op == "-":
+                res = lhs - rhs
+            elif op == "*":
+                res = lhs * rhs
+            else:
+                res = lhs / rhs
+
+            self._output(f"binop {lhs} {op} {rhs} = {res}")
+            return res
+
+        return _binop
+
+    def _compile_cmp(self, op: str, left: Callable, right: Callable) -> Callable:
+        """`> < >= <=`"""
+        compare = _COMPARE[op]
+
+        def _cmp(meta: MetaData):
+            lhs, rhs = left(meta), right(meta)
+            _check_type(lhs, rhs)
+            if isinstance(lhs, NoneObj) or isinstance(rhs, NoneObj):
+                return True
+
+            if lhs is None or rhs is None:
+                return False
+
+            res = compare(lhs, rhs)
+            self._output(f"{lhs} {op} {rhs} = {res}")
+            return res
+
+        return _cmp
+
+    def _compile_eq(self, op: str, left: Callable, right: Callable) -> Callable:
+        """`== !=`, and `=` of the assign statement"""
+        is_eq = op != "!="
+
+        def _eq(meta: MetaData):
+            lhs, rhs = left(meta), right(meta)
+            _check_type(lhs, rhs)
+            if isinstance(lhs, NoneObj) or isinstance(rhs, NoneObj):
+                return True
+
+            if lhs is None or rhs is None:
+                return False
+
+            if isinstance(rhs, ReString):
+                lhs, rhs = rhs, lhs
+
+            if isinstance(lhs, ReString):
+                if not isinstance(rhs, str):
+                    return 0
+                res = (lhs.pattern.fullmatch(rhs) is not None) == is_eq
+                self._output(f"{rhs} {op} {lhs.re_string} {res}")
+            else:
+                res = (lhs == rhs) == is_eq
+                self._output(f"{lhs} {op} {rhs} {res}")
+            return res
+
+        return _eq
 
     def exec(self, filter_str: str) -> Any:
         """Exec filter str"""
-        # )  #
-        # return yacc.parse(filter_str, debug=self.debug)
-        return self.yacc.parse(filter_str, debug=self.debug)
+        res = self.compile(filter_str)(self.meta_data)
+        self._output(res)
+        return res
 
     def _output(self, output_str: str):
         """For print debug info"""
@@ -130,14 +292,21 @@ class BaseFilter:
         ("right", "UMINUS"),
     )
 
+    # Every rule builds a node of the filter AST, a tuple of the node kind
+    # and its operands. The rules are bound to the filter which built the
+    # shared parser, so they never use the state of `self`:
+    #   ("const", value)              ("name", filter_name, attr)
+    #   ("binop", op, left, right)    ("neg", operand)
+    #   ("cmp", op, left, right)      ("eq", op, left, right)
+    #   ("and", left, right)          ("or", left, right)
+
     def p_statement_assign(self, p):
         'statement : NAME "=" expression'
-        return self.p_expression_eq(p)
+        p[0] = ("eq", p[2], ("const", p[1]), p[3])
         # self.names[p[1]] = p[3]
 
     def p_statement_expr(self, p):
         "statement : expression"
-        self._output(p[1])
         p[0] = p[1]
 
     def p_expression_binop(self, p):
@@ -145,123 +314,23 @@ class BaseFilter:
         | expression '-' expression
         | expression '*' expression
         | expression '/' expression"""
-        self.check_type(p)
-        if isinstance(p[1], NoneObj):
-            p[1] = 0
-        if isinstance(p[3], NoneObj):
-            p[3] = 0
-
-        if p[2] == "+":
-            p[0] = p[1] + p[3]
-        elif p[2] == "-":
-            p[0] = p[1] - p[3]
-        elif p[2] == "*":
-            p[0] = p[1] * p[3]
-        elif p[2] == "/":
-            p[0] = p[1] / p[3]
-
-        self._output(f"binop {p[1]} {p[2]} {p[3]} = {p[0]}")
+        p[0] = ("binop", p[2], p[1], p[3])
 
     def p_expression_comp(self, p):
         """expression : expression '>' expression
-        | expression '<' expression"""
-        self.check_type(p)
-        if isinstance(p[1], NoneObj) or isinstance(p[3], NoneObj):
-            p[0] = True
-            return
-
-        if p[1] is None or p[3] is None:
-            p[0] = False
-            return
-        if p[2] == ">":
-            p[0] = p[1] > p[3]
-        elif p[2] == "<":
-            p[0] = p[1] < p[3]
+        | expression '<' expression
+        | expression GE expression
+        | expression LE expression"""
+        p[0] = ("cmp", p[2], p[1], p[3])
 
     def p_expression_uminus(self, p):
         "expression : '-' expression %prec UMINUS"
-        p[0] = -p[2]
-
-    def p_expression_ge(self, p):
-        "expression : expression GE expression"
-        self.check_type(p)
-        if isinstance(p[1], NoneObj) or isinstance(p[3], NoneObj):
-            p[0] = True
-            return
-
-        if p[1] is None or p[3] is None:
-            p[0] = False
-            return
-
-        p[0] = p[1] >= p[3]
-        self._output(f"{p[1]} {p[2]} {p[3]} {p[0]}")
-
-    def p_expression_le(self, p):
-        "expression : expression LE expression"
-        self.check_type(p)
-        if isinstance(p[1], NoneObj) or isinstance(p[3], NoneObj):
-            p[0] = True
-            return
-
-        if p[1] is None or p[3] is None:
-            p[0] = False
-            return
-
-        p[0] = p[1] <= p[3]
-        self._output(f"{p[1]} {p[2]} {p[3]} = {p[0]}")
+        p[0] = ("neg", p[2])
 
     def p_expression_eq(self, p):
-        "expression : expression EQ expression"
-        self.check_type(p)
-        if isinstance(p[1], NoneObj) or isinstance(p[3], NoneObj):
-            p[0] = True
-            return
-
-        if p[1] is None or p[3] is None:
-            p[0] = False
-            return
-
-        if isinstance(p[3], ReString):
-            if not isinstance(p[1], str):
-                p[0] = 0
-                return
-            p[0] = re.fullmatch(p[3].re_string, p[1], re.MULTILINE) is not None
-            self._output(f"{p[1]} {p[2]} {p[3].re_string} {p[0]}")
-        elif isinstance(p[1], ReString):
-            if not isinstance(p[3], str):
-                p[0] = 0
-                return
-            p[0] = re.fullmatch(p[1].re_string, p[3], re.MULTILINE) is not None
-            self._output(f"{p[1]} {p[2]} {p[3].re_string} {p[0]}")
-        else:
-            p[0] = p[1] == p[3]
-            self._output(f"{p[1]} {p[2]} {p[3]} {p[0]}")
-
-    def p_expression_ne(self, p):
-        "expression : expression NE expression"
-        self.check_type(p)
-        if isinstance(p[1], NoneObj) or isinstance(p[3], NoneObj):
-            p[0] = True
-            return
-
-        if p[1] is None or p[3] is None:
-            p[0] = False
-            return
-        if isinstance(p[3], ReString):
-            if not isinstance(p[1], str):
-                p[0] = 0
-                return
-            p[0] = re.fullmatch(p[3].re_string, p[1], re.MULTILINE) is None
-            self._output(f"{p[1]} {p[2]} {p[3].re_string} {p[0]}")
-        elif isinstance(p[1], ReString):
-            if not isinstance(p[3], str):
-                p[0] = 0
-                return
-            p[0] = re.fullmatch(p[1].re_string, p[3], re.MULTILINE) is None
-            self._output(f"{p[1]} {p[2]} {p[3].re_string} {p[0]}")
-        else:
-            p[0] = p[1] != p[3]
-            self._output(f"{p[1]} {p[2]} {p[3]} = {p[0]}")
+        """expression : expression EQ expression
+        | expression NE expression"""
+        p[0] = ("eq", p[2], p[1], p[3])
 
     def p_expression_group(self, p):
         "expression : '(' expression ')'"
@@ -269,50 +338,41 @@ class BaseFilter:
 
     def p_expression_number(self, p):
         "expression : NUMBER"
-        p[0] = p[1]
+        p[0] = ("const", p[1])
 
     def p_expression_time(self, p):
         "expression : TIME"
-        p[0] = p[1]
+        p[0] = ("const", p[1])
 
     def p_expression_byte(self, p):
         "expression : BYTE"
-        p[0] = p[1]
+        p[0] = ("const", p[1])
 
     def p_expression_name(self, p):
         "expression : NAME"
-        try:
-            p[0] = self.names[p[1]]
-        except Exception as e:
-            self._output(f"Undefined name '{p[1]}'")
-            raise ValueError(f"Undefined name {p[1]}") from e
+        if p[1] not in MetaData.FILTER_NAMES:
+            raise ValueError(f"Undefined name {p[1]}")
             # FIXME: not support not exist name
             # p[0] = NoneObj()
-
-    def p_expression_lor(self, p):
-        "expression : expression LOR expression"
-        p[0] = p[1] or p[3]
-
-    def p_expression_land(self, p):
-        "expression : expression LAND expression"
-        p[0] = p[1] and p[3]
+        p[0] = ("name", p[1], MetaData.FILTER_NAMES[p[1]])
 
     def p_expression_or(self, p):
-        "expression : expression OR expression"
-        p[0] = p[1] or p[3]
+        """expression : expression LOR expression
+        | expression OR expression"""
+        p[0] = ("or", p[1], p[3])
 
     def p_expression_and(self, p):
-        "expression : expression AND expression"
-        p[0] = p[1] and p[3]
+        """expression : expression LAND expression
+        | expression AND expression"""
+        p[0] = ("and", p[1], p[3])
 
     def p_expression_string(self, p):
         "expression : STRING"
-        p[0] = p[1]
+        p[0] = ("const", p[1])
 
     def p_expression_restring(self, p):
         "expression : RESTRING"
-        p[0] = ReString(p[1])
-        self._output("RESTRING : " + p[0].re_string)
+        p[0] = ("const", ReString(p[1]))
 
     # pylint: disable = C0116
     def p_error(self, p):
@@ -321,22 +381,87 @@ class BaseFilter:
 
         raise ValueError("Syntax error at EOF")
 
-    def check_type(self, p):
-        """Check filter type if is right"""
-        if p[1] is None or p[1] is NoneObj or p[3] is None or p[3] is NoneObj:
-            return
-        if isinstance(p[1], str):
-            if not isinstance(p[3], str) and not isinstance(p[3], ReString):
-                raise ValueError(f"{p[1]} is str but {p[3]} is not")
-        elif isinstance(p[1], int):
-            if not isinstance(p[3], int):
-                raise ValueError(f"{p[1]} is int but {p[3]} is not")
-        elif isinstance(p[1], bool):
-            if not isinstance(p[3], bool):
-                raise ValueError(f"{p[1]} is bool but {p[3]} is not")
-        elif isinstance(p[1], datetime):
-            if not isinstance(p[3], datetime):
-                raise ValueError(f"{p[1]} is datetime but {p[3]} is not")
+
+_COMPARE = {
+    ">": operator.gt,
+    "<": operator.lt,
+    ">=": operator.ge,
+    "<=": operator.le,
+}
+
+
+def _check_type(lhs: Any, rhs: Any):
+    """Check filter type if is right"""
+    if lhs is None or lhs is NoneObj or rhs is None or rhs is NoneObj:
+        return
+    if isinstance(lhs, str):
+        if not isinstance(rhs, str) and not isinstance(rhs, ReString):
+            raise ValueError(f"{lhs} is str but {rhs} is not")
+    elif isinstance(lhs, int):
+        if not isinstance(rhs, int):
+            raise ValueError(f"{lhs} is int but {rhs} is not")
+    elif isinstance(lhs, bool):
+        if not isinstance(rhs, bool):
+            raise ValueError(f"{lhs} is bool but {rhs} is not")
+    elif isinstance(lhs, datetime):
+        if not isinstance(rhs, datetime):
+            raise ValueError(f"{lhs} is datetime but {rhs} is not")
+
+
+@dataclass
+class FilterBounds:
+    """Ranges every message matched by a filter is in, None if unbounded"""
+
+    min_id: Optional[int] = None
+    max_id: Optional[int] = None
+    min_date: Optional[datetime] = None
+    max_date: Optional[datetime] = None
+
+
+# `const op name` is `name op' const`
+_FLIP_OP = {">": "<", "<": ">", ">=": "<=", "<=": ">=", "==": "=="}
+
+
+def _update_bounds(bounds: FilterBounds, op: str, attr: str, value: Any):
+    """Narrow bounds by `attr op value`"""
+    if attr == "message_id" and isinstance(value, int) and not isinstance(value, bool):
+        lower = value + 1 if op == ">" else value
+        upper = value - 1 if op == "<" else value
+        lower_name, upper_name = "min_id", "max_id"
+    elif attr == "message_date" and isinstance(value, datetime):
+        # message dates are in seconds, a strict bound is kept inclusive
+        lower = upper = value
+        lower_name, upper_name = "min_date", "max_date"
+    else:
+        return
+
+    if op in (">", ">=", "=="):
+        old = getattr(bounds, lower_name)
+        setattr(bounds, lower_name, lower if old is None else max(old, lower))
+    if op in ("<", "<=", "=="):
+        old = getattr(bounds, upper_name)
+        setattr(bounds, upper_name, upper if old is None else min(old, upper))
+
+
+def get_filter_bounds(node: tuple, bounds: FilterBounds = None) -> FilterBounds:
+    """Extract `message_id` and `message_date` ranges from the AST of a filter.
+
+    Only comparisons of `id`/`message_date` with a constant that are joined by
+    `and` at the top of the filter bound it, anything under an `or` may match
+    outside of them and is ignored.
+    """
+    bounds = bounds or FilterBounds()
+    kind = node[0]
+    if kind == "and":
+        get_filter_bounds(node[1], bounds)
+        get_filter_bounds(node[2], bounds)
+    elif kind in ("cmp", "eq") and node[1] in _FLIP_OP:
+        op, left, right = node[1], node[2], node[3]
+        if left[0] == "const" and right[0] == "name":
+            op, left, right = _FLIP_OP[op], right, left
+        if left[0] == "name" and right[0] == "const":
+            _update_bounds(bounds, op, left[2], right[1])
+    return bounds
 
 
 class Filter:
@@ -347,8 +472,15 @@ class Filter:
 
     def set_meta_data(self, meta_data: MetaData):
         """Set meta data for filter"""
-        self.filter.reset()
-        self.filter.names = meta_data.data()
+        self.filter.meta_data = meta_data
+
+    def compile(self, filter_str: str) -> Callable[[MetaData], Any]:
+        """Compile filter str, raise ValueError on syntax, name or regex error"""
+        return self.filter.compile(filter_str)
+
+    def get_bounds(self, filter_str: str) -> FilterBounds:
+        """Message id and date ranges of filter str, see `get_filter_bounds`"""
+        return get_filter_bounds(self.filter.parse(filter_str))
 
     def set_debug(self, debug: bool):
         """Set Filter Debug Model"""
@@ -357,7 +489,7 @@ class Filter:
     def exec(self, filter_str: str) -> bool:
         """Exec filter str"""
 
-        if self.filter.names:
+        if self.filter.meta_data:
             res = self.filter.exec(filter_str)
             if isinstance(res, bool):
                 return res
@@ -0,0 +1,10 @@
+# filter_lextab.py. This file automatically created by PLY (version 3.11). Don't edit!
+_tabversion   = '3.10'
+_lextokens    = set(('AND', 'BYTE', 'EQ', 'GE', 'LAND', 'LE', 'LOR', 'NAME', 'NE', 'NUMBER', 'OR', 'RESTRING', 'STRING', 'TIME'))
+_lexreflags   = 64
+_lexliterals  = '=+-*/()><'
+_lexstateinfo = {'INITIAL': 'inclusive'}
+_lexstatere   = {'INITIAL': [("(?P<t_BYTE>\\d{1,}(B|KB|MB|GB|TB))|(?P<t_TIME>\\d{4}-\\d{1,2}-\\d{1,2}[ ]{1,}\\d{1,2}:\\d{1,2}:\\d{1,2})|(?P<t_STRING>'.*?')|(?P<t_RESTRING>r'.*?')|(?P<t_NAME>[a-zA-Z_][a-zA-Z0-9_]*)|(?P<t_NUMBER>\\d+)|(?P<t_newline>\\n+)|(?P<t_LOR>\\|\\|)|(?P<t_EQ>==)|(?P<t_GE>>=)|(?P<t_LAND>&&)|(?P<t_LE><=)|(?P<t_NE>!=)", [None, ('t_BYTE', 'BYTE'), None, ('t_TIME', 'TIME'), ('t_STRING', 'STRING'), ('t_RESTRING', 'RESTRING'), ('t_NAME', 'NAME'), ('t_NUMBER', 'NUMBER'), ('t_newline', 'newline'), (None, 'LOR'), (None, 'EQ'), (None, 'GE'), (None, 'LAND'), (None, 'LE'), (None, 'NE')])]}
+_lexstateignore = {'INITIAL': ' \t'}
+_lexstateerrorf = {'INITIAL': 't_error'}
+_lexstateeoff = {}
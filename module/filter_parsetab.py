@@ -0,0 +1,54 @@
+
+# filter_parsetab.py
+# This file is automatically generated. Do not edit.
+# pylint: disable=W,C,R
+_tabversion = '3.10'
+
+_lr_method = 'LALR'
+
+_lr_signature = 'leftLORORleftLANDANDleftEQNEnonassoc><GELEleft+-left*/rightUMINUSAND BYTE EQ GE LAND LE LOR NAME NE NUMBER OR RESTRING STRING TIMEstatement : NAME "=" expressionstatement : expressionexpression : expression \'+\' expression\n        | expression \'-\' expression\n        | expression \'*\' expression\n        | expression \'/\' expressionexpression : expression \'>\' expression\n        | expression \'<\' expression\n        | expression GE expression\n        | expression LE expressionexpression : \'-\' expression %prec UMINUSexpression : expression EQ expression\n        | expression NE expressionexpression : \'(\' expression \')\'expression : NUMBERexpression : TIMEexpression : BYTEexpression : NAMEexpression : expression LOR expression\n        | expression OR expressionexpression : expression LAND expression\n        | expression AND expressionexpression : STRINGexpression : RESTRING'
+    
+_lr_action_items = {'NAME':([0,4,5,11,12,13,14,15,16,17,18,19,20,21,22,23,24,25,],[2,27,27,27,27,27,27,27,27,27,27,27,27,27,27,27,27,27,]),'-':([0,2,3,4,5,6,7,8,9,10,11,12,13,14,15,16,17,18,19,20,21,22,23,24,25,26,27,28,29,30,31,32,33,34,35,36,37,38,39,40,41,42,43,44,],[4,-18,13,4,4,-15,-16,-17,-23,-24,4,4,4,4,4,4,4,4,4,4,4,4,4,4,4,-11,-18,13,13,-3,-4,-5,-6,13,13,13,13,13,13,13,13,13,13,-14,]),'(':([0,4,5,11,12,13,14,15,16,17,18,19,20,21,22,23,24,25,],[5,5,5,5,5,5,5,5,5,5,5,5,5,5,5,5,5,5,]),'NUMBER':([0,4,5,11,12,13,14,15,16,17,18,19,20,21,22,23,24,25,],[6,6,6,6,6,6,6,6,6,6,6,6,6,6,6,6,6,6,]),'TIME':([0,4,5,11,12,13,14,15,16,17,18,19,20,21,22,23,24,25,],[7,7,7,7,7,7,7,7,7,7,7,7,7,7,7,7,7,7,]),'BYTE':([0,4,5,11,12,13,14,15,16,17,18,19,20,21,22,23,24,25,],[8,8,8,8,8,8,8,8,8,8,8,8,8,8,8,8,8,8,]),'STRING':([0,4,5,11,12,13,14,15,16,17,18,19,20,21,22,23,24,25,],[9,9,9,9,9,9,9,9,9,9,9,9,9,9,9,9,9,9,]),'RESTRING':([0,4,5,11,12,13,14,15,16,17,18,19,20,21,22,23,24,25,],[10,10,10,10,10,10,10,10,10,10,10,10,10,10,10,10,10,10,]),'$end':([1,2,3,6,7,8,9,10,26,27,29,30,31,32,33,34,35,36,37,38,39,40,41,42,43,44,],[0,-18,-2,-15,-16,-17,-23,-24,-11,-18,-1,-3,-4,-5,-6,-7,-8,-9,-10,-12,-13,-19,-20,-21,-22,-14,]),'=':([2,],[11,]),'+':([2,3,6,7,8,9,10,26,27,28,29,30,31,32,33,34,35,36,37,38,39,40,41,42,43,44,],[-18,12,-15,-16,-17,-23,-24,-11,-18,12,12,-3,-4,-5,-6,12,12,12,12,12,12,12,12,12,12,-14,]),'*':([2,3,6,7,8,9,10,26,27,28,29,30,31,32,33,34,35,36,37,38,39,40,41,42,43,44,],[-18,14,-15,-16,-17,-23,-24,-11,-18,14,14,14,14,-5,-6,14,14,14,14,14,14,14,14,14,14,-14,]),'/':([2,3,6,7,8,9,10,26,27,28,29,30,31,32,33,34,35,36,37,38,39,40,41,42,43,44,],[-18,15,-15,-16,-17,-23,-24,-11,-18,15,15,15,15,-5,-6,15,15,15,15,15,15,15,15,15,15,-14,]),'>':([2,3,6,7,8,9,10,26,27,28,29,30,31,32,33,34,35,36,37,38,39,40,41,42,43,44,],[-18,16,-15,-16,-17,-23,-24,-11,-18,16,16,-3,-4,-5,-6,None,None,None,None,16,16,16,16,16,16,-14,]),'<':([2,3,6,7,8,9,10,26,27,28,29,30,31,32,33,34,35,36,37,38,39,40,41,42,43,44,],[-18,17,-15,-16,-17,-23,-24,-11,-18,17,17,-3,-4,-5,-6,None,None,None,None,17,17,17,17,17,17,-14,]),'GE':([2,3,6,7,8,9,10,26,27,28,29,30,31,32,33,34,35,36,37,38,39,40,41,42,43,44,],[-18,18,-15,-16,-17,-23,-24,-11,-18,18,18,-3,-4,-5,-6,None,None,None,None,18,18,18,18,18,18,-14,]),'LE':([2,3,6,7,8,9,10,26,27,28,29,30,31,32,33,34,35,36,37,38,39,40,41,42,43,44,],[-18,19,-15,-16,-17,-23,-24,-11,-18,19,19,-3,-4,-5,-6,None,None,None,None,19,19,19,19,19,19,-14,]),'EQ':([2,3,6,7,8,9,10,26,27,28,29,30,31,32,33,34,35,36,37,38,39,40,41,42,43,44,],[-18,20,-15,-16,-17,-23,-24,-11,-18,20,20,-3,-4,-5,-6,-7,-8,-9,-10,-12,-13,20,20,20,20,-14,]),'NE':([2,3,6,7,8,9,10,26,27,28,29,30,31,32,33,34,35,36,37,38,39,40,41,42,43,44,],[-18,21,-15,-16,-17,-23,-24,-11,-18,21,21,-3,-4,-5,-6,-7,-8,-9,-10,-12,-13,21,21,21,21,-14,]),'LOR':([2,3,6,7,8,9,10,26,27,28,29,30,31,32,33,34,35,36,37,38,39,40,41,42,43,44,],[-18,22,-15,-16,-17,-23,-24,-11,-18,22,22,-3,-4,-5,-6,-7,-8,-9,-10,-12,-13,-19,-20,-21,-22,-14,]),'OR':([2,3,6,7,8,9,10,26,27,28,29,30,31,32,33,34,35,36,37,38,39,40,41,42,43,44,],[-18,23,-15,-16,-17,-23,-24,-11,-18,23,23,-3,-4,-5,-6,-7,-8,-9,-10,-12,-13,-19,-20,-21,-22,-14,]),'LAND':([2,3,6,7,8,9,10,26,27,28,29,30,31,32,33,34,35,36,37,38,39,40,41,42,43,44,],[-18,24,-15,-16,-17,-23,-24,-11,-18,24,24,-3,-4,-5,-6,-7,-8,-9,-10,-12,-13,24,24,-21,-22,-14,]),'AND':([2,3,6,7,8,9,10,26,27,28,29,30,31,32,33,34,35,36,37,38,39,40,41,42,43,44,],[-18,25,-15,-16,-17,-23,-24,-11,-18,25,25,-3,-4,-5,-6,-7,-8,-9,-10,-12,-13,25,25,-21,-22,-14,]),')':([6,7,8,9,10,26,27,28,30,31,32,33,34,35,36,37,38,39,40,41,42,43,44,],[-15,-16,-17,-23,-24,-11,-18,44,-3,-4,-5,-6,-7,-8,-9,-10,-12,-13,-19,-20,-21,-22,-14,]),}
+
+_lr_action = {}
+for _k, _v in _lr_action_items.items():
+   for _x,_y in zip(_v[0],_v[1]):
+      if not _x in _lr_action:  _lr_action[_x] = {}
+      _lr_action[_x][_k] = _y
+del _lr_action_items
+
+_lr_goto_items = {'statement':([0,],[1,]),'expression':([0,4,5,11,12,13,14,15,16,17,18,19,20,21,22,23,24,25,],[3,26,28,29,30,31,32,33,34,35,36,37,38,39,40,41,42,43,]),}
+
+_lr_goto = {}
+for _k, _v in _lr_goto_items.items():
+   for _x, _y in zip(_v[0], _v[1]):
+       if not _x in _lr_goto: _lr_goto[_x] = {}
+       _lr_goto[_x][_k] = _y
+del _lr_goto_items
+_lr_productions = [
+  ("S' -> statement","S'",1,None,None,None),
+  ('statement -> NAME = expression','statement',3,'p_statement_assign','filter.py',304),
+  ('statement -> expression','statement',1,'p_statement_expr','filter.py',309),
+  ('expression -> expression + expression','expression',3,'p_expression_binop','filter.py',313),
+  ('expression -> expression - expression','expression',3,'p_expression_binop','filter.py',314),
+  ('expression -> expression * expression','expression',3,'p_expression_binop','filter.py',315),
+  ('expression -> expression / expression','expression',3,'p_expression_binop','filter.py',316),
+  ('expression -> expression > expression','expression',3,'p_expression_comp','filter.py',320),
+  ('expression -> expression < expression','expression',3,'p_expression_comp','filter.py',321),
+  ('expression -> expression GE expression','expression',3,'p_expression_comp','filter.py',322),
+  ('expression -> expression LE expression','expression',3,'p_expression_comp','filter.py',323),
+  ('expression -> - expression','expression',2,'p_expression_uminus','filter.py',327),
+  ('expression -> expression EQ expression','expression',3,'p_expression_eq','filter.py',331),
+  ('expression -> expression NE expression','expression',3,'p_expression_eq','filter.py',332),
+  ('expression -> ( expression )','expression',3,'p_expression_group','filter.py',336),
+  ('expression -> NUMBER','expression',1,'p_expression_number','filter.py',340),
+  ('expression -> TIME','expression',1,'p_expression_time','filter.py',344),
+  ('expression -> BYTE','expression',1,'p_expression_byte','filter.py',348),
+  ('expression -> NAME','expression',1,'p_expression_name','filter.py',352),
+  ('expression -> expression LOR expression','expression',3,'p_expression_or','filter.py',360),
+  ('expression -> expression OR expression','expression',3,'p_expression_or','filter.py',361),
+  ('expression -> expression LAND expression','expression',3,'p_expression_and','filter.py',365),
+  ('expression -> expression AND expression','expression',3,'p_expression_and','filter.py',366),
+  ('expression -> STRING','expression',1,'p_expression_string','filter.py',370),
+  ('expression -> RESTRING','expression',1,'p_expression_restring','filter.py',374),
+]
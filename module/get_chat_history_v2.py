@@ -1,12 +1,19 @@
 """Rewrite pyrogram.get_chat_history"""
 
+import asyncio
+import heapq
+import time
+from collections import deque
 from datetime import datetime
-from typing import AsyncGenerator, Optional, Union
+from typing import AsyncGenerator, Deque, List, Optional, Union
 
 import pyrogram
 
 # pylint: disable = W0611
 from pyrogram import raw, types, utils
+from pyrogram.errors import FloodWait
+
+from module import metrics
 
 
 async def get_chunk_v2(
@@ -18,7 +25,8 @@ async def get_chunk_v2(
     max_id: int = 0,
     from_message_id: int = 0,
     from_date: datetime = utils.zero_datetime(),
-    reverse: bool = False
+    reverse: bool = False,
+    sleep_threshold: int = 60
 ):
     """get chunk"""
     from_message_id = from_message_id or (1 if reverse else 0)
@@ -36,7 +44,7 @@ async def get_chunk_v2(
                 min_id=0,
                 hash=0,
             ),
-            sleep_threshold=60,
+            sleep_threshold=sleep_threshold,
         ),
         replies=0,
     )
@@ -47,8 +55,223 @@ async def get_chunk_v2(
     return messages
 
 
+# `messages.Search` filter of each config media type
+MEDIA_SEARCH_FILTERS = {
+    "audio": raw.types.InputMessagesFilterMusic,
+    "photo": raw.types.InputMessagesFilterPhotos,
+    "video": raw.types.InputMessagesFilterVideo,
+    "document": raw.types.InputMessagesFilterDocument,
+    "voice": raw.types.InputMessagesFilterVoice,
+    "video_note": raw.types.InputMessagesFilterRoundVideo,
+    "animation": raw.types.InputMessagesFilterGif,
+}
+
+
+async def get_search_chunk(
+    *,
+    client: pyrogram.Client,
+    chat_id: Union[int, str],
+    search_filter: "raw.base.MessagesFilter",
+    limit: int = 0,
+    max_id: int = 0,
+    from_message_id: int = 0,
+    sleep_threshold: int = 60
+):
+    """get chunk of `messages.Search` in ascending order"""
+    messages = await utils.parse_messages(
+        client,
+        await client.invoke(
+            raw.functions.messages.Search(
+                peer=await client.resolve_peer(chat_id),
+                q="",
+                filter=search_filter,
+                min_date=0,
+                max_date=0,
+                offset_id=from_message_id or 1,
+                add_offset=-limit,
+                limit=limit,
+                max_id=max_id,
+                min_id=0,
+                hash=0,
+            ),
+            sleep_threshold=sleep_threshold,
+        ),
+        replies=0,
+    )
+
+    messages.reverse()
+
+    return messages
+
+
+class HistoryScanStat:
+    """Pages and messages fetched by a history scan"""
+
+    def __init__(self):
+        self.pages: int = 0
+        self.messages: int = 0
+        self.start_time: float = time.time()
+        self.fetch_time: float = 0
+
+    def add_page(self, messages: int, fetch_time: float):
+        """A page is fetched"""
+        self.pages += 1
+        self.messages += messages
+        self.fetch_time += fetch_time
+
+    def pages_per_second(self) -> float:
+        """Pages fetched per second since the scan started"""
+        elapsed = time.time() - self.start_time
+        return self.pages / elapsed if elapsed > 0 else 0.0
+
+    def messages_per_second(self) -> float:
+        """Messages fetched per second since the scan started"""
+        elapsed = time.time() - self.start_time
+        return self.messages / elapsed if elapsed > 0 else 0.0
+
+
+class FloodWaitLimiter:
+    """Shared by concurrent scanners, a FloodWait of one pauses all of them"""
+
+    def __init__(self):
+        self.resume_time: float = 0
+
+    async def wait(self):
+        """Sleep until the last FloodWait is over"""
+        while True:
+            delay = self.resume_time - time.time()
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+    def flood(self, seconds: int):
+        """A request got FloodWait"""
+        self.resume_time = max(self.resume_time, time.time() + seconds)
+
+
+class _HistoryPageFetcher:
+    """Fetch the pages of one history stream, by `messages.GetHistory`, or by
+    `messages.Search` in ascending order with `search_filter`"""
+
+    def __init__(
+        self,
+        client: pyrogram.Client,
+        chat_id: Union[int, str],
+        max_id: int = 0,
+        offset: int = 0,
+        offset_date: datetime = utils.zero_datetime(),
+        reverse: bool = False,
+        stat: HistoryScanStat = None,
+        flood_limiter: FloodWaitLimiter = None,
+        search_filter: "raw.base.MessagesFilter" = None,
+    ):
+        self.client = client
+        self.chat_id = chat_id
+        self.max_id = max_id
+        # `messages.GetHistory` only
+        self.history_args = {"offset": offset, "from_date": offset_date}
+        self.reverse = reverse or bool(search_filter)
+        self.stat = stat or HistoryScanStat()
+        self.flood_limiter = flood_limiter
+        self.search_filter = search_filter
+
+    async def fetch(self, offset_id: int, limit: int) -> Optional[list]:
+        """One page from `offset_id`, None if it got FloodWait and the shared
+        `flood_limiter` asks to retry later"""
+        if self.flood_limiter:
+            await self.flood_limiter.wait()
+        start = time.time()
+        sleep_threshold = 0 if self.flood_limiter else 60
+        try:
+            if self.search_filter:
+                messages = await get_search_chunk(
+                    client=self.client,
+                    chat_id=self.chat_id,
+                    search_filter=self.search_filter,
+                    limit=limit,
+                    max_id=self.max_id + 1 if self.max_id else 0,
+                    from_message_id=offset_id,
+                    sleep_threshold=sleep_threshold,
+                )
+            else:
+                messages = await get_chunk_v2(
+                    client=self.client,
+                    chat_id=self.chat_id,
+                    limit=limit,
+                    max_id=self.max_id + 1 if self.max_id else 0,
+                    from_message_id=offset_id,
+                    reverse=self.reverse,
+                    sleep_threshold=sleep_threshold,
+                    **self.history_args,
+                )
+        except FloodWait as e:
+            if not self.flood_limiter:
+                raise e
+            self.flood_limiter.flood(e.value)  # type: ignore
+            metrics.FLOOD_WAIT_SECONDS.inc(e.value, stage="scan")  # type: ignore
+            return None
+
+        self.stat.add_page(len(messages), time.time() - start)
+        metrics.HISTORY_PAGES.inc()
+        metrics.HISTORY_MESSAGES.inc(len(messages))
+        return messages
+
+    async def run(self, pages: asyncio.Queue, offset_id: int, total: int):
+        """Fetch pages into the queue until `total` messages, then put None,
+        an error is put into the queue for the consumer to raise"""
+        current = 0
+        limit = min(100, total)
+        try:
+            while current < total:
+                messages = await self.fetch(offset_id, limit)
+                if messages is None:
+                    continue
+                if not messages:
+                    break
+
+                offset_id = messages[-1].id + (1 if self.reverse else 0)
+                current += len(messages)
+                await pages.put(messages)
+        except Exception as e:
+            await pages.put(e)
+            return
+
+        await pages.put(None)
+
+
+async def _iter_history(
+    fetcher: _HistoryPageFetcher, offset_id: int, limit: int, prefetch: int
+) -> AsyncGenerator["types.Message", None]:
+    """Yield the messages of the pages fetched by a background task up to
+    `prefetch` pages ahead of the consumer"""
+    current = 0
+    total = limit or (1 << 31) - 1
+    pages: asyncio.Queue = asyncio.Queue(maxsize=max(prefetch, 1))
+    producer = asyncio.create_task(fetcher.run(pages, offset_id, total))
+
+    try:
+        while True:
+            messages = await pages.get()
+
+            if messages is None:
+                return
+
+            if isinstance(messages, Exception):
+                raise messages
+
+            for message in messages:
+                yield message
+
+                current += 1
+
+                if current >= total:
+                    return
+    finally:
+        producer.cancel()
+
+
 # pylint: disable = C0301
-async def get_chat_history_v2(
+def get_chat_history_v2(
     self: pyrogram.Client,
     chat_id: Union[int, str],
     limit: int = 0,
@@ -57,33 +280,194 @@ async def get_chat_history_v2(
     offset_id: int = 0,
     offset_date: datetime = utils.zero_datetime(),
     reverse: bool = False,
+    prefetch: int = 2,
+    stat: HistoryScanStat = None,
+) -> AsyncGenerator["types.Message", None]:
+    """Get messages from a chat history.
+
+    Pages are fetched by a background task up to `prefetch` pages ahead of the
+    consumer, so the next `messages.GetHistory` round trip overlaps with the
+    processing of the current page.
+    """
+    fetcher = _HistoryPageFetcher(
+        self, chat_id, max_id, offset, offset_date, reverse, stat
+    )
+    return _iter_history(fetcher, offset_id, limit, prefetch)
+
+
+async def get_latest_message_id(
+    client: pyrogram.Client, chat_id: Union[int, str]
+) -> int:
+    """Id of the newest message of a chat, 0 if the chat is empty"""
+    messages = await get_chunk_v2(client=client, chat_id=chat_id, limit=1)
+    return messages[0].id if messages else 0
+
+
+async def get_message_id_before(
+    client: pyrogram.Client, chat_id: Union[int, str], offset_date: datetime
+) -> int:
+    """Id of the newest message sent before `offset_date`, 0 if there is none"""
+    messages = await get_chunk_v2(
+        client=client, chat_id=chat_id, limit=1, from_date=offset_date
+    )
+    return messages[0].id if messages else 0
+
+
+async def get_chat_history_partitioned(
+    self: pyrogram.Client,
+    chat_id: Union[int, str],
+    max_id: int = 0,
+    offset_id: int = 0,
+    max_task: int = 4,
+    range_size: int = 1000,
+    stat: HistoryScanStat = None,
 ) -> Optional[AsyncGenerator["types.Message", None]]:
-    """Get messages from a chat history."""
-    current = 0
-    total = limit or (1 << 31) - 1
-    limit = min(100, total)
-
-    while True:
-        messages = await get_chunk_v2(
-            client=self,
-            chat_id=chat_id,
-            limit=limit,
-            offset=offset,
-            max_id=max_id + 1 if max_id else 0,
-            from_message_id=offset_id,
-            from_date=offset_date,
-            reverse=reverse,
+    """Get messages from `offset_id` to `max_id` in ascending order, with up to
+    `max_task` disjoint id ranges scanned concurrently.
+
+    Ranges are yielded in id order, scanners run at most `2 * max_task` ranges
+    ahead of the consumer so memory stays bounded.
+    """
+    offset_id = max(offset_id, 1)
+    if not max_id:
+        max_id = await get_latest_message_id(self, chat_id)
+
+    if max_id < offset_id:
+        return
+
+    max_task = max(max_task, 1)
+    stat = stat or HistoryScanStat()
+    flood_limiter = FloodWaitLimiter()
+    semaphore = asyncio.Semaphore(max_task)
+
+    async def _scan_range(first_id: int, last_id: int) -> list:
+        fetcher = _HistoryPageFetcher(
+            self,
+            chat_id,
+            max_id=last_id,
+            reverse=True,
+            stat=stat,
+            flood_limiter=flood_limiter,
         )
+        async with semaphore:
+            return [message async for message in _iter_history(fetcher, first_id, 0, 1)]
+
+    scans: Deque[asyncio.Task] = deque()
+    next_id = offset_id
+    try:
+        while scans or next_id <= max_id:
+            while next_id <= max_id and len(scans) < 2 * max_task:
+                last_id = min(next_id + range_size - 1, max_id)
+                scans.append(asyncio.create_task(_scan_range(next_id, last_id)))
+                next_id = last_id + 1
+
+            for message in await scans.popleft():
+                yield message
+    finally:
+        for scan in scans:
+            scan.cancel()
 
-        if not messages:
-            return
 
-        offset_id = messages[-1].id + (1 if reverse else 0)
+def get_media_search_filters(
+    media_types: List[str],
+) -> Optional[List["raw.base.MessagesFilter"]]:
+    """`messages.Search` filters of the media types, None if any type has none"""
+    if not media_types:
+        return None
 
-        for message in messages:
+    search_filters = []
+    for media_type in media_types:
+        if media_type not in MEDIA_SEARCH_FILTERS:
+            return None
+        search_filters.append(MEDIA_SEARCH_FILTERS[media_type]())
+    return search_filters
+
+
+def get_chat_media_history(
+    self: pyrogram.Client,
+    chat_id: Union[int, str],
+    search_filters: List["raw.base.MessagesFilter"],
+    limit: int = 0,
+    max_id: int = 0,
+    offset_id: int = 0,
+    stat: HistoryScanStat = None,
+) -> AsyncGenerator["types.Message", None]:
+    """Get the messages matching any of `search_filters` in ascending order.
+
+    Each filter is a `messages.Search` stream, the streams are merged by message
+    id and a message matched by several filters is yielded once.
+    """
+    stat = stat or HistoryScanStat()
+    flood_limiter = FloodWaitLimiter()
+    streams = [
+        _iter_history(
+            _HistoryPageFetcher(
+                self,
+                chat_id,
+                max_id=max_id,
+                stat=stat,
+                flood_limiter=flood_limiter,
+                search_filter=search_filter,
+            ),
+            offset_id,
+            0,
+            1,
+        )
+        for search_filter in search_filters
+    ]
+    return _merge_message_streams(streams, limit)
+
+
+async def _merge_message_streams(
+    streams: List[AsyncGenerator["types.Message", None]], limit: int = 0
+) -> AsyncGenerator["types.Message", None]:
+    """Merge the ascending streams by message id, yield each id once"""
+    total = limit or (1 << 31) - 1
+    try:
+        heap: list = []
+        for idx, stream in enumerate(streams):
+            async for message in stream:
+                heap.append((message.id, idx, message))
+                break
+        heapq.heapify(heap)
+
+        current = 0
+        last_id = None
+        while heap:
+            message_id, idx, message = heap[0]
+            async for next_message in streams[idx]:
+                heapq.heapreplace(heap, (next_message.id, idx, next_message))
+                break
+            else:
+                heapq.heappop(heap)
+
+            if message_id == last_id:
+                continue
+
+            last_id = message_id
             yield message
 
             current += 1
-
             if current >= total:
                 return
+    finally:
+        for stream in streams:
+            await stream.aclose()
+
+
+async def batch_messages(
+    messages_iter: AsyncGenerator["types.Message", None], batch_size: int = 100
+) -> AsyncGenerator[List["types.Message"], None]:
+    """Group the messages into lists of at most `batch_size` messages"""
+    batch: list = []
+    try:
+        async for message in messages_iter:
+            batch.append(message)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+
+        if batch:
+            yield batch
+    finally:
+        await messages_iter.aclose()
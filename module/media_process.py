@@ -0,0 +1,270 @@
+"""Post process downloaded media with ffmpeg"""
+
+import asyncio
+import os
+import shutil
+import time
+from concurrent.futures import Executor
+from typing import Optional, Tuple
+
+from loguru import logger
+
+FFMPEG = "ffmpeg"
+FFPROBE = "ffprobe"
+# containers which take the subtitle streams of any source as they are
+SUBTITLE_COPY_EXTS = (".mkv",)
+
+
+async def _run(*args: str) -> Tuple[int, bytes, bytes]:
+    """Run a command without blocking the event loop
+
+    Returns
+    -------
+    Tuple[int, bytes, bytes]
+        `(returncode, stdout, stderr)`
+    """
+    proc = await asyncio.create_subprocess_exec(
+        *args,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stdout, stderr = await proc.communicate()
+    return proc.returncode, stdout, stderr  # type: ignore
+
+
+async def has_audio_stream(path: str, ffprobe: str = FFPROBE) -> bool:
+    """If the media file has any audio stream, checked by ffprobe
+
+    Raises
+    ------
+    ValueError
+        If ffprobe failed to read the file
+    """
+    returncode, stdout, stderr = await _run(
+        ffprobe,
+        "-v",
+        "error",
+        "-select_streams",
+        "a",
+        "-show_entries",
+        "stream=index",
+        "-of",
+        "csv=p=0",
+        path,
+    )
+    if returncode:
+        raise ValueError(f"ffprobe {path} error: {stderr.decode(errors='ignore')}")
+    return bool(stdout.strip())
+
+
+async def add_silent_audio(path: str, out_path: str, ffmpeg: str = FFMPEG):
+    """Remux the video with a silent audio track, the video streams are copied
+    as is and only the silent track is encoded.
+
+    Data and attachment streams are dropped, most containers refuse to copy
+    them, and the subtitle streams are kept for `SUBTITLE_COPY_EXTS` only.
+
+    Raises
+    ------
+    ValueError
+        If ffmpeg failed
+    """
+    maps = ["-map", "0:v", "-map", "1:a"]
+    if os.path.splitext(out_path)[1].lower() in SUBTITLE_COPY_EXTS:
+        maps += ["-map", "0:s?"]
+    returncode, _, stderr = await _run(
+        ffmpeg,
+        "-y",
+        "-v",
+        "error",
+        "-i",
+        path,
+        "-f",
+        "lavfi",
+        "-i",
+        "anullsrc=channel_layout=stereo:sample_rate=44100",
+        *maps,
+        "-c",
+        "copy",
+        "-c:a",
+        "aac",
+        "-shortest",
+        out_path,
+    )
+    if returncode:
+        raise ValueError(f"ffmpeg {path} error: {stderr.decode(errors='ignore')}")
+
+
+def _proc_video_no_audio_moviepy(path: str, tmp_path: str, drop_no_audio_video: bool):
+    """Re-encode the whole video with a silent audio track by moviepy"""
+    # moviepy pulls in numpy, imageio and the ffmpeg lookup, only load it here
+    # pylint: disable = C0415
+    from moviepy.audio.io.AudioFileClip import AudioClip
+    from moviepy.video.io.VideoFileClip import VideoFileClip
+
+    with VideoFileClip(path, audio=False) as videoclip:
+        if videoclip.reader.infos.get("audio_found"):
+            return True
+
+        if drop_no_audio_video:
+            logger.warning(f"drop forward video without audio: {path}")
+            return False
+
+        def make_frame(_):
+            return [0.0, 0.0]
+
+        audioclip = AudioClip(make_frame, duration=videoclip.duration)
+        final_clip = videoclip.set_audio(audioclip)
+        final_clip.write_videofile(tmp_path, verbose=False, logger=None)
+    return None
+
+
+async def _proc_by_moviepy(
+    path: str, tmp_path: str, drop_no_audio_video: bool, executor: Executor = None
+) -> Optional[bool]:
+    """`_proc_video_no_audio_moviepy` in the executor"""
+    return await asyncio.get_running_loop().run_in_executor(
+        executor, _proc_video_no_audio_moviepy, path, tmp_path, drop_no_audio_video
+    )
+
+
+def _which(name: str) -> Optional[str]:
+    """Full path of an executable, None if it is not installed"""
+    return shutil.which(name)
+
+
+async def proc_video_no_audio(
+    path: str, drop_no_audio_video: bool = False, executor: Executor = None
+) -> bool:
+    """
+    Processes a video file without audio.
+
+    A silent audio track is added by an ffmpeg stream copy remux, moviepy is
+    only used to re-encode the video if ffmpeg or ffprobe is not installed or
+    the remux fails. If the re-encode fails as well, the video is kept as is.
+
+    Args:
+        path (str): The path of the video file to be processed.
+        drop_no_audio_video (bool, optional): If set to True,
+        drop the video file if no audio is found. Defaults to False.
+        executor (Executor, optional): Executor of the moviepy re-encode.
+        Defaults to the loop default executor.
+
+    Returns:
+        bool: True if the video was processed successfully, False otherwise.
+
+    Raises:
+        ValueError: If failed to process the video without audio.
+    """
+    ext = os.path.splitext(path)[1]
+    tmp_path = f"{os.path.splitext(path)[0]}_tmp{ext}"
+
+    ffmpeg, ffprobe = _which(FFMPEG), _which(FFPROBE)
+    if ffmpeg and ffprobe:
+        if await has_audio_stream(path, ffprobe):
+            return True
+
+        if drop_no_audio_video:
+            logger.warning(f"drop forward video without audio: {path}")
+            return False
+
+        try:
+            await add_silent_audio(path, tmp_path, ffmpeg)
+        except ValueError as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            logger.warning(f"{e}, re-encode it by moviepy")
+            try:
+                await _proc_by_moviepy(path, tmp_path, False, executor)
+            except Exception as moviepy_error:
+                logger.warning(
+                    f"Failed to re-encode {path} by moviepy: {moviepy_error}, "
+                    "keep the video without audio"
+                )
+                return True
+    else:
+        res = await _proc_by_moviepy(path, tmp_path, drop_no_audio_video, executor)
+        if res is not None:
+            return res
+
+    if os.path.exists(tmp_path):
+        os.replace(tmp_path, path)
+        return True
+
+    raise ValueError(f"Failed to process video without audio {path}")
+
+
+class MediaProcessStat:
+    """Timings of the finished media process jobs"""
+
+    def __init__(self):
+        self.jobs: int = 0
+        self.total_wait_time: float = 0
+        self.total_time: float = 0
+        self.max_time: float = 0
+
+    def add_job(self, wait_time: float, cost: float):
+        """Record a job which waited `wait_time` for a slot and ran `cost` seconds"""
+        self.jobs += 1
+        self.total_wait_time += wait_time
+        self.total_time += cost
+        self.max_time = max(self.max_time, cost)
+
+    def average_time(self) -> float:
+        """Average run time of a job"""
+        return self.total_time / self.jobs if self.jobs else 0
+
+
+class MediaProcessor:
+    """Post process stage of downloaded media.
+
+    At most `max_task` jobs run at once, callers of further jobs wait for a
+    free slot, so uploads slow down instead of piling up ffmpeg processes.
+    """
+
+    def __init__(self, executor: Executor = None, max_task: int = 2):
+        """
+        Parameters
+        ----------
+        executor: Executor
+            Executor of the blocking work, like the moviepy re-encode
+
+        max_task: int
+            Max jobs run at once
+        """
+        self.executor = executor
+        self.max_task = max_task
+        self.stat = MediaProcessStat()
+        # jobs waiting for a free slot and jobs running
+        self.waiting: int = 0
+        self.running: int = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def proc_video_no_audio(
+        self, path: str, drop_no_audio_video: bool = False
+    ) -> bool:
+        """`proc_video_no_audio` in the stage, see it for the details"""
+        if not self._semaphore:
+            self._semaphore = asyncio.Semaphore(max(self.max_task, 1))
+
+        start = time.time()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        begin = time.time()
+        self.running += 1
+        try:
+            return await proc_video_no_audio(path, drop_no_audio_video, self.executor)
+        finally:
+            self.running -= 1
+            self._semaphore.release()
+            cost = time.time() - begin
+            self.stat.add_job(begin - start, cost)
+            logger.debug(
+                f"processed video {path}: "
+                f"waited {begin - start:.2f}s, took {cost:.2f}s"
+            )
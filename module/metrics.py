@@ -0,0 +1,230 @@
+"""Prometheus metrics of the download, upload and scan pipeline.
+
+The metrics are served in the text exposition format by `/metrics` of the
+web ui, see `generate_latest`. Updating a metric is a dict lookup and an add,
+cheap enough for the download loop, reading it from the web thread only takes
+a snapshot of the values.
+"""
+
+import math
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_LabelValues = Tuple[str, ...]
+
+_registry: List["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    """Escape a label value"""
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    """A sample value, integers without the fraction"""
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    """`{name="value",...}`, empty without labels"""
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+class _Metric:
+    """Base of the metrics, registered when created"""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        _registry.append(self)
+
+    def _label_values(self, labels: Dict[str, str]) -> _LabelValues:
+        """The values of `labels` in the order of the label names"""
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} expects labels {self.labels}, got {labels}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        """`(suffix, labels, value)` of the samples"""
+        raise NotImplementedError
+
+    def expose(self) -> str:
+        """The metric in the text exposition format"""
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class Counter(_Metric):
+    """A value which only goes up"""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[_LabelValues, float] = {} if labels else {(): 0}
+
+    def inc(self, amount: float = 1, **labels: str):
+        """Add `amount`, `labels` are the values of all the label names"""
+        key = self._label_values(labels) if labels or self.labels else ()
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels: str) -> float:
+        """Current value"""
+        return self._values.get(self._label_values(labels), 0)
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        """One sample per label values"""
+        for key, value in list(self._values.items()):
+            yield "", _format_labels(self.labels, key), value
+
+
+class Gauge(_Metric):
+    """A value read from a function when it is collected"""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self._value: float = 0
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float):
+        """Set the value"""
+        self._value = value
+
+    def set_function(self, function: Callable[[], float]):
+        """Read the value from `function` instead"""
+        self._function = function
+
+    def get(self) -> float:
+        """Current value"""
+        if self._function:
+            try:
+                return self._function()
+            except Exception:
+                return math.nan
+        return self._value
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        """The current value"""
+        yield "", "", self.get()
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets"""
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        buckets: Sequence[float],
+        labels: Sequence[str] = (),
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # label values -> [bucket counts..., sum, count]
+        self._values: Dict[_LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels: str):
+        """Record a value"""
+        key = self._label_values(labels) if labels or self.labels else ()
+        values = self._values.get(key)
+        if values is None:
+            values = self._values[key] = [0] * (len(self.buckets) + 2)
+        values[bisect_left(self.buckets, value)] += 1
+        values[-2] += value
+        values[-1] += 1
+
+    @contextmanager
+    def time(self, **labels: str):
+        """Observe the seconds taken by the `with` block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def get_count(self, **labels: str) -> float:
+        """Number of observed values"""
+        values = self._values.get(self._label_values(labels) if labels else ())
+        return values[-1] if values else 0
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        """The buckets, the sum and the count per label values"""
+        for key, values in list(self._values.items()):
+            values = list(values)
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                yield "_bucket", _format_labels(
+                    self.labels + ("le",), key + (_format_value(bound),)
+                ), cumulative
+            labels = _format_labels(self.labels, key)
+            yield "_sum", labels, values[-2]
+            yield "_count", labels, values[-1]
+
+
+def generate_latest() -> str:
+    """All the metrics in the text exposition format"""
+    return "".join(metric.expose() for metric in list(_registry))
+
+
+DOWNLOAD_BYTES = Counter("tmd_download_bytes_total", "Bytes downloaded")
+DOWNLOAD_FILES = Counter(
+    "tmd_download_files_total", "Finished download tasks by status", ["status"]
+)
+DOWNLOAD_SECONDS = Histogram(
+    "tmd_download_seconds",
+    "Time to download a file",
+    [0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800],
+)
+DOWNLOAD_QUEUE_SIZE = Gauge("tmd_download_queue_size", "Messages waiting for download")
+UPLOAD_BYTES = Counter("tmd_upload_bytes_total", "Bytes uploaded by target", ["target"])
+UPLOAD_QUEUE_SIZE = Gauge(
+    "tmd_upload_queue_size", "Downloaded files waiting for or in upload"
+)
+FLOOD_WAIT_SECONDS = Counter(
+    "tmd_flood_wait_seconds_total", "Seconds of FloodWait by stage", ["stage"]
+)
+RETRIES = Counter(
+    "tmd_retries_total", "Retries by stage and exception", ["stage", "exception"]
+)
+HISTORY_PAGES = Counter("tmd_history_pages_total", "Chat history pages fetched")
+HISTORY_MESSAGES = Counter(
+    "tmd_history_messages_total", "Chat history messages fetched"
+)
+MEDIA_PROCESS_WAITING = Gauge(
+    "tmd_media_process_waiting", "Video post-processing jobs waiting for a slot"
+)
+MEDIA_PROCESS_RUNNING = Gauge(
+    "tmd_media_process_running", "Video post-processing jobs running"
+)
+FILTER_SECONDS = Histogram(
+    "tmd_filter_seconds",
+    "Time to evaluate the download filter, per message or per page",
+    [0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1],
+    ["mode"],
+)
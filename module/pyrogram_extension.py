@@ -13,8 +13,6 @@ from typing import Callable, Iterable, List, Optional, Union
 
 import pyrogram
 from loguru import logger
-from moviepy.audio.io.AudioFileClip import AudioClip
-from moviepy.video.io.VideoFileClip import VideoFileClip
 from pyrogram import types
 from pyrogram.client import Cache
 from pyrogram.file_id import (
@@ -27,6 +25,7 @@ from pyrogram.file_id import (
 )
 from pyrogram.mime_types import mime_types
 
+from module import metrics
 from module.app import (
     Application,
     DownloadStatus,
@@ -35,7 +34,7 @@ from module.app import (
     UploadProgressStat,
     UploadStatus,
 )
-from module.download_stat import get_download_result
+from module.download_stat import finish_transfer, get_active_transfers
 from module.language import Language, _t
 from module.send_media_group_v2 import cache_media, send_media_group_v2
 from utils.format import (
@@ -297,6 +296,10 @@ async def upload_telegram_chat_message(
 ) -> ForwardStatus:
     """See upload telegram_chat"""
     forward_status = ForwardStatus.FailedForward
+    # the file may be deleted after the upload
+    file_size = (
+        os.path.getsize(file_name) if file_name and os.path.exists(file_name) else 0
+    )
     max_attempts = 3
     for _ in range(1, max_attempts + 1):
         try:
@@ -305,6 +308,8 @@ async def upload_telegram_chat_message(
             )
             break
         except pyrogram.errors.exceptions.flood_420.FloodWait as wait_err:
+            metrics.FLOOD_WAIT_SECONDS.inc(wait_err.value * 2, stage="upload")
+            metrics.RETRIES.inc(stage="upload", exception="FloodWait")
             await asyncio.sleep(wait_err.value * 2)
             logger.warning(
                 "Upload Message[{}]: FlowWait {}", message.id, wait_err.value
@@ -313,6 +318,8 @@ async def upload_telegram_chat_message(
             logger.exception(f"Upload file {file_name} error: {e}")
             return ForwardStatus.FailedForward
 
+    if forward_status is ForwardStatus.SuccessForward and file_size:
+        metrics.UPLOAD_BYTES.inc(file_size, target="telegram")
     if forward_status != ForwardStatus.CacheForward:
         node.stat_forward(forward_status)
     return forward_status
@@ -511,7 +518,9 @@ async def forward_multi_media(
                 )
 
             if file_name and message.video:
-                if not proc_video_no_audio(file_name, app.drop_no_audio_video):
+                if not await app.media_processor.proc_video_no_audio(
+                    file_name, app.drop_no_audio_video
+                ):
                     node.upload_status[message.id] = UploadStatus.FailedUpload
             _media = await cache_media(
                 client,
@@ -602,9 +611,20 @@ def record_download_status(func):
 
         _download_cache[(node.chat_id, message.id)] = DownloadStatus.Downloading
 
-        status, file_name = await func(client, message, media_types, file_formats, node)
+        status = DownloadStatus.FailedDownload
+        try:
+            status, file_name = await func(
+                client, message, media_types, file_formats, node
+            )
+        finally:
+            finish_transfer(
+                node.chat_id,
+                message.id,
+                success=status is DownloadStatus.SuccessDownload,
+            )
 
         _download_cache[(node.chat_id, message.id)] = status
+        metrics.DOWNLOAD_FILES.inc(status=status.name)
 
         return status, file_name
 
@@ -703,31 +723,29 @@ async def _report_bot_status(
             )
 
         download_result_str = ""
-        download_result = get_download_result()
-        if node.chat_id in download_result:
-            messages = download_result[node.chat_id]
-            for idx, value in messages.items():
-                task_id = value["task_id"]
-                if task_id != node.task_id or value["down_byte"] == value["total_size"]:
-                    continue
-
-                temp_file_name = truncate_filename(
-                    os.path.basename(value["file_name"]), 10
-                )
-                progress = int(value["down_byte"] / value["total_size"] * 100)
-                download_result_str += (
-                    f" ├─ 🆔 {_t('Message ID')}: {idx}\n"
-                    f" │   ├─ 📁 : {temp_file_name}\n"
-                    f" │   ├─ 📏 : {format_byte(value['total_size'])}\n"
-                    f" │   ├─ ⏬ : {format_byte(value['download_speed'])}/s\n"
-                    f" │   └─ 📊 : [{create_progress_bar(progress)}]"
-                    f" ({progress}%)\n"
-                )
+        for value in get_active_transfers():
+            if (
+                value.chat_id != node.chat_id
+                or value.task_id != node.task_id
+                or value.is_finished()
+            ):
+                continue
 
-            if download_result_str:
-                download_result_str = (
-                    f"\n📥 {_t('Download Progresses')}:\n" + download_result_str
-                )
+            temp_file_name = truncate_filename(os.path.basename(value.file_name), 10)
+            progress = int(value.down_byte / value.total_size * 100)
+            download_result_str += (
+                f" ├─ 🆔 {_t('Message ID')}: {value.message_id}\n"
+                f" │   ├─ 📁 : {temp_file_name}\n"
+                f" │   ├─ 📏 : {format_byte(value.total_size)}\n"
+                f" │   ├─ ⏬ : {format_byte(value.download_speed)}/s\n"
+                f" │   └─ 📊 : [{create_progress_bar(progress)}]"
+                f" ({progress}%)\n"
+            )
+
+        if download_result_str:
+            download_result_str = (
+                f"\n📥 {_t('Download Progresses')}:\n" + download_result_str
+            )
 
         upload_result_str = ""
         for idx, value in node.upload_stat_dict.items():
@@ -976,47 +994,6 @@ async def update_upload_stat(
         node.upload_stat_dict[message_id] = upload_stat
 
 
-def proc_video_no_audio(path, drop_no_audio_video=False):
-    """
-    Processes a video file without audio.
-
-    Args:
-        path (str): The path of the video file to be processed.
-        drop_no_audio_video (bool, optional): If set to True,
-        drop the video file if no audio is found. Defaults to False.
-
-    Returns:
-        bool: True if the video was processed successfully, False otherwise.
-
-    Raises:
-        ValueError: If failed to process the video without audio.
-    """
-    ext = os.path.splitext(path)[1]
-    tmp_path = f"{os.path.splitext(path)[0]}_tmp{ext}"
-
-    with VideoFileClip(path, audio=False) as videoclip:
-        if videoclip.reader.infos.get("audio_found"):
-            return True
-
-        if drop_no_audio_video:
-            logger.warning(f"drop forward video without audio: {path}")
-            return False
-
-        def make_frame(_):
-            return [0.0, 0.0]
-
-        audioclip = AudioClip(make_frame, duration=videoclip.duration)
-        final_clip = videoclip.set_audio(audioclip)
-        final_clip.write_videofile(tmp_path, verbose=False, logger=None)
-
-    if os.path.exists(tmp_path):
-        os.remove(path)
-        os.rename(tmp_path, path)
-        return True
-
-    raise ValueError(f"Failed to process video without audio {path}")
-
-
 class HookSession(pyrogram.session.Session):
     """Hook Session"""
 
@@ -0,0 +1,355 @@
+"""Upload by the remote control API of a long-lived `rclone rcd`"""
+
+import asyncio
+import base64
+import json
+import os
+import secrets
+import socket
+import urllib.error
+import urllib.request
+from asyncio import subprocess
+from concurrent.futures import Executor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+# wait for the rc server to listen
+_START_TIMEOUT = 10
+# wait for more small files to join a batch
+_BATCH_WAIT = 0.5
+_POLL_INTERVAL = 0.1
+_MAX_POLL_INTERVAL = 1.0
+# the rc server is local, the proxy of the environment must not see the calls
+_opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+
+
+class RcloneRcdError(Exception):
+    """Error of an rc call or a failed job"""
+
+
+def _free_addr() -> str:
+    """A free local `host:port` for the rc server"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return f"127.0.0.1:{sock.getsockname()[1]}"
+
+
+def _escape_rule(name: str) -> str:
+    """Escape the glob chars of a file name in an rclone filter rule"""
+    for char in "\\*?[]{}":
+        name = name.replace(char, "\\" + char)
+    return name
+
+
+class _Batch:
+    """Small files of one local dir waiting to be copied to one remote dir"""
+
+    def __init__(self, future: asyncio.Future):
+        self.names: List[str] = []
+        self.done = future
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+# pylint: disable = R0902
+class RcloneRcd:
+    """One `rclone rcd` process shared by all the uploads.
+
+    A file bigger than `batch_file_size` is copied by an `operations/copyfile`
+    job, smaller files to the same remote dir are gathered for `_BATCH_WAIT`
+    seconds, at most `batch_size` of them, and copied by one `sync/copy` job.
+    The rc server only listens on localhost and gets a random password.
+    """
+
+    def __init__(
+        self,
+        rclone_path: str,
+        transfers: int = 4,
+        batch_size: int = 20,
+        batch_file_size: int = 10 * 1024 * 1024,
+        executor: Executor = None,
+        ignore_existing: bool = True,
+    ):
+        """
+        Parameters
+        ----------
+        rclone_path: str
+            rclone exe path
+
+        transfers: int
+            Files transferred in parallel by rclone
+
+        batch_size: int
+            Max files of a batch job, 1 to disable batching
+
+        batch_file_size: int
+            Files of at most this size are batched
+
+        executor: Executor
+            Executor of the blocking http calls
+
+        ignore_existing: bool
+            Skip the files which exist in the remote, even if they differ
+        """
+        self.rclone_path = rclone_path
+        self.transfers = transfers
+        self.batch_size = batch_size
+        self.batch_file_size = batch_file_size
+        self.executor = executor
+        self.ignore_existing = ignore_existing
+        self.addr: str = ""
+        self._auth: str = ""
+        self._proc: Optional[subprocess.Process] = None
+        self._start_lock: Optional[asyncio.Lock] = None
+        self._batches: Dict[Tuple[str, str], _Batch] = {}
+        # keep the background batch tasks referenced until they are done
+        self._tasks: set = set()
+
+    def is_running(self) -> bool:
+        """If the rcd process is alive"""
+        return self._proc is not None and self._proc.returncode is None
+
+    def _post(self, method: str, params: dict) -> dict:
+        """Blocking rc call"""
+        req = urllib.request.Request(
+            f"http://{self.addr}/{method}",
+            data=json.dumps(params).encode(),
+            headers={
+                "Content-Type": "application/json",
+                "Authorization": f"Basic {self._auth}",
+            },
+            method="POST",
+        )
+        try:
+            with _opener.open(req, timeout=30) as resp:
+                return json.loads(resp.read() or b"{}")
+        except urllib.error.HTTPError as e:
+            try:
+                error = json.loads(e.read() or b"{}").get("error", str(e))
+            except ValueError:
+                error = str(e)
+            raise RcloneRcdError(f"{method}: {error}") from e
+        except (urllib.error.URLError, OSError) as e:
+            raise RcloneRcdError(f"{method}: {e}") from e
+
+    async def call(self, method: str, params: dict = None) -> dict:
+        """Call an rc method, like `operations/copyfile`
+
+        Raises
+        ------
+        RcloneRcdError
+            If the call failed
+        """
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, self._post, method, params or {}
+        )
+
+    async def start(self):
+        """Start the rcd process if it is not running
+
+        Raises
+        ------
+        RcloneRcdError
+            If the rc server did not come up
+        """
+        if not self._start_lock:
+            self._start_lock = asyncio.Lock()
+
+        async with self._start_lock:
+            if self.is_running():
+                return
+
+            self.addr = _free_addr()
+            user, password = "tmd", secrets.token_urlsafe(16)
+            self._auth = base64.b64encode(f"{user}:{password}".encode()).decode()
+            # the credentials are passed by env, not visible in the process list
+            env = dict(os.environ, RCLONE_RC_USER=user, RCLONE_RC_PASS=password)
+            args = [f"--rc-addr={self.addr}", f"--transfers={self.transfers}"]
+            if self.ignore_existing:
+                args.append("--ignore-existing")
+            self._proc = await asyncio.create_subprocess_exec(
+                self.rclone_path,
+                "rcd",
+                *args,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                env=env,
+            )
+
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + _START_TIMEOUT
+            while True:
+                try:
+                    await self.call("rc/noop")
+                    break
+                except RcloneRcdError as e:
+                    if not self.is_running() or loop.time() > deadline:
+                        await self.stop()
+                        raise RcloneRcdError(f"rclone rcd failed to start: {e}") from e
+                    await asyncio.sleep(_POLL_INTERVAL)
+
+            logger.info(f"rclone rcd started at {self.addr}")
+
+    async def stop(self):
+        """Quit the rcd process"""
+        proc, self._proc = self._proc, None
+        if not proc or proc.returncode is not None:
+            return
+        try:
+            proc.terminate()
+            await asyncio.wait_for(proc.wait(), _START_TIMEOUT)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+        except ProcessLookupError:
+            pass
+
+    async def run_job(
+        self, method: str, params: dict, on_poll: Callable = None
+    ) -> dict:
+        """Run an rc method as an async job and wait for it to finish
+
+        Parameters
+        ----------
+        on_poll: Callable
+            Coroutine function called with the `core/stats` of the job while
+            it runs, an exception from it stops the job
+
+        Returns
+        -------
+        dict
+            The `job/status` of the finished job
+
+        Raises
+        ------
+        RcloneRcdError
+            If the job failed
+        """
+        await self.start()
+        job_id = (await self.call(method, dict(params, _async=True)))["jobid"]
+
+        interval = _POLL_INTERVAL
+        try:
+            while True:
+                status = await self.call("job/status", {"jobid": job_id})
+                if status.get("finished"):
+                    break
+                if on_poll:
+                    await on_poll(
+                        await self.call("core/stats", {"group": f"job/{job_id}"})
+                    )
+                await asyncio.sleep(interval)
+                interval = min(interval * 2, _MAX_POLL_INTERVAL)
+        except BaseException:
+            try:
+                await self.call("job/stop", {"jobid": job_id})
+            except RcloneRcdError:
+                pass
+            raise
+
+        if not status.get("success"):
+            raise RcloneRcdError(f"{method}: {status.get('error')}")
+        return status
+
+    async def copy_file(
+        self, local_file_path: str, remote_dir: str, on_poll: Callable = None
+    ):
+        """Copy a file into `remote_dir` by one job, see `run_job`"""
+        src_dir, name = os.path.split(os.path.abspath(local_file_path))
+        await self.run_job(
+            "operations/copyfile",
+            {
+                "srcFs": src_dir,
+                "srcRemote": name,
+                "dstFs": remote_dir,
+                "dstRemote": name,
+            },
+            on_poll,
+        )
+
+    async def _copy_batch(self, src_dir: str, remote_dir: str, batch: _Batch):
+        """Copy the files of the batch by one job and set its result"""
+        try:
+            await self.run_job(
+                "sync/copy",
+                {
+                    "srcFs": src_dir,
+                    "dstFs": remote_dir,
+                    "_filter": {
+                        "IncludeRule": [
+                            "/" + _escape_rule(name) for name in batch.names
+                        ]
+                    },
+                },
+            )
+            batch.done.set_result(None)
+        except Exception as e:
+            batch.done.set_exception(e)
+        finally:
+            # cancelled, the waiting uploads must not hang
+            if not batch.done.done():
+                batch.done.set_exception(RcloneRcdError("sync/copy: cancelled"))
+
+    def _flush(self, key: Tuple[str, str], batch: _Batch):
+        """Submit the batch if it is still gathering files"""
+        if batch.timer:
+            batch.timer.cancel()
+        if self._batches.get(key) is batch:
+            del self._batches[key]
+            task = asyncio.ensure_future(self._copy_batch(*key, batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def add_batch_file(
+        self, local_file_path: str, remote_dir: str
+    ) -> Optional[asyncio.Future]:
+        """Add a small file to the batch of its dirs without waiting for it.
+
+        A batch is copied `_BATCH_WAIT` seconds after its first file joined,
+        or at once when it has `batch_size` files.
+
+        Returns
+        -------
+        Optional[asyncio.Future]
+            Result of the batch job, None if the file is too big to batch
+        """
+        if (
+            self.batch_size <= 1
+            or os.path.getsize(local_file_path) > self.batch_file_size
+        ):
+            return None
+
+        src_dir, name = os.path.split(os.path.abspath(local_file_path))
+        key = (src_dir, remote_dir)
+        batch = self._batches.get(key)
+        if not batch:
+            loop = asyncio.get_running_loop()
+            batch = _Batch(loop.create_future())
+            batch.timer = loop.call_later(_BATCH_WAIT, self._flush, key, batch)
+            self._batches[key] = batch
+
+        batch.names.append(name)
+        if len(batch.names) >= self.batch_size:
+            self._flush(key, batch)
+
+        return batch.done
+
+    async def copy(
+        self, local_file_path: str, remote_dir: str, on_poll: Callable = None
+    ):
+        """Copy a file into `remote_dir`, small files are copied in batches,
+        see `add_batch_file`
+
+        `on_poll` is only called for the files copied by their own job.
+
+        Raises
+        ------
+        RcloneRcdError
+            If the copy failed
+        """
+        batch_done = self.add_batch_file(local_file_path, remote_dir)
+        if batch_done:
+            await asyncio.shield(batch_done)
+        else:
+            await self.copy_file(local_file_path, remote_dir, on_poll)
@@ -0,0 +1,247 @@
+"""Download state kept in an embedded SQLite database"""
+
+import sqlite3
+import threading
+import time
+from typing import Iterable, List, Optional, Union
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)",
+    "CREATE TABLE IF NOT EXISTS chat_progress ("
+    " chat_id TEXT PRIMARY KEY,"
+    " last_read_message_id INTEGER NOT NULL,"
+    " updated_at REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS message_status ("
+    " chat_id TEXT NOT NULL,"
+    " message_id INTEGER NOT NULL,"
+    " status INTEGER NOT NULL,"
+    " updated_at REAL NOT NULL,"
+    " PRIMARY KEY (chat_id, message_id)) WITHOUT ROWID",
+    "CREATE INDEX IF NOT EXISTS message_status_status"
+    " ON message_status (chat_id, status)",
+    "CREATE TABLE IF NOT EXISTS retry_ids ("
+    " chat_id TEXT NOT NULL,"
+    " message_id INTEGER NOT NULL,"
+    " PRIMARY KEY (chat_id, message_id)) WITHOUT ROWID",
+    "CREATE TABLE IF NOT EXISTS uploaded_files ("
+    " chat_id TEXT NOT NULL,"
+    " message_id INTEGER NOT NULL,"
+    " file_name TEXT NOT NULL,"
+    " uploaded_at REAL NOT NULL,"
+    " PRIMARY KEY (chat_id, message_id, file_name)) WITHOUT ROWID",
+)
+
+_MIGRATED_KEY = "migrated_app_data"
+
+
+class StateStore:
+    """Per chat progress, message status, retry ids and uploaded files.
+
+    Writes are grouped into one transaction which is committed after
+    `commit_count` writes or `commit_interval` seconds, or by `commit()`.
+    """
+
+    def __init__(
+        self, db_path: str, commit_interval: float = 5.0, commit_count: int = 100
+    ):
+        """
+        Parameters
+        ----------
+        db_path: str
+            Database file
+
+        commit_interval: float
+            Max seconds a write stays uncommitted
+
+        commit_count: int
+            Max writes in one transaction
+        """
+        self.db_path = db_path
+        self.commit_interval = commit_interval
+        self.commit_count = commit_count
+        self._lock = threading.Lock()
+        self._pending_write = 0
+        self._last_commit_time = time.time()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._lock:
+            for sql in _SCHEMA:
+                self._conn.execute(sql)
+            self._conn.commit()
+
+    def _write(self, sql: str, args: tuple):
+        """Execute a write and commit when the batch is full"""
+        with self._lock:
+            self._conn.execute(sql, args)
+            self._pending_write += 1
+            if (
+                self._pending_write >= self.commit_count
+                or time.time() - self._last_commit_time >= self.commit_interval
+            ):
+                self._commit()
+
+    def _commit(self):
+        """Commit without lock"""
+        self._conn.commit()
+        self._pending_write = 0
+        self._last_commit_time = time.time()
+
+    def commit(self):
+        """Commit all pending writes"""
+        with self._lock:
+            self._commit()
+
+    def close(self):
+        """Commit and close the database"""
+        with self._lock:
+            self._commit()
+            self._conn.close()
+
+    def set_message_status(
+        self, chat_id: Union[int, str], message_id: int, status: int
+    ):
+        """Set the download status of a message"""
+        self._write(
+            "INSERT OR REPLACE INTO message_status"
+            " (chat_id, message_id, status, updated_at) VALUES (?, ?, ?, ?)",
+            (str(chat_id), message_id, status, time.time()),
+        )
+
+    def get_unfinished_message_ids(
+        self, chat_id: Union[int, str], finished_status: Iterable[int]
+    ) -> List[int]:
+        """Get the retry ids and the messages finished without success of a chat,
+        except the ones whose last status is in `finished_status`"""
+        finished_status = list(finished_status)
+        placeholders = ", ".join("?" * len(finished_status))
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT message_id FROM message_status"
+                f" WHERE chat_id = ? AND status NOT IN ({placeholders})"
+                " UNION SELECT r.message_id FROM retry_ids r"
+                " LEFT JOIN message_status s"
+                " ON s.chat_id = r.chat_id AND s.message_id = r.message_id"
+                " WHERE r.chat_id = ?"
+                f" AND (s.status IS NULL OR s.status NOT IN ({placeholders}))"
+                " ORDER BY message_id",
+                (str(chat_id), *finished_status, str(chat_id), *finished_status),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def prune_message_status(self, chat_id: Union[int, str], last_read_message_id: int):
+        """Drop the message status up to the progress of a chat, call it after
+        `set_retry_ids` which keeps the unfinished ones of them"""
+        self._write(
+            "DELETE FROM message_status WHERE chat_id = ? AND message_id <= ?",
+            (str(chat_id), last_read_message_id),
+        )
+
+    def set_last_read_message_id(
+        self, chat_id: Union[int, str], last_read_message_id: int
+    ):
+        """Set the progress of a chat"""
+        self._write(
+            "INSERT OR REPLACE INTO chat_progress"
+            " (chat_id, last_read_message_id, updated_at) VALUES (?, ?, ?)",
+            (str(chat_id), last_read_message_id, time.time()),
+        )
+
+    def get_last_read_message_id(self, chat_id: Union[int, str]) -> Optional[int]:
+        """Get the progress of a chat, None if never saved"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT last_read_message_id FROM chat_progress WHERE chat_id = ?",
+                (str(chat_id),),
+            ).fetchone()
+        return row[0] if row else None
+
+    def get_retry_ids(self, chat_id: Union[int, str]) -> List[int]:
+        """Get the message ids to retry of a chat"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT message_id FROM retry_ids WHERE chat_id = ?"
+                " ORDER BY message_id",
+                (str(chat_id),),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def set_retry_ids(self, chat_id: Union[int, str], message_ids: Iterable[int]):
+        """Replace the message ids to retry of a chat"""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM retry_ids WHERE chat_id = ?", (str(chat_id),)
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO retry_ids (chat_id, message_id) VALUES (?, ?)",
+                [(str(chat_id), it) for it in message_ids],
+            )
+            self._commit()
+
+    def add_uploaded_file(
+        self, chat_id: Union[int, str], message_id: int, file_name: str
+    ):
+        """Record a file uploaded to the cloud drive"""
+        self._write(
+            "INSERT OR REPLACE INTO uploaded_files"
+            " (chat_id, message_id, file_name, uploaded_at) VALUES (?, ?, ?, ?)",
+            (str(chat_id), message_id, file_name, time.time()),
+        )
+
+    def is_uploaded_file(
+        self, chat_id: Union[int, str], message_id: int, file_name: str
+    ) -> bool:
+        """If the file is already uploaded"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM uploaded_files"
+                " WHERE chat_id = ? AND message_id = ? AND file_name = ?",
+                (str(chat_id), message_id, file_name),
+            ).fetchone()
+        return row is not None
+
+    def migrate_app_data(
+        self, app_data: dict, legacy_chat_id: Union[int, str] = None
+    ) -> bool:
+        """Import `ids_to_retry` of data.yaml once
+
+        Parameters
+        ----------
+        app_data: dict
+            Loaded data.yaml
+
+        legacy_chat_id: Union[int, str]
+            Chat of the top level `ids_to_retry` of old config
+
+        Returns
+        -------
+        bool
+            True if migrated by this call
+        """
+        with self._lock:
+            if self._conn.execute(
+                "SELECT 1 FROM meta WHERE key = ?", (_MIGRATED_KEY,)
+            ).fetchone():
+                return False
+
+            rows = []
+            if legacy_chat_id is not None:
+                for it in app_data.get("ids_to_retry") or []:
+                    rows.append((str(legacy_chat_id), it))
+
+            for chat in app_data.get("chat") or []:
+                if "chat_id" not in chat:
+                    continue
+                for it in chat.get("ids_to_retry") or []:
+                    rows.append((str(chat["chat_id"]), it))
+
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO retry_ids (chat_id, message_id) VALUES (?, ?)",
+                rows,
+            )
+            self._conn.execute(
+                "INSERT INTO meta (key, value) VALUES (?, ?)",
+                (_MIGRATED_KEY, str(time.time())),
+            )
+            self._commit()
+        return True
@@ -0,0 +1,95 @@
+"""Queue between the download workers and the upload workers"""
+
+import asyncio
+from typing import Any, Optional, Set, Tuple
+
+
+class UploadQueue:
+    """Downloaded files waiting for upload.
+
+    The files in the queue and the files being uploaded stay on the disk, so
+    `put` waits while they hold more than `max_pending_size` bytes, the
+    download workers slow down instead of filling up the temp storage. A file
+    is always let through if nothing is pending, even if it is bigger than
+    the limit. A file handed over to a delayed upload, like a zip group, stays
+    pending until that upload is finished, see `hold`.
+    """
+
+    def __init__(self, max_pending_size: int = 0):
+        """
+        Parameters
+        ----------
+        max_pending_size: int
+            Max bytes of the pending files, 0 is unlimited
+        """
+        self.max_pending_size = max_pending_size
+        # bytes and files put but not done yet
+        self.pending_size: int = 0
+        self.pending_count: int = 0
+        # files got but waiting for a delayed upload
+        self.held_count: int = 0
+        self._held_tasks: Set[asyncio.Task] = set()
+        self._queue: Optional[asyncio.Queue] = None
+        self._size_changed: Optional[asyncio.Condition] = None
+
+    def _init(self):
+        """Create the queue and the condition in the running loop"""
+        if not self._queue:
+            self._queue = asyncio.Queue()
+            self._size_changed = asyncio.Condition()
+
+    def _has_room(self, size: int) -> bool:
+        """If a file of `size` bytes can be put now"""
+        return (
+            not self.max_pending_size
+            or not self.pending_size
+            or self.pending_size + size <= self.max_pending_size
+        )
+
+    def empty(self) -> bool:
+        """If all the put files are done"""
+        return not self.pending_count
+
+    def only_held(self) -> bool:
+        """If all the pending files wait for a delayed upload"""
+        return self.pending_count == self.held_count
+
+    async def put(self, item: Any, size: int = 0):
+        """Put a file of `size` bytes, wait until there is room for it"""
+        self._init()
+        async with self._size_changed:  # type: ignore
+            await self._size_changed.wait_for(  # type: ignore
+                lambda: self._has_room(size)
+            )
+            self.pending_size += size
+            self.pending_count += 1
+        await self._queue.put((item, size))  # type: ignore
+
+    async def get(self) -> Tuple[Any, int]:
+        """Get `(item, size)`, call `done` with the size after upload"""
+        self._init()
+        return await self._queue.get()  # type: ignore
+
+    async def done(self, size: int = 0):
+        """The upload of a file of `size` bytes is finished"""
+        self._init()
+        async with self._size_changed:  # type: ignore
+            self.pending_size -= size
+            self.pending_count -= 1
+            self._size_changed.notify_all()  # type: ignore
+
+    def hold(self, upload: asyncio.Future, size: int = 0):
+        """The upload of a got file of `size` bytes goes on in the background,
+        it is done when `upload` is"""
+        self.held_count += 1
+        task = asyncio.ensure_future(self._done_after(upload, size))
+        self._held_tasks.add(task)
+        task.add_done_callback(self._held_tasks.discard)
+
+    async def _done_after(self, upload: asyncio.Future, size: int):
+        """Call `done` when the delayed upload is finished"""
+        try:
+            await asyncio.wait([upload])
+        finally:
+            self.held_count -= 1
+            await self.done(size)
@@ -1,20 +1,34 @@
 """web ui for media download"""
 
+import base64
+import json
 import logging
 import os
 import threading
+import time
+from typing import Optional, Tuple
 
-from flask import Flask, jsonify, render_template, request
+from flask import Flask, Response, jsonify, render_template, request
 from flask_login import LoginManager, UserMixin, login_required, login_user
 
 import utils
+from module import metrics
 from module.app import Application
 from module.download_stat import (
+    TRANSFER_SORT_KEYS,
     DownloadState,
-    get_download_result,
+    TransferStat,
+    get_active_transfers,
+    get_chat_download_stat,
+    get_completed_transfers,
+    get_download_snapshot,
     get_download_state,
     get_total_download_speed,
+    get_transfer_sort_key,
+    get_transfer_status,
+    query_transfers,
     set_download_state,
+    wait_download_events,
 )
 from utils.crypto import AesBase64
 from utils.format import format_byte
@@ -24,11 +38,21 @@ log.setLevel(logging.ERROR)
 
 _flask_app = Flask(__name__)
 
+# seconds the finished downloads stay in the downloading list
+_RECENT_COMPLETED_TIME = 10
+# seconds between the keep alive comments of the download events
+_EVENT_KEEP_ALIVE_TIME = 15
+# transfers in a page of /api/downloads
+_DEFAULT_PAGE_SIZE = 100
+_MAX_PAGE_SIZE = 1000
+
 _flask_app.secret_key = "tdl"
 _login_manager = LoginManager()
 _login_manager.login_view = "login"
 _login_manager.init_app(_flask_app)
 web_login_users: dict = {}
+# set by `init_web`, see `get_metrics`
+_metrics_without_login: bool = False
 deAesCrypt = AesBase64("1234123412ABCDEF", "ABCDEF1234123412")
 
 
@@ -82,6 +106,8 @@ def init_web(app: Application):
         None.
     """
     global web_login_users
+    global _metrics_without_login
+    _metrics_without_login = app.web_metrics_without_login
     if app.web_login_secret:
         web_login_users = {"root": app.web_login_secret}
     else:
@@ -147,10 +173,44 @@ def index():
 @login_required
 def get_download_speed():
     """Get download speed"""
-    return (
-        '{ "download_speed" : "'
-        + format_byte(get_total_download_speed())
-        + '/s" , "upload_speed" : "0.00 B/s" } '
+    return jsonify(
+        {
+            "download_speed": format_byte(get_total_download_speed()) + "/s",
+            "upload_speed": "0.00 B/s",
+        }
+    )
+
+
+@_flask_app.route("/download_events")
+@login_required
+def download_events():
+    """Server-Sent Events of the downloads.
+
+    The first event is a `snapshot` of the active downloads, then every tick
+    of the download stat sends a `diff` of the new, progressed and completed
+    ones, see `publish_download_event`. A new `snapshot` is sent when the
+    client falls too far behind.
+    """
+
+    def _stream():
+        seq, data = get_download_snapshot()
+        yield f"event: snapshot\ndata: {data}\n\n"
+        while True:
+            events = wait_download_events(seq, _EVENT_KEEP_ALIVE_TIME)
+            if events is None:
+                seq, data = get_download_snapshot()
+                yield f"event: snapshot\ndata: {data}\n\n"
+            elif not events:
+                # lets the server notice a closed connection
+                yield ": keep alive\n\n"
+            else:
+                seq = events[-1][0]
+                yield "".join(f"event: diff\ndata: {data}\n\n" for _, data in events)
+
+    return Response(
+        _stream(),
+        content_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
@@ -171,6 +231,20 @@ def web_set_download_state():
     return state
 
 
+def _get_metrics():
+    """Prometheus metrics"""
+    return Response(metrics.generate_latest(), content_type=metrics.CONTENT_TYPE)
+
+
+@_flask_app.route("/metrics")
+def get_metrics():
+    """Prometheus metrics, behind the login unless `web_metrics_without_login`
+    lets the scrapers in"""
+    if _metrics_without_login:
+        return _get_metrics()
+    return login_required(_get_metrics)()
+
+
 @_flask_app.route("/get_app_version")
 def get_app_version():
     """Get telegram_media_downloader version"""
@@ -186,37 +260,130 @@ def get_download_list():
 
     already_down = request.args.get("already_down") == "true"
 
-    download_result = get_download_result()
-    result = "["
-    for chat_id, messages in download_result.items():
-        for idx, value in messages.items():
-            is_already_down = value["down_byte"] == value["total_size"]
-
-            if already_down and not is_already_down:
-                continue
-
-            if result != "[":
-                result += ","
-            download_speed = format_byte(value["download_speed"]) + "/s"
-            result += (
-                '{ "chat":"'
-                + f"{chat_id}"
-                + '", "id":"'
-                + f"{idx}"
-                + '", "filename":"'
-                + os.path.basename(value["file_name"])
-                + '", "total_size":"'
-                + f'{format_byte(value["total_size"])}'
-                + '" ,"download_progress":"'
-            )
-            result += (
-                f'{round(value["down_byte"] / value["total_size"] * 100, 1)}'
-                + '" ,"download_speed":"'
-                + download_speed
-                + '" ,"save_path":"'
-                + value["file_name"].replace("\\", "/")
-                + '"}'
-            )
-
-    result += "]"
-    return result
+    if already_down:
+        transfers = [it for it in get_completed_transfers() if it.is_finished()]
+    else:
+        # the page drops a row once it saw it at 100%
+        transfers = list(get_active_transfers()) + list(
+            get_completed_transfers(time.time() - _RECENT_COMPLETED_TIME)
+        )
+
+    return jsonify(
+        [
+            {
+                "chat": f"{value.chat_id}",
+                "id": f"{value.message_id}",
+                "filename": os.path.basename(value.file_name),
+                "total_size": format_byte(value.total_size),
+                "download_progress": f"{_get_progress(value)}",
+                "download_speed": format_byte(value.download_speed) + "/s",
+                "save_path": value.file_name.replace("\\", "/"),
+            }
+            for value in transfers
+        ]
+    )
+
+
+def _get_progress(stat: TransferStat) -> float:
+    """Percent of the downloaded bytes"""
+    if not stat.total_size:
+        return 0
+    return round(stat.down_byte / stat.total_size * 100, 1)
+
+
+def _encode_cursor(key: Tuple[float, str, int]) -> str:
+    """The sort key of a transfer as an opaque cursor"""
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> Tuple[float, str, int]:
+    """The sort key in a cursor, see `get_transfer_sort_key`"""
+    value, chat_id, message_id = json.loads(base64.urlsafe_b64decode(cursor))
+    return (float(value), str(chat_id), int(message_id))
+
+
+def _get_int_arg(name: str) -> Optional[int]:
+    """An int query parameter, None if omitted"""
+    value = request.args.get(name)
+    return int(value) if value else None
+
+
+@_flask_app.route("/api/downloads")
+@login_required
+def api_downloads():
+    """
+    A page of the downloads.
+
+    Query parameters:
+    - status: `downloading`, `finished` or `failed`, all if omitted
+    - chat, task_id: filter by chat id or username, or by task id
+    - sort: `start_time` (default), `finish_time`, `speed`, `progress` or `size`
+    - order: `desc` (default) or `asc`
+    - limit: transfers in the page, 100 by default and at most 1000
+    - cursor: `next_cursor` of the previous page
+
+    Returns:
+    - `{"items": [...], "total": int, "next_cursor": str or null}`, or a 400
+      response with an `error` for invalid parameters. Filtered by chat, the
+      `chat_stat` totals of the completed downloads of the chat are added,
+      they are kept after the downloads leave the list.
+    """
+    status = request.args.get("status") or None
+    sort = request.args.get("sort", "start_time")
+    order = request.args.get("order", "desc")
+    try:
+        if status not in (None, "downloading", "finished", "failed"):
+            raise ValueError(f"unknown status {status}")
+        if sort not in TRANSFER_SORT_KEYS:
+            raise ValueError(f"unknown sort {sort}")
+        if order not in ("asc", "desc"):
+            raise ValueError(f"unknown order {order}")
+        chat_id = request.args.get("chat") or None
+        task_id = _get_int_arg("task_id")
+        limit = _get_int_arg("limit")
+        if limit is None:
+            limit = _DEFAULT_PAGE_SIZE
+        if not 0 < limit <= _MAX_PAGE_SIZE:
+            raise ValueError(f"limit must be in 1..{_MAX_PAGE_SIZE}")
+        cursor = request.args.get("cursor")
+        after = _decode_cursor(cursor) if cursor else None
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    transfers, total = query_transfers(
+        status, chat_id, task_id, sort, order == "desc", limit, after
+    )
+
+    next_cursor = None
+    if len(transfers) == limit:
+        next_cursor = _encode_cursor(get_transfer_sort_key(transfers[-1], sort))
+
+    result: dict = {
+        "items": [
+            {
+                "chat": it.chat_id,
+                "id": it.message_id,
+                "task_id": it.task_id,
+                "status": get_transfer_status(it),
+                "file_name": os.path.basename(it.file_name),
+                "save_path": it.file_name.replace("\\", "/"),
+                "total_size": it.total_size,
+                "down_byte": it.down_byte,
+                "progress": _get_progress(it),
+                "speed": it.download_speed,
+                "eta": it.eta() if not it.finish_time else None,
+                "start_time": it.start_time,
+                "finish_time": it.finish_time or None,
+            }
+            for it in transfers
+        ],
+        "total": total,
+        "next_cursor": next_cursor,
+    }
+    if chat_id is not None:
+        chat_stat = get_chat_download_stat(chat_id)
+        result["chat_stat"] = {
+            "completed_count": chat_stat.completed_count,
+            "completed_byte": chat_stat.completed_byte,
+        }
+    return jsonify(result)
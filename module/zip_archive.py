@@ -0,0 +1,123 @@
+"""Zip archives of the downloaded files, built in worker threads"""
+
+import os
+import subprocess
+import threading
+from typing import List, Optional
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile
+
+# deflate gains nothing on these but costs cpu time
+STORED_EXTS = {
+    ".jpg",
+    ".jpeg",
+    ".png",
+    ".gif",
+    ".webp",
+    ".heic",
+    ".mp4",
+    ".mkv",
+    ".mov",
+    ".avi",
+    ".webm",
+    ".m4v",
+    ".3gp",
+    ".mp3",
+    ".m4a",
+    ".aac",
+    ".ogg",
+    ".oga",
+    ".opus",
+    ".flac",
+    ".tgs",
+    ".zip",
+    ".rar",
+    ".7z",
+    ".gz",
+    ".bz2",
+    ".xz",
+    ".apk",
+}
+
+
+def get_compress_type(file_path: str) -> int:
+    """`ZIP_STORED` for already compressed media, `ZIP_DEFLATED` otherwise"""
+    if os.path.splitext(file_path)[-1].lower() in STORED_EXTS:
+        return ZIP_STORED
+    return ZIP_DEFLATED
+
+
+def write_zip(file, file_paths: List[str], flat: bool = False):
+    """Write the files into a zip archive
+
+    Parameters
+    ----------
+    file:
+        Path or writable file object, it can be unseekable
+
+    file_paths: List[str]
+        Files to archive
+
+    flat: bool
+        Archive the files by their base names instead of their paths
+    """
+    with ZipFile(file, "w") as zip_writer:
+        for file_path in file_paths:
+            zip_writer.write(
+                file_path,
+                os.path.basename(file_path) if flat else None,
+                compress_type=get_compress_type(file_path),
+            )
+
+
+class ZipStream:
+    """Zip archive streamed into the stdin of a process, like `rclone rcat`,
+    so it is never written to the disk. `pipe_to` blocks, run it in a worker
+    thread and read `written` from the loop for the progress.
+    """
+
+    def __init__(self, file_paths: List[str], flat: bool = False):
+        self.file_paths = file_paths
+        self.flat = flat
+        self.total_size: int = sum(os.path.getsize(it) for it in file_paths)
+        self.written: int = 0
+        self._raw = None
+        self._stop = threading.Event()
+
+    def stop(self):
+        """Abort the archive, `pipe_to` raises at the next write"""
+        self._stop.set()
+
+    def write(self, data: bytes) -> int:
+        """file object interface of `ZipFile`"""
+        if self._stop.is_set():
+            raise ValueError("zip stream stopped")
+        self._raw.write(data)  # type: ignore
+        self.written += len(data)
+        return len(data)
+
+    def flush(self):
+        """file object interface of `ZipFile`"""
+        self._raw.flush()  # type: ignore
+
+    def pipe_to(self, args: List[str]) -> Optional[int]:
+        """Run the process and write the archive to its stdin
+
+        Returns
+        -------
+        int
+            Return code of the process
+        """
+        with subprocess.Popen(
+            args,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        ) as proc:
+            try:
+                self._raw = proc.stdin
+                write_zip(self, self.file_paths, self.flat)
+                proc.stdin.close()  # type: ignore
+            except BaseException:
+                proc.kill()
+                raise
+            return proc.wait()
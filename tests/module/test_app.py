@@ -2,11 +2,18 @@
 
 import os
 import sys
+import tempfile
 import unittest
 from unittest import mock
 
 import module.app
-from module.app import Application, ChatDownloadConfig, DownloadStatus
+from module.app import (
+    Application,
+    ChatDownloadConfig,
+    DownloadStatus,
+    MessageWatermark,
+    TaskNode,
+)
 
 sys.path.append("..")  # Adds higher directory to python modules path.
 
@@ -60,12 +67,152 @@ class AppTestCase(unittest.TestCase):
             app.app_data["chat"][0]["ids_to_retry"],
         )
 
+    @mock.patch("module.app.os.replace")
     @mock.patch("__main__.__builtins__.open", new_callable=mock.mock_open)
     @mock.patch("module.app.yaml", autospec=True)
-    def test_update_config(self, mock_yaml, mock_open):
+    def test_update_config(self, mock_yaml, mock_open, mock_replace):
         app = Application("", "")
         app.config_file = "config_test.yaml"
         app.app_data_file = "data_test.yaml"
         app.config["chat"] = [{"chat_id": 123, "last_read_message_id": 0}]
         app.update_config()
-        mock_open.assert_called_with("data_test.yaml", "w", encoding="utf-8")
+        mock_open.assert_called_with("data_test.yaml.tmp", "w", encoding="utf-8")
+        mock_replace.assert_called_with("data_test.yaml.tmp", "data_test.yaml")
+
+    def test_state_store(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            app = Application("", os.path.join(temp_dir, "data.yaml"))
+            app.chat_download_config[123] = ChatDownloadConfig()
+            app.chat_download_config[123].last_read_message_id = 5
+            app.app_data = {"chat": [{"chat_id": 123, "ids_to_retry": [3]}]}
+            app.config["chat"] = [{"chat_id": 123, "last_read_message_id": 5}]
+            app.load_state_store()
+            self.assertEqual(app.chat_download_config[123].ids_to_retry, [3])
+
+            node = TaskNode(123)
+            app.set_download_id(node, 6, DownloadStatus.SuccessDownload)
+            app.set_download_id(node, 7, DownloadStatus.FailedDownload)
+            app.set_download_id(node, 8, DownloadStatus.SkipDownload)
+            app.set_download_id(node, 3, DownloadStatus.SuccessDownload)
+            # crash before update_config
+            app.state_store.close()
+
+            app = Application("", os.path.join(temp_dir, "data.yaml"))
+            app.chat_download_config[123] = ChatDownloadConfig()
+            app.chat_download_config[123].last_read_message_id = 5
+            app.load_state_store()
+            self.assertEqual(app.chat_download_config[123].ids_to_retry, [7])
+            self.assertEqual(app.chat_download_config[123].last_read_message_id, 9)
+            self.assertTrue(os.path.exists(os.path.join(temp_dir, "data.db")))
+
+            # the status up to the watermark moves into the retry ids
+            app.config["chat"] = [{"chat_id": 123, "last_read_message_id": 5}]
+            app.update_config(False)
+            self.assertEqual(app.state_store.get_retry_ids(123), [7])
+            app.state_store.commit()
+            self.assertFalse(
+                app.state_store._conn.execute(
+                    "SELECT message_id FROM message_status"
+                ).fetchall()
+            )
+            self.assertEqual(
+                app.state_store.get_unfinished_message_ids(123, [1, 2]), [7]
+            )
+            app.state_store.close()
+
+    @mock.patch("module.app.Application.update_config")
+    def test_checkpoint(self, mock_update_config):
+        app = Application("", "")
+        app.checkpoint_interval = 60
+        app.checkpoint_task_count = 2
+        app.chat_download_config[123] = ChatDownloadConfig()
+        self.assertFalse(app.need_checkpoint())
+
+        node = TaskNode(123)
+        app.set_download_id(node, 1, DownloadStatus.SuccessDownload)
+        self.assertFalse(app.need_checkpoint())
+        app.set_download_id(node, 2, DownloadStatus.SuccessDownload)
+        self.assertTrue(app.need_checkpoint())
+
+        app.save_checkpoint()
+        mock_update_config.assert_called_once()
+        self.assertFalse(app.need_checkpoint())
+
+        # interval passed
+        app.set_download_id(node, 3, DownloadStatus.SuccessDownload)
+        app._last_checkpoint_time -= 60
+        self.assertTrue(app.need_checkpoint())
+
+    def test_dump_yaml(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_name = os.path.join(temp_dir, "data.yaml")
+            module.app._dump_yaml({"chat": [{"chat_id": 1}]}, file_name)
+            self.assertFalse(os.path.exists(file_name + ".tmp"))
+            with open(file_name, encoding="utf-8") as f:
+                self.assertIn("chat_id: 1", f.read())
+
+    def test_message_watermark(self):
+        watermark = MessageWatermark(9)
+        self.assertEqual(watermark.value(), 9)
+
+        # retry ids of the last run are below the base
+        watermark.add(3)
+        for it in (10, 12, 15, 16):
+            watermark.add(it)
+        self.assertEqual(watermark.value(), 9)
+
+        watermark.done(12)
+        watermark.done(15)
+        self.assertEqual(watermark.value(), 9)
+        watermark.done(3)
+        watermark.done(10)
+        self.assertEqual(watermark.value(), 15)
+        # filtered message
+        watermark.done(17)
+        self.assertEqual(watermark.value(), 15)
+        watermark.done(16)
+        self.assertEqual(watermark.value(), 17)
+
+    def test_set_download_id_watermark(self):
+        app = Application("", "")
+        app.chat_download_config[123] = ChatDownloadConfig()
+        app.chat_download_config[123].watermark = MessageWatermark(4)
+        app.chat_download_config[123].finish_task = 0
+        app.config["chat"] = [{"chat_id": 123, "last_read_message_id": 5}]
+        node = app.chat_download_config[123].node
+        node.chat_id = 123
+        for it in (5, 6, 7, 8):
+            node.download_status[it] = DownloadStatus.Downloading
+            app.set_download_pending(node, it)
+
+        node.download_status[6] = DownloadStatus.FailedDownload
+        app.set_download_id(node, 6, DownloadStatus.FailedDownload)
+        node.download_status[8] = DownloadStatus.SuccessDownload
+        app.set_download_id(node, 8, DownloadStatus.SuccessDownload)
+        self.assertEqual(app.chat_download_config[123].last_read_message_id, 4)
+
+        node.download_status[5] = DownloadStatus.SkipDownload
+        app.set_download_id(node, 5, DownloadStatus.SkipDownload)
+        self.assertEqual(app.chat_download_config[123].last_read_message_id, 6)
+
+        # killed while 7 is still downloading
+        app.update_config(False)
+        self.assertEqual(app.config["chat"][0]["last_read_message_id"], 7)
+        self.assertEqual(app.app_data["chat"][0]["ids_to_retry"], [6])
+
+    def test_assign_config_filter(self):
+        config = {
+            "api_id": 1,
+            "api_hash": "hash",
+            "media_types": ["video"],
+            "file_formats": {"video": ["all"]},
+            "chat": [{"chat_id": 123, "download_filter": "caption == r'.*abc'"}],
+        }
+        app = Application("", "")
+        self.assertTrue(app.assign_config(config))
+
+        config["chat"].append({"chat_id": 456, "download_filter": "caption == r'(abc'"})
+        app = Application("", "")
+        with self.assertRaises(ValueError) as e:
+            app.assign_config(config)
+        self.assertIn("download_filter of 456 error", str(e.exception))
@@ -0,0 +1,136 @@
+"""test batch filter"""
+
+import sys
+import unittest
+from datetime import datetime
+from unittest import mock
+
+from module.batch_filter import BatchFilter
+from module.filter import Filter
+from utils.meta_data import MetaData
+
+sys.path.append("..")  # Adds higher directory to python modules path.
+
+
+def _metas():
+    return [
+        MetaData(
+            datetime(2022, 3, 4, 10, 0, 0),
+            1,
+            "#apple hello",
+            1024 * 1024 * 5,
+            1920,
+            1080,
+            "apple.mp4",
+            35,
+            "video",
+            "mp4",
+            100,
+            "alice",
+        ),
+        MetaData(
+            datetime(2022, 3, 6, 10, 0, 0),
+            2,
+            None,
+            1024 * 1024 * 50,
+            None,
+            None,
+            "banana.zip",
+            None,
+            "document",
+            "zip",
+            None,
+            None,
+            1,
+        ),
+        MetaData(
+            datetime(2022, 3, 9, 10, 0, 0),
+            3,
+            "#banana",
+            1024,
+            640,
+            480,
+            None,
+            5,
+            "photo",
+            "jpg",
+            200,
+            "bob",
+        ),
+        MetaData(message_id=4),
+    ]
+
+
+class BatchFilterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.filter = Filter()
+        self.batch_filter = BatchFilter(self.filter)
+
+    def _row_exec(self, filter_str, metas):
+        res = []
+        for meta in metas:
+            self.filter.set_meta_data(meta)
+            res.append(self.filter.exec(filter_str))
+        return res
+
+    def test_same_as_row_filter(self):
+        metas = _metas()
+        filter_strs = [
+            "id > 1",
+            "id >= 2 && id <= 3",
+            "file_size > 1MB and media_duration < 60",
+            "message_date > 2022-03-05 00:00:00 && message_date < 2022-03-10 00:00:00",
+            "caption == r'#apple.*'",
+            "caption != r'#apple.*'",
+            "file_name == 'apple.mp4' || media_type == 'photo'",
+            "media_type != 'video'",
+            "media_width > media_height",
+            "sender_name > 'b'",
+            "reply_to_message_id == 1",
+            "file_extension == r'mp4|jpg' and (id < 2 or sender_id == 200)",
+            "1 == 1",
+            "1 == 1 && id == 3",
+            # fall back to the row filter
+            "id + 1 > 3",
+            "-id < -2",
+            "id",
+            "id * 2 > 5 || id == 1",
+        ]
+        for filter_str in filter_strs:
+            self.assertEqual(
+                self.batch_filter.exec(filter_str, metas),
+                self._row_exec(filter_str, metas),
+                filter_str,
+            )
+
+    def test_vectorized(self):
+        metas = _metas()
+        with mock.patch.object(self.filter, "exec") as row_exec:
+            self.assertEqual(
+                self.batch_filter.exec("caption == r'#.*' && id < 3", metas),
+                [True, False, False, False],
+            )
+            self.assertEqual(self.batch_filter.exec("id > 1", []), [])
+            row_exec.assert_not_called()
+
+        self.assertIsNone(self.batch_filter.compile("id - 1 > 1"))
+        self.assertIsNotNone(self.batch_filter.compile("id > 1"))
+
+    def test_fallback(self):
+        metas = _metas()
+        # a page with unexpected value types
+        metas[0].media_file_size = "5MB"
+        with self.assertRaises(ValueError):
+            self.batch_filter.exec("file_size > 1MB", metas)
+
+        # static type error is raised by the row filter
+        with self.assertRaises(ValueError):
+            self.batch_filter.exec("file_size == 'abc'", _metas())
+
+        with self.assertRaises(ValueError):
+            self.batch_filter.exec("unknown > 1", _metas())
+
+        with mock.patch("module.batch_filter._import_numpy", return_value=None):
+            self.assertEqual(
+                self.batch_filter.exec("id > 2", _metas()), [False, False, True, True]
+            )
@@ -0,0 +1,187 @@
+"""test chunk download"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import pyrogram
+
+from module.chunk_download import (
+    CHUNK_SIZE,
+    ChunkDownloader,
+    ChunkMap,
+    group_segments,
+    split_segments,
+)
+
+sys.path.append("..")  # Adds higher directory to python modules path.
+
+
+class MockClient:
+    def __init__(self, data: bytes, short_part: int = -1):
+        self.data = data
+        self.short_part = short_part
+        self.requests: list = []
+
+    async def get_file(self, file_id, file_size, limit, offset):
+        self.requests.append((offset, limit))
+        for part in range(offset, offset + limit):
+            chunk = self.data[part * CHUNK_SIZE : (part + 1) * CHUNK_SIZE]
+            if part == self.short_part:
+                return
+            await asyncio.sleep(0)
+            yield chunk
+
+
+class ChunkDownloadTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.loop = asyncio.new_event_loop()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.close()
+
+    def test_split_segments(self):
+        self.assertEqual(split_segments(1), [(0, 1)])
+        self.assertEqual(split_segments(CHUNK_SIZE * 8), [(0, 8)])
+        self.assertEqual(split_segments(CHUNK_SIZE * 20 + 1), [(0, 8), (8, 8), (16, 5)])
+
+    @mock.patch("module.chunk_download.FileId")
+    def test_download(self, _):
+        data = os.urandom(CHUNK_SIZE * 19 + 123)
+        client = MockClient(data)
+        progress = mock.AsyncMock()
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_name = os.path.join(temp_dir, "sub", "video.mp4")
+            downloader = ChunkDownloader(
+                client, "", len(data), file_name, 3, progress, ("arg",)
+            )
+            res = self.loop.run_until_complete(downloader.download())
+
+            self.assertEqual(res, file_name)
+            with open(file_name, "rb") as f:
+                self.assertEqual(f.read(), data)
+            self.assertFalse(os.path.exists(file_name + ".temp"))
+
+        self.assertEqual(sorted(client.requests), [(0, 8), (8, 8), (16, 4)])
+        progress.assert_awaited_with(len(data), len(data), "arg")
+
+    @mock.patch("module.chunk_download.FileId")
+    def test_short_segment(self, _):
+        data = os.urandom(CHUNK_SIZE * 10)
+        client = MockClient(data, short_part=9)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_name = os.path.join(temp_dir, "video.mp4")
+            downloader = ChunkDownloader(client, "", len(data), file_name, 2)
+            with self.assertRaises(
+                pyrogram.errors.exceptions.bad_request_400.BadRequest
+            ):
+                self.loop.run_until_complete(downloader.download())
+
+            self.assertFalse(os.path.exists(file_name))
+
+    def test_group_segments(self):
+        self.assertEqual(group_segments([]), [])
+        self.assertEqual(group_segments([0, 1, 2, 5, 6, 9]), [(0, 3), (5, 2), (9, 1)])
+        self.assertEqual(group_segments(list(range(10)), 4), [(0, 4), (4, 4), (8, 2)])
+
+    def test_chunk_map(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "1_2_abc.temp.chunk")
+            chunk_map = ChunkMap(path, (1, 2, "abc"), CHUNK_SIZE * 9 + 10)
+            self.assertEqual(chunk_map.missing_parts(), list(range(10)))
+            self.assertFalse(chunk_map.load())
+
+            chunk_map.set_done(0)
+            chunk_map.set_done(9)
+            chunk_map.save()
+
+            loaded = ChunkMap(path, (1, 2, "abc"), CHUNK_SIZE * 9 + 10)
+            self.assertTrue(loaded.load())
+            self.assertEqual(loaded.missing_parts(), list(range(1, 9)))
+            self.assertEqual(loaded.done_size(), CHUNK_SIZE + 10)
+
+            # another file
+            self.assertFalse(ChunkMap(path, (1, 2, "abd"), CHUNK_SIZE * 9 + 10).load())
+            self.assertFalse(ChunkMap(path, (1, 2, "abc"), CHUNK_SIZE * 9).load())
+
+            loaded.remove()
+            self.assertFalse(os.path.exists(path))
+
+    @mock.patch("module.chunk_download.FileId")
+    def test_resume(self, _):
+        data = os.urandom(CHUNK_SIZE * 9 + 10)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_name = os.path.join(temp_dir, "1 - video.mp4")
+            client = MockClient(data, short_part=9)
+            downloader = ChunkDownloader(
+                client, "", len(data), file_name, 1, resume_key=(1, 2, "abc")
+            )
+            with self.assertRaises(
+                pyrogram.errors.exceptions.bad_request_400.BadRequest
+            ):
+                self.loop.run_until_complete(downloader.download())
+
+            temp_file_name = os.path.join(temp_dir, "1_2_abc.temp")
+            self.assertTrue(os.path.exists(temp_file_name))
+            self.assertTrue(os.path.exists(temp_file_name + ".chunk"))
+
+            # the file name changes in next run, but the message is the same
+            file_name = os.path.join(temp_dir, "2 - video.mp4")
+            client = MockClient(data)
+            progress = mock.AsyncMock()
+            downloader = ChunkDownloader(
+                client,
+                "",
+                len(data),
+                file_name,
+                4,
+                progress,
+                resume_key=(1, 2, "abc"),
+            )
+            self.assertEqual(
+                self.loop.run_until_complete(downloader.download()), file_name
+            )
+            self.assertEqual(client.requests, [(9, 1)])
+            progress.assert_awaited_once_with(len(data), len(data))
+
+            with open(file_name, "rb") as f:
+                self.assertEqual(f.read(), data)
+            self.assertFalse(os.path.exists(temp_file_name))
+            self.assertFalse(os.path.exists(temp_file_name + ".chunk"))
+
+    @mock.patch("module.chunk_download.FileId")
+    def test_throttled_chunk_map_save(self, _):
+        data = os.urandom(CHUNK_SIZE * 9 + 10)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_name = os.path.join(temp_dir, "video.mp4")
+            downloader = ChunkDownloader(
+                MockClient(data, short_part=9),
+                "",
+                len(data),
+                file_name,
+                1,
+                resume_key=(1, 2, "abc"),
+            )
+            with mock.patch.object(
+                ChunkMap, "save", autospec=True, side_effect=ChunkMap.save
+            ) as save:
+                with self.assertRaises(
+                    pyrogram.errors.exceptions.bad_request_400.BadRequest
+                ):
+                    self.loop.run_until_complete(downloader.download())
+
+            # the preallocated map, one throttled save and the final one
+            self.assertEqual(save.call_count, 3)
+            self.assertEqual(save.call_args[0][1], downloader.temp_file_name)
+            chunk_map = ChunkMap(downloader.chunk_map.path, (1, 2, "abc"), len(data))
+            self.assertTrue(chunk_map.load())
+            self.assertEqual(chunk_map.missing_parts(), [9])
@@ -0,0 +1,216 @@
+"""test cloud drive"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from module.cloud_drive import CloudDrive, CloudDriveConfig
+
+sys.path.append("..")  # Adds higher directory to python modules path.
+
+
+class MockFolder:
+    def __init__(self, file_id: str):
+        self.file_id = file_id
+
+
+class MockAligo:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.folders: dict = {}
+        self.lookups = 0
+        self.running = 0
+        self.max_running = 0
+        self.threads: set = set()
+
+    def get_folder_by_path(self, path):
+        with self.lock:
+            self.lookups += 1
+            return self.folders.get(path)
+
+    def create_folder(self, name, check_name_mode):
+        time.sleep(0.01)
+        with self.lock:
+            self.folders[name] = MockFolder(f"id-{name}")
+
+    def upload_files(self, file_paths, parent_file_id, check_name_mode):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            self.threads.add(threading.get_ident())
+        time.sleep(0.02)
+        with self.lock:
+            self.running -= 1
+        return [MockFolder(parent_file_id) for _ in file_paths]
+
+
+class MockProcess:
+    def __init__(self, lines):
+        self.returncode = None
+        self.stdout = self._stdout(lines)
+        self.killed = False
+
+    async def _stdout(self, lines):
+        for line in lines:
+            yield line.encode()
+
+    def kill(self):
+        self.killed = True
+        self.returncode = -9
+
+    async def wait(self):
+        self.returncode = self.returncode or 0
+        return self.returncode
+
+
+class CloudDriveTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.loop = asyncio.new_event_loop()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.close()
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.save_path = self.temp_dir.name
+        self.files = []
+        for idx in range(6):
+            dir_name = os.path.join(self.save_path, f"chat{idx % 2}")
+            os.makedirs(dir_name, exist_ok=True)
+            file_path = os.path.join(dir_name, f"{idx}.mp4")
+            with open(file_path, "wb") as f:
+                f.write(b"0" * 100)
+            self.files.append(file_path)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_aligo_upload(self):
+        drive_config = CloudDriveConfig(
+            enable_upload_file=True,
+            remote_dir="/remote",
+            upload_adapter="aligo",
+            max_upload_task=3,
+        )
+        drive_config.aligo = MockAligo()
+        progress_calls = []
+
+        async def _progress(current, total, file_path):
+            progress_calls.append((file_path, current, total))
+
+        async def _upload_all():
+            return await asyncio.gather(
+                *[
+                    CloudDrive.upload_file(
+                        drive_config,
+                        self.save_path,
+                        file_path,
+                        executor,
+                        progress=_progress,
+                        progress_args=(file_path,),
+                    )
+                    for file_path in self.files
+                ]
+            )
+
+        with ThreadPoolExecutor(8) as executor:
+            res = self.loop.run_until_complete(_upload_all())
+
+        self.assertEqual(res, [True] * 6)
+        aligo = drive_config.aligo
+        self.assertEqual(aligo.max_running, 3)
+        self.assertNotIn(threading.get_ident(), aligo.threads)
+        # one lookup before and one after creating each dir
+        self.assertEqual(aligo.lookups, 4)
+        remote_dirs = [
+            CloudDrive.get_remote_dir(drive_config, self.save_path, it)
+            for it in self.files[:2]
+        ]
+        self.assertEqual(drive_config.dir_cache, {it: f"id-{it}" for it in remote_dirs})
+        self.assertEqual(drive_config.total_upload_success_file_count, 6)
+        self.assertFalse(any(os.path.exists(it) for it in self.files))
+        self.assertEqual(
+            sorted(progress_calls),
+            sorted(
+                [(it, 0, 100) for it in self.files]
+                + [(it, 100, 100) for it in self.files]
+            ),
+        )
+
+    def test_aligo_not_config(self):
+        drive_config = CloudDriveConfig(enable_upload_file=True, upload_adapter="aligo")
+        self.assertFalse(
+            self.loop.run_until_complete(
+                CloudDrive.upload_file(drive_config, self.save_path, self.files[0])
+            )
+        )
+        self.assertTrue(os.path.exists(self.files[0]))
+
+    def test_rclone_progress(self):
+        drive_config = CloudDriveConfig(enable_upload_file=True, remote_dir="remote:")
+        drive_config.dir_cache[
+            CloudDrive.get_remote_dir(drive_config, self.save_path, self.files[0])
+        ] = True
+        progress_calls = []
+        lines = [
+            "Transferred:   \t    0 B / 100 B, 0%, 0 B/s, ETA -\n",
+            "Transferred:   \t   50 B / 100 B, 50%, 50 B/s, ETA 1s\n",
+            "Transferred:   \t  100 B / 100 B, 100%, 100 B/s, ETA 0s\n",
+            "Transferred:            1 / 1, 100%\n",
+        ]
+
+        async def _create_subprocess_shell(*args, **kwargs):
+            return MockProcess(lines)
+
+        def _progress(current, total):
+            progress_calls.append(current)
+
+        with mock.patch(
+            "module.cloud_drive.asyncio.create_subprocess_shell",
+            new=_create_subprocess_shell,
+        ):
+            res = self.loop.run_until_complete(
+                CloudDrive.upload_file(
+                    drive_config, self.save_path, self.files[0], progress=_progress
+                )
+            )
+
+        self.assertTrue(res)
+        self.assertEqual(progress_calls, [0, 0, 50, 100])
+        self.assertFalse(os.path.exists(self.files[0]))
+
+    def test_rclone_stop(self):
+        drive_config = CloudDriveConfig(enable_upload_file=True, remote_dir="remote:")
+        drive_config.dir_cache[
+            CloudDrive.get_remote_dir(drive_config, self.save_path, self.files[0])
+        ] = True
+        proc = MockProcess(["Transferred:   \t   50 B / 100 B, 50%, 50 B/s, ETA 1s\n"])
+
+        async def _create_subprocess_shell(*args, **kwargs):
+            return proc
+
+        def _progress(current, total):
+            if current:
+                raise ValueError("stop")
+
+        with mock.patch(
+            "module.cloud_drive.asyncio.create_subprocess_shell",
+            new=_create_subprocess_shell,
+        ):
+            res = self.loop.run_until_complete(
+                CloudDrive.upload_file(
+                    drive_config, self.save_path, self.files[0], progress=_progress
+                )
+            )
+
+        self.assertFalse(res)
+        self.assertTrue(proc.killed)
+        self.assertTrue(os.path.exists(self.files[0]))
@@ -0,0 +1,268 @@
+"""test download stat"""
+
+import asyncio
+import json
+import sys
+import unittest
+
+from module import download_stat, metrics
+from module.app import TaskNode
+from module.download_stat import (
+    SPEED_WINDOW,
+    TransferStat,
+    finish_transfer,
+    get_active_transfers,
+    get_chat_download_stat,
+    get_completed_transfers,
+    get_download_snapshot,
+    get_total_download_speed,
+    get_transfer_sort_key,
+    query_transfers,
+    tick_download_stat,
+    update_download_status,
+    wait_download_events,
+)
+
+sys.path.append("..")  # Adds higher directory to python modules path.
+
+
+class DownloadStatTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.loop = asyncio.new_event_loop()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.close()
+
+    def setUp(self):
+        download_stat._active_transfers.clear()
+        download_stat._completed_transfers.clear()
+        download_stat._chat_download_stat.clear()
+        download_stat._events.clear()
+        download_stat._published.clear()
+        download_stat._unpublished_completed.clear()
+
+    def test_speed_window(self):
+        stat = TransferStat(1, 2, "a.mp4", 10000, 100.0)
+        self.assertIsNone(stat.eta())
+
+        for i in range(1, SPEED_WINDOW + 1):
+            stat.down_byte = i * 100
+            self.assertEqual(stat.tick(100.0 + i), 100)
+        self.assertEqual(stat.download_speed, 100)
+        self.assertEqual(stat.eta(), (10000 - SPEED_WINDOW * 100) // 100)
+
+        # a stall of 2 seconds slows down the speed over the window
+        stat.down_byte += 100
+        stat.tick(100.0 + SPEED_WINDOW + 2)
+        self.assertEqual(
+            stat.download_speed, int(SPEED_WINDOW * 100 / (SPEED_WINDOW + 1))
+        )
+
+        # the old seconds leave the window
+        for i in range(SPEED_WINDOW):
+            stat.down_byte += 500
+            stat.tick(100.0 + SPEED_WINDOW + 3 + i)
+        self.assertEqual(stat.download_speed, 500)
+
+        stat.down_byte = stat.total_size
+        self.assertEqual(stat.eta(), 0)
+
+    def test_update_download_status(self):
+        node = TaskNode(chat_id=1, task_id=3)
+
+        async def _run():
+            await update_download_status(100, 300, 2, "a.mp4", 9.0, node, None)
+            await update_download_status(200, 300, 2, "a.mp4", 9.0, node, None)
+
+        download_bytes = metrics.DOWNLOAD_BYTES.get()
+        self.loop.run_until_complete(_run())
+        stat = list(get_active_transfers())[0]
+        self.assertEqual((stat.down_byte, stat.task_id), (200, 3))
+        self.assertEqual(stat.download_speed, 0)
+
+        # the bytes of the first callback were on the disk, like a resume
+        download_stat._last_tick_time = 9.0
+        tick_download_stat(10.0)
+        self.assertEqual(stat.download_speed, 100)
+        self.assertEqual(get_total_download_speed(), 100)
+
+        stat.down_byte = 300
+        tick_download_stat(11.0)
+        self.assertEqual(get_total_download_speed(), 100)
+        # finished, no more ticks
+        self.assertFalse(list(get_active_transfers()))
+        self.assertEqual(list(get_completed_transfers()), [stat])
+        self.assertEqual(stat.finish_time, 11.0)
+        self.assertEqual(get_chat_download_stat(1).completed_byte, 300)
+        self.assertEqual(metrics.DOWNLOAD_BYTES.get() - download_bytes, 200)
+
+    def test_unknown_size(self):
+        for message_id in (1, 2):
+            stat = TransferStat(1, message_id, "a.mp4", 0, 0.0)
+            stat.down_byte = 100
+            download_stat._active_transfers[(1, message_id)] = stat
+        tick_download_stat(1.0)
+        tick_download_stat(2.0)
+        # only completed by the end of the download
+        self.assertEqual(len(list(get_active_transfers())), 2)
+        self.assertFalse(list(get_completed_transfers()))
+        self.assertIsNone(stat.eta())
+
+        finish_transfer(1, 1, cur_time=3.0, success=True)
+        finish_transfer(1, 2, cur_time=3.0)
+        self.assertEqual(
+            [(it.message_id, it.is_finished()) for it in get_completed_transfers()],
+            [(2, False), (1, True)],
+        )
+        self.assertEqual(get_chat_download_stat(1).completed_count, 1)
+        self.assertEqual(get_chat_download_stat(1).completed_byte, 100)
+
+    def test_evict_completed(self):
+        for i in range(5):
+            stat = TransferStat(1, i, "a.mp4", 100, 0.0)
+            stat.down_byte = 100 if i else 50
+            download_stat._active_transfers[(1, i)] = stat
+            finish_transfer(1, i, cur_time=10.0 + i)
+
+        self.assertEqual(
+            [it.message_id for it in get_completed_transfers(12.0)], [4, 3, 2]
+        )
+        # the failed one is not counted
+        self.assertEqual(get_chat_download_stat(1).completed_count, 4)
+
+        tick_download_stat(14.0, max_completed=3, completed_ttl=60)
+        self.assertEqual([it.message_id for it in get_completed_transfers()], [4, 3, 2])
+
+        tick_download_stat(72.5, max_completed=3, completed_ttl=60)
+        self.assertEqual([it.message_id for it in get_completed_transfers()], [4, 3])
+        self.assertEqual(get_chat_download_stat(1).completed_byte, 400)
+
+    def test_download_events(self):
+        seq, data = get_download_snapshot()
+        self.assertEqual(json.loads(data)["new"], [])
+
+        stat = TransferStat(1, 2, "a\\b.mp4", 300, 0.0)
+        download_stat._active_transfers[(1, 2)] = stat
+        stat.down_byte = 100
+        tick_download_stat(1.0)
+        stat.down_byte = 200
+        tick_download_stat(2.0)
+        # stalled, only the speed changes
+        tick_download_stat(3.0)
+        # new and finished in one tick
+        other = TransferStat(1, 3, "c.mp4", 100, 2.5)
+        download_stat._active_transfers[(1, 3)] = other
+        finish_transfer(1, 3, cur_time=3.5)
+        stat.down_byte = 300
+        tick_download_stat(4.0)
+
+        events = wait_download_events(seq, 0)
+        self.assertEqual([it[0] for it in events], list(range(seq + 1, seq + 5)))
+        events = [json.loads(it[1]) for it in events]
+        self.assertEqual(
+            events[0]["new"],
+            [
+                {
+                    "chat": 1,
+                    "id": 2,
+                    "file_name": "a/b.mp4",
+                    "total_size": 300,
+                    "down_byte": 100,
+                    "speed": 100,
+                    "eta": 2,
+                }
+            ],
+        )
+        self.assertEqual(
+            events[1]["progress"],
+            [{"chat": 1, "id": 2, "down_byte": 200, "speed": 100, "eta": 1}],
+        )
+        self.assertEqual(events[1]["speed"], 100)
+        # rounded up
+        self.assertEqual(
+            events[2]["progress"],
+            [{"chat": 1, "id": 2, "down_byte": 200, "speed": 66, "eta": 2}],
+        )
+        self.assertEqual([it["id"] for it in events[3]["new"]], [3])
+        self.assertEqual(
+            events[3]["completed"],
+            [
+                {"chat": 1, "id": 3, "finished": False},
+                {"chat": 1, "id": 2, "finished": True},
+            ],
+        )
+        self.assertFalse(download_stat._published)
+
+        # timeout
+        self.assertEqual(wait_download_events(seq + 4, 0), [])
+        # fell behind
+        for _ in range(download_stat.EVENT_WINDOW):
+            tick_download_stat()
+        self.assertIsNone(wait_download_events(seq, 0))
+
+    def test_query_transfers(self):
+        stats = []
+        for i in range(6):
+            stat = TransferStat(i % 2, i, f"{i}.mp4", 100, float(i), task_id=i % 3)
+            stat.down_byte = i * 20
+            download_stat._active_transfers[(i % 2, i)] = stat
+            stats.append(stat)
+        finish_transfer(1, 5, cur_time=10.0)
+        finish_transfer(0, 4, cur_time=11.0)
+        for i, stat in enumerate(stats):
+            stat.download_speed = 10 - i
+
+        def _ids(transfers):
+            return [it.message_id for it in transfers[0]]
+
+        self.assertEqual(_ids(query_transfers()), [5, 4, 3, 2, 1, 0])
+        self.assertEqual(_ids(query_transfers("downloading")), [3, 2, 1, 0])
+        self.assertEqual(_ids(query_transfers("finished")), [5])
+        self.assertEqual(_ids(query_transfers("failed")), [4])
+        self.assertEqual(_ids(query_transfers(chat_id=1, task_id=0)), [3])
+        self.assertEqual(
+            _ids(query_transfers(sort="progress", reverse=False)), [0, 1, 2, 3, 4, 5]
+        )
+
+        pages = []
+        after = None
+        while True:
+            transfers, total = query_transfers(sort="speed", limit=4, after=after)
+            self.assertEqual(total, 6)
+            pages.append([it.message_id for it in transfers])
+            if len(transfers) < 4:
+                break
+            after = get_transfer_sort_key(transfers[-1], "speed")
+        self.assertEqual(pages, [[0, 1, 2, 3], [4, 5]])
+
+    def test_query_transfers_str_chat(self):
+        # a chat may be a username, and the same speed makes the chat decide
+        for chat_id, message_id in [(1, 1), ("user", 1), (-100, 2), ("user", 3)]:
+            stat = TransferStat(chat_id, message_id, "a.mp4", 100, 0.0)
+            download_stat._active_transfers[(chat_id, message_id)] = stat
+        stat.down_byte = 100
+        finish_transfer("user", 3, cur_time=1.0)
+
+        for reverse in (True, False):
+            rows = []
+            after = None
+            while True:
+                transfers, total = query_transfers(
+                    sort="speed", reverse=reverse, limit=1, after=after
+                )
+                self.assertEqual(total, 4)
+                if not transfers:
+                    break
+                rows.append((transfers[0].chat_id, transfers[0].message_id))
+                # the cursor is sent to the web ui as json
+                after = tuple(
+                    json.loads(json.dumps(get_transfer_sort_key(transfers[0], "speed")))
+                )
+            self.assertEqual(len(set(rows)), 4)
+
+        transfers, total = query_transfers(chat_id="user")
+        self.assertEqual([it.message_id for it in transfers], [3, 1])
+        self.assertEqual(query_transfers(chat_id="-100")[1], 1)
+        self.assertEqual(get_chat_download_stat("user").completed_count, 1)
@@ -0,0 +1,210 @@
+"""test get chat history v2"""
+
+import asyncio
+import sys
+import unittest
+from unittest import mock
+
+import pyrogram
+
+from module.get_chat_history_v2 import (
+    FloodWaitLimiter,
+    HistoryScanStat,
+    batch_messages,
+    get_chat_history_partitioned,
+    get_chat_history_v2,
+    get_chat_media_history,
+    get_media_search_filters,
+)
+
+sys.path.append("..")  # Adds higher directory to python modules path.
+
+
+class MockMessage:
+    def __init__(self, id: int):
+        self.id = id
+
+
+class MockChunk:
+    def __init__(self, last_id: int, fail_at: int = 0, flood_at: int = 0):
+        self.last_id = last_id
+        self.fail_at = fail_at
+        self.flood_at = flood_at
+        self.calls: list = []
+
+    async def __call__(
+        self, *, limit, from_message_id=0, max_id=0, reverse=False, **kwargs
+    ):
+        self.calls.append(from_message_id)
+        if self.fail_at and from_message_id >= self.fail_at:
+            raise ValueError("get history error")
+        if self.flood_at and from_message_id == self.flood_at:
+            self.flood_at = 0
+            raise pyrogram.errors.FloodWait(value=0)
+        await asyncio.sleep(0)
+        if not reverse:
+            # newest messages
+            return [MockMessage(self.last_id)]
+        # only even ids exist
+        first = from_message_id or 1
+        last = min(max_id - 1 if max_id else self.last_id, self.last_id)
+        return [MockMessage(it) for it in range(first, last + 1) if it % 2 == 0][:limit]
+
+
+async def _collect(messages_iter):
+    return [it.id async for it in messages_iter]
+
+
+class GetChatHistoryV2TestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.loop = asyncio.new_event_loop()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.close()
+
+    def test_get_chat_history(self):
+        chunk = MockChunk(250)
+        stat = HistoryScanStat()
+        with mock.patch("module.get_chat_history_v2.get_chunk_v2", new=chunk):
+            res = self.loop.run_until_complete(
+                _collect(get_chat_history_v2(None, 1, reverse=True, stat=stat))
+            )
+
+        self.assertEqual(res, list(range(2, 251, 2)))
+        self.assertEqual(chunk.calls, [0, 201, 251])
+        self.assertEqual(stat.pages, 3)
+        self.assertEqual(stat.messages, 125)
+
+    def test_limit(self):
+        chunk = MockChunk(1000)
+        with mock.patch("module.get_chat_history_v2.get_chunk_v2", new=chunk):
+            res = self.loop.run_until_complete(
+                _collect(
+                    get_chat_history_v2(None, 1, limit=150, offset_id=10, reverse=True)
+                )
+            )
+
+        self.assertEqual(res, list(range(10, 310, 2)))
+        # the producer stops after enough messages
+        self.assertEqual(chunk.calls, [10, 209])
+
+    def test_error(self):
+        chunk = MockChunk(1000, fail_at=101)
+        res = []
+
+        async def _run():
+            async for it in get_chat_history_v2(None, 1, reverse=True):
+                res.append(it.id)
+
+        with mock.patch("module.get_chat_history_v2.get_chunk_v2", new=chunk):
+            with self.assertRaises(ValueError):
+                self.loop.run_until_complete(_run())
+
+        self.assertEqual(res, list(range(2, 201, 2)))
+
+    def test_partitioned(self):
+        chunk = MockChunk(5000, flood_at=1410)
+        stat = HistoryScanStat()
+        with mock.patch("module.get_chat_history_v2.get_chunk_v2", new=chunk):
+            res = self.loop.run_until_complete(
+                _collect(
+                    get_chat_history_partitioned(
+                        None, 1, offset_id=10, max_task=3, range_size=700, stat=stat
+                    )
+                )
+            )
+
+        self.assertEqual(res, list(range(10, 5001, 2)))
+        self.assertEqual(stat.messages, len(res))
+        self.assertEqual(chunk.calls.count(1410), 2)
+
+        chunk = MockChunk(5000)
+        with mock.patch("module.get_chat_history_v2.get_chunk_v2", new=chunk):
+            res = self.loop.run_until_complete(
+                _collect(get_chat_history_partitioned(None, 1, max_id=99, offset_id=10))
+            )
+            self.assertEqual(res, list(range(10, 100, 2)))
+
+            res = self.loop.run_until_complete(
+                _collect(get_chat_history_partitioned(None, 1, offset_id=6000))
+            )
+            self.assertEqual(res, [])
+
+    def test_flood_wait_limiter(self):
+        limiter = FloodWaitLimiter()
+        limiter.flood(0.05)
+        limiter.flood(0)
+        start = self.loop.time()
+        self.loop.run_until_complete(limiter.wait())
+        self.assertGreaterEqual(self.loop.time() - start, 0.04)
+
+    def test_get_media_search_filters(self):
+        search_filters = get_media_search_filters(["photo", "video"])
+        self.assertIsInstance(
+            search_filters[0], pyrogram.raw.types.InputMessagesFilterPhotos
+        )
+        self.assertIsInstance(
+            search_filters[1], pyrogram.raw.types.InputMessagesFilterVideo
+        )
+        self.assertIsNone(get_media_search_filters(["photo", "sticker"]))
+        self.assertIsNone(get_media_search_filters([]))
+
+    def test_get_chat_media_history(self):
+        # every 3rd id is a photo, every 5th id a document
+        media = {
+            pyrogram.raw.types.InputMessagesFilterPhotos: 3,
+            pyrogram.raw.types.InputMessagesFilterDocument: 5,
+        }
+
+        async def _search_chunk(
+            *, search_filter, limit, max_id, from_message_id, **kwargs
+        ):
+            await asyncio.sleep(0)
+            step = media[type(search_filter)]
+            last = max_id - 1 if max_id else 1000
+            return [
+                MockMessage(it)
+                for it in range(from_message_id or 1, last + 1)
+                if it % step == 0
+            ][:limit]
+
+        search_filters = get_media_search_filters(["photo", "document"])
+        stat = HistoryScanStat()
+        with mock.patch(
+            "module.get_chat_history_v2.get_search_chunk", new=_search_chunk
+        ):
+            res = self.loop.run_until_complete(
+                _collect(
+                    get_chat_media_history(
+                        None, 1, search_filters, offset_id=10, stat=stat
+                    )
+                )
+            )
+            self.assertEqual(
+                res, [it for it in range(10, 1001) if it % 3 == 0 or it % 5 == 0]
+            )
+            self.assertEqual(stat.messages, len(range(12, 1001, 3)) + 199)
+
+            res = self.loop.run_until_complete(
+                _collect(
+                    get_chat_media_history(None, 1, search_filters, limit=4, max_id=30)
+                )
+            )
+            self.assertEqual(res, [3, 5, 6, 9])
+
+    def test_batch_messages(self):
+        async def _messages():
+            for it in range(250):
+                yield MockMessage(it)
+
+        async def _collect_batch():
+            return [
+                [it.id for it in messages]
+                async for messages in batch_messages(_messages(), 100)
+            ]
+
+        res = self.loop.run_until_complete(_collect_batch())
+        self.assertEqual([len(it) for it in res], [100, 100, 50])
+        self.assertEqual(sum(res, []), list(range(250)))
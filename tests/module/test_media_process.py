@@ -0,0 +1,241 @@
+"""test media process"""
+
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from module.media_process import MediaProcessor, add_silent_audio, proc_video_no_audio
+
+sys.path.append("..")  # Adds higher directory to python modules path.
+
+try:
+    import imageio_ffmpeg
+
+    _FFMPEG = imageio_ffmpeg.get_ffmpeg_exe()
+except Exception:
+    _FFMPEG = None
+
+
+class MockRun:
+    def __init__(self, audio: bool = False, ffmpeg_error: bool = False):
+        self.audio = audio
+        self.ffmpeg_error = ffmpeg_error
+        self.calls: list = []
+
+    async def __call__(self, *args):
+        self.calls.append(args)
+        if args[0] == "/bin/ffprobe":
+            return 0, b"1\n" if self.audio else b"", b""
+        if self.ffmpeg_error:
+            return 1, b"", b"error"
+        with open(args[-1], "w") as f:
+            f.write("remuxed")
+        return 0, b"", b""
+
+
+def _which(name):
+    return f"/bin/{name}"
+
+
+class MediaProcessTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.loop = asyncio.new_event_loop()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.close()
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "a.mp4")
+        with open(self.path, "w") as f:
+            f.write("video")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _read(self):
+        with open(self.path) as f:
+            return f.read()
+
+    @mock.patch("module.media_process._which", new=_which)
+    def test_remux(self):
+        run = MockRun()
+        with mock.patch("module.media_process._run", new=run):
+            self.assertTrue(
+                self.loop.run_until_complete(proc_video_no_audio(self.path))
+            )
+
+        self.assertEqual(self._read(), "remuxed")
+        self.assertEqual(len(run.calls), 2)
+        ffmpeg_args = run.calls[1]
+        self.assertEqual(ffmpeg_args[0], "/bin/ffmpeg")
+        self.assertIn("anullsrc=channel_layout=stereo:sample_rate=44100", ffmpeg_args)
+        self.assertEqual(ffmpeg_args[ffmpeg_args.index("-c") + 1], "copy")
+        self.assertIn("0:v", ffmpeg_args)
+        self.assertNotIn("0", ffmpeg_args)
+        self.assertFalse(os.path.exists(ffmpeg_args[-1]))
+
+    @mock.patch("module.media_process._which", new=_which)
+    def test_has_audio_or_drop(self):
+        run = MockRun(audio=True)
+        with mock.patch("module.media_process._run", new=run):
+            self.assertTrue(
+                self.loop.run_until_complete(proc_video_no_audio(self.path, True))
+            )
+        self.assertEqual(len(run.calls), 1)
+
+        run = MockRun()
+        with mock.patch("module.media_process._run", new=run):
+            self.assertFalse(
+                self.loop.run_until_complete(proc_video_no_audio(self.path, True))
+            )
+        self.assertEqual(len(run.calls), 1)
+        self.assertEqual(self._read(), "video")
+
+    @mock.patch("module.media_process._which", new=_which)
+    def test_ffmpeg_error(self):
+        def _moviepy(path, tmp_path, drop_no_audio_video):
+            with open(tmp_path, "w") as f:
+                f.write("encoded")
+
+        run = MockRun(ffmpeg_error=True)
+        with mock.patch("module.media_process._run", new=run), mock.patch(
+            "module.media_process._proc_video_no_audio_moviepy", new=_moviepy
+        ):
+            self.assertTrue(
+                self.loop.run_until_complete(proc_video_no_audio(self.path))
+            )
+        self.assertEqual(self._read(), "encoded")
+
+        # the video is kept as is if moviepy fails as well
+        with mock.patch("module.media_process._run", new=run), mock.patch(
+            "module.media_process._proc_video_no_audio_moviepy",
+            side_effect=OSError("moviepy"),
+        ):
+            self.assertTrue(
+                self.loop.run_until_complete(proc_video_no_audio(self.path))
+            )
+        self.assertEqual(self._read(), "encoded")
+
+    @mock.patch("module.media_process._which", new=lambda name: None)
+    def test_moviepy_fallback(self):
+        def _moviepy(path, tmp_path, drop_no_audio_video):
+            with open(tmp_path, "w") as f:
+                f.write("encoded")
+
+        with mock.patch(
+            "module.media_process._proc_video_no_audio_moviepy", new=_moviepy
+        ):
+            self.assertTrue(
+                self.loop.run_until_complete(proc_video_no_audio(self.path))
+            )
+        self.assertEqual(self._read(), "encoded")
+
+        with mock.patch(
+            "module.media_process._proc_video_no_audio_moviepy", return_value=False
+        ):
+            self.assertFalse(
+                self.loop.run_until_complete(proc_video_no_audio(self.path, True))
+            )
+
+    @unittest.skipUnless(_FFMPEG, "ffmpeg is not installed")
+    def test_add_silent_audio(self):
+        subprocess.run(
+            [
+                _FFMPEG,
+                "-v",
+                "error",
+                "-f",
+                "lavfi",
+                "-i",
+                "testsrc=duration=1:size=64x64:rate=10",
+                "-y",
+                self.path,
+            ],
+            check=True,
+        )
+        out_path = os.path.join(self.temp_dir.name, "b.mp4")
+        self.loop.run_until_complete(add_silent_audio(self.path, out_path, _FFMPEG))
+
+        info = subprocess.run(
+            [_FFMPEG, "-hide_banner", "-i", out_path],
+            capture_output=True,
+            text=True,
+        ).stderr
+        self.assertIn("Video: h264", info)
+        self.assertIn("Audio: aac", info)
+
+    @unittest.skipUnless(_FFMPEG, "ffmpeg is not installed")
+    def test_add_silent_audio_data_streams(self):
+        # a mov_text subtitle and a tmcd data stream, mp4 refuses to copy tmcd
+        srt_path = os.path.join(self.temp_dir.name, "a.srt")
+        with open(srt_path, "w") as f:
+            f.write("1\n00:00:00,000 --> 00:00:00,500\nhi\n")
+        subprocess.run(
+            [
+                _FFMPEG,
+                "-v",
+                "error",
+                "-f",
+                "lavfi",
+                "-i",
+                "testsrc=duration=1:size=64x64:rate=10",
+                "-i",
+                srt_path,
+                "-map",
+                "0",
+                "-map",
+                "1",
+                "-c:s",
+                "mov_text",
+                "-timecode",
+                "00:00:00:00",
+                "-y",
+                self.path,
+            ],
+            check=True,
+        )
+        out_path = os.path.join(self.temp_dir.name, "b.mp4")
+        self.loop.run_until_complete(add_silent_audio(self.path, out_path, _FFMPEG))
+
+        info = subprocess.run(
+            [_FFMPEG, "-hide_banner", "-i", out_path],
+            capture_output=True,
+            text=True,
+        ).stderr
+        self.assertIn("Audio: aac", info)
+
+    def test_media_processor(self):
+        processor = MediaProcessor(max_task=2)
+        running = []
+
+        async def _proc(path, drop_no_audio_video, executor):
+            running.append(processor.running)
+            await asyncio.sleep(0.01)
+            if path == "error":
+                raise ValueError(path)
+            return True
+
+        async def _run_jobs():
+            return await asyncio.gather(
+                *[processor.proc_video_no_audio(str(it)) for it in range(5)],
+                processor.proc_video_no_audio("error"),
+                return_exceptions=True,
+            )
+
+        with mock.patch("module.media_process.proc_video_no_audio", new=_proc):
+            res = self.loop.run_until_complete(_run_jobs())
+
+        self.assertEqual(res[:5], [True] * 5)
+        self.assertIsInstance(res[5], ValueError)
+        self.assertEqual(max(running), 2)
+        self.assertEqual((processor.running, processor.waiting), (0, 0))
+        self.assertEqual(processor.stat.jobs, 6)
+        self.assertGreater(processor.stat.total_wait_time, 0)
+        self.assertGreaterEqual(processor.stat.max_time, 0.01)
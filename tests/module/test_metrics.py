@@ -0,0 +1,77 @@
+"""test metrics"""
+
+import sys
+import unittest
+
+from module import metrics
+from module.metrics import Counter, Gauge, Histogram
+
+sys.path.append("..")  # Adds higher directory to python modules path.
+
+
+class MetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.registry = list(metrics._registry)
+
+    def tearDown(self):
+        metrics._registry[:] = self.registry
+
+    def test_counter(self):
+        counter = Counter("test_total", "Test counter", ["stage", "exception"])
+        counter.inc(stage="download", exception="FloodWait")
+        counter.inc(2.5, stage="download", exception='Bad"Request')
+        self.assertEqual(counter.get(stage="download", exception="FloodWait"), 1)
+        with self.assertRaises(ValueError):
+            counter.inc(stage="download")
+
+        self.assertEqual(
+            counter.expose(),
+            "# HELP test_total Test counter\n"
+            "# TYPE test_total counter\n"
+            'test_total{stage="download",exception="FloodWait"} 1\n'
+            'test_total{stage="download",exception="Bad\\"Request"} 2.5\n',
+        )
+
+    def test_gauge(self):
+        gauge = Gauge("test_size", "Test gauge")
+        gauge.set(3)
+        self.assertIn("test_size 3\n", gauge.expose())
+        gauge.set_function(lambda: 5)
+        self.assertIn("test_size 5\n", gauge.expose())
+
+    def test_histogram(self):
+        histogram = Histogram("test_seconds", "Test histogram", [1, 5])
+        for value in [0.5, 1, 3, 10]:
+            histogram.observe(value)
+        with histogram.time():
+            pass
+
+        self.assertEqual(histogram.get_count(), 5)
+        lines = histogram.expose().split("\n")
+        self.assertEqual(
+            lines[2:6],
+            [
+                'test_seconds_bucket{le="1"} 3',
+                'test_seconds_bucket{le="5"} 4',
+                'test_seconds_bucket{le="+Inf"} 5',
+                lines[5],
+            ],
+        )
+        self.assertTrue(lines[5].startswith("test_seconds_sum 14.5"))
+        self.assertEqual(lines[6], "test_seconds_count 5")
+
+    def test_generate_latest(self):
+        text = metrics.generate_latest()
+        for name in [
+            "tmd_download_bytes_total",
+            "tmd_download_seconds",
+            "tmd_download_queue_size",
+            "tmd_upload_bytes_total",
+            "tmd_flood_wait_seconds_total",
+            "tmd_retries_total",
+            "tmd_history_pages_total",
+            "tmd_filter_seconds",
+            "tmd_media_process_waiting",
+            "tmd_media_process_running",
+        ]:
+            self.assertIn(f"# TYPE {name} ", text)
@@ -0,0 +1,241 @@
+"""test rclone rcd"""
+
+import asyncio
+import http.server
+import json
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from module.cloud_drive import CloudDrive, CloudDriveConfig
+from module.rclone_rcd import RcloneRcd, RcloneRcdError
+
+sys.path.append("..")  # Adds higher directory to python modules path.
+
+
+class MockRc:
+    """rc server running the jobs at once"""
+
+    def __init__(self, error: str = ""):
+        self.lock = threading.Lock()
+        self.error = error
+        self.jobs: list = []
+        self.stopped: list = []
+
+    def __call__(self, method, params):
+        with self.lock:
+            if method in ("operations/copyfile", "sync/copy"):
+                self.jobs.append((method, params))
+                return {"jobid": len(self.jobs)}
+            if method == "job/status":
+                return {
+                    "finished": True,
+                    "success": not self.error,
+                    "error": self.error,
+                }
+            if method == "job/stop":
+                self.stopped.append(params["jobid"])
+            return {}
+
+
+async def _start(self):
+    pass
+
+
+class RcloneRcdTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.loop = asyncio.new_event_loop()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.close()
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.files = []
+        for i, size in enumerate([10, 10, 10, 100]):
+            path = os.path.join(self.tmp_dir.name, f"[{i}].jpg")
+            with open(path, "wb") as f:
+                f.write(b"0" * size)
+            self.files.append(path)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_batch(self):
+        rc = MockRc()
+        rcd = RcloneRcd("rclone", batch_size=2, batch_file_size=50)
+
+        async def _run():
+            await asyncio.gather(*[rcd.copy(it, "drive:/dst/") for it in self.files])
+
+        with mock.patch.object(RcloneRcd, "_post", new=lambda _, *args: rc(*args)):
+            with mock.patch.object(RcloneRcd, "start", new=_start):
+                self.loop.run_until_complete(_run())
+
+        jobs = sorted(rc.jobs, key=lambda it: it[0])
+        self.assertEqual(
+            [it[0] for it in jobs], ["operations/copyfile"] + ["sync/copy"] * 2
+        )
+        self.assertEqual(jobs[0][1]["srcRemote"], "[3].jpg")
+        self.assertTrue(all(it[1]["_async"] for it in jobs))
+        self.assertEqual(
+            sorted(rule for it in jobs[1:] for rule in it[1]["_filter"]["IncludeRule"]),
+            ["/\\[0\\].jpg", "/\\[1\\].jpg", "/\\[2\\].jpg"],
+        )
+
+    def test_add_batch_file(self):
+        rc = MockRc()
+        rcd = RcloneRcd("rclone", batch_size=3, batch_file_size=50)
+
+        async def _run():
+            batches = [rcd.add_batch_file(it, "drive:/dst/") for it in self.files]
+            # the files were added without waiting for the batch
+            self.assertIsNone(batches[3])
+            self.assertIs(batches[0], batches[2])
+            await batches[0]
+
+        with mock.patch.object(RcloneRcd, "_post", new=lambda _, *args: rc(*args)):
+            with mock.patch.object(RcloneRcd, "start", new=_start):
+                self.loop.run_until_complete(_run())
+
+        self.assertEqual([it[0] for it in rc.jobs], ["sync/copy"])
+        self.assertEqual(len(rc.jobs[0][1]["_filter"]["IncludeRule"]), 3)
+
+    def test_post_without_proxy(self):
+        class _Handler(http.server.BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.dumps({"path": self.path}).encode()
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = http.server.HTTPServer(("127.0.0.1", 0), _Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        rcd = RcloneRcd("rclone")
+        rcd.addr = f"127.0.0.1:{server.server_address[1]}"
+        try:
+            # an unreachable proxy of the environment is not used
+            with mock.patch.dict(
+                os.environ,
+                {
+                    "http_proxy": "http://127.0.0.1:1",
+                    "HTTP_PROXY": "http://127.0.0.1:1",
+                },
+            ):
+                self.assertEqual(rcd._post("rc/noop", {}), {"path": "/rc/noop"})
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_batch_cancelled(self):
+        rcd = RcloneRcd("rclone", batch_size=2, batch_file_size=50)
+
+        async def _run_job(*args, **kwargs):
+            await asyncio.sleep(60)
+
+        async def _run():
+            batch_done = rcd.add_batch_file(self.files[0], "drive:/")
+            rcd.add_batch_file(self.files[1], "drive:/")
+            await asyncio.sleep(0)
+            for task in list(rcd._tasks):
+                task.cancel()
+            with self.assertRaises(RcloneRcdError):
+                await asyncio.wait_for(batch_done, 1)
+
+        with mock.patch.object(RcloneRcd, "run_job", new=_run_job):
+            self.loop.run_until_complete(_run())
+
+    def test_start_args(self):
+        calls: list = []
+
+        async def _exec(*args, **kwargs):
+            calls.append(args)
+            return mock.Mock(returncode=None)
+
+        for ignore_existing in (True, False):
+            rcd = RcloneRcd("rclone", ignore_existing=ignore_existing)
+            with mock.patch.object(RcloneRcd, "_post", return_value={}):
+                with mock.patch("asyncio.create_subprocess_exec", new=_exec):
+                    self.loop.run_until_complete(rcd.start())
+            self.assertEqual("--ignore-existing" in calls[-1], ignore_existing)
+
+    def test_job_error(self):
+        rc = MockRc(error="directory not found")
+        rcd = RcloneRcd("rclone")
+
+        with mock.patch.object(RcloneRcd, "_post", new=lambda _, *args: rc(*args)):
+            with mock.patch.object(RcloneRcd, "start", new=_start):
+                with self.assertRaises(RcloneRcdError):
+                    self.loop.run_until_complete(rcd.copy(self.files[0], "drive:/"))
+
+    def test_upload_file(self):
+        rc = MockRc()
+        drive_config = CloudDriveConfig(
+            enable_upload_file=True,
+            remote_dir="drive:",
+            upload_adapter="rclone_rcd",
+            rclone_batch_size=1,
+        )
+        progress_calls: list = []
+
+        async def _progress(current, total):
+            progress_calls.append((current, total))
+
+        with mock.patch.object(RcloneRcd, "_post", new=lambda _, *args: rc(*args)):
+            with mock.patch.object(RcloneRcd, "start", new=_start):
+                self.assertTrue(
+                    self.loop.run_until_complete(
+                        CloudDrive.upload_file(
+                            drive_config,
+                            self.tmp_dir.name,
+                            self.files[3],
+                            progress=_progress,
+                        )
+                    )
+                )
+
+        self.assertEqual(rc.jobs[0][0], "operations/copyfile")
+        self.assertEqual(progress_calls, [(0, 100), (100, 100)])
+        self.assertFalse(os.path.exists(self.files[3]))
+        self.assertEqual(drive_config.total_upload_success_file_count, 1)
+
+    def test_add_rclone_batch_file(self):
+        rc = MockRc()
+        drive_config = CloudDriveConfig(
+            remote_dir="drive:",
+            upload_adapter="rclone_rcd",
+            rclone_batch_file_size=50,
+        )
+
+        async def _run():
+            self.assertIsNone(
+                CloudDrive.add_rclone_batch_file(
+                    drive_config, self.tmp_dir.name, self.files[0]
+                )
+            )
+            drive_config.enable_upload_file = True
+            self.assertIsNone(
+                CloudDrive.add_rclone_batch_file(
+                    drive_config, self.tmp_dir.name, self.files[3]
+                )
+            )
+            return await CloudDrive.add_rclone_batch_file(
+                drive_config, self.tmp_dir.name, self.files[0]
+            )
+
+        with mock.patch.object(RcloneRcd, "_post", new=lambda _, *args: rc(*args)):
+            with mock.patch.object(RcloneRcd, "start", new=_start):
+                self.assertTrue(self.loop.run_until_complete(_run()))
+
+        self.assertEqual(rc.jobs[0][0], "sync/copy")
+        self.assertFalse(os.path.exists(self.files[0]))
+        self.assertEqual(drive_config.total_upload_success_file_count, 1)
@@ -0,0 +1,91 @@
+"""test state store"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+from module.state_store import StateStore
+
+sys.path.append("..")  # Adds higher directory to python modules path.
+
+
+class StateStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.temp_dir.name, "data.db")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_message_status(self):
+        store = StateStore(self.db_path, commit_count=2)
+        store.set_message_status(-100, 1, 2)
+        store.set_message_status(-100, 2, 3)
+        store.set_message_status(-100, 3, 1)
+        store.set_message_status("user", 4, 3)
+        # later status replaces the old one
+        store.set_message_status(-100, 2, 2)
+        store.set_last_read_message_id(-100, 3)
+        store.close()
+
+        store = StateStore(self.db_path)
+        store.set_retry_ids(-100, [1, 2, 9])
+        # neither success nor skipped
+        self.assertEqual(store.get_unfinished_message_ids(-100, [2, 1]), [9])
+        self.assertEqual(store.get_unfinished_message_ids(-100, [2]), [3, 9])
+        self.assertEqual(store.get_unfinished_message_ids("user", [2, 1]), [4])
+        self.assertEqual(store.get_last_read_message_id(-100), 3)
+        self.assertIsNone(store.get_last_read_message_id("user"))
+        store.close()
+
+    def test_prune_message_status(self):
+        store = StateStore(self.db_path)
+        for message_id, status in [(1, 2), (2, 3), (3, 1), (5, 3)]:
+            store.set_message_status(-100, message_id, status)
+        store.set_message_status("user", 1, 3)
+        store.prune_message_status(-100, 3)
+        self.assertEqual(store.get_unfinished_message_ids(-100, [2, 1]), [5])
+        self.assertEqual(store.get_unfinished_message_ids("user", [2, 1]), [1])
+        store.close()
+
+    def test_retry_ids(self):
+        store = StateStore(self.db_path)
+        store.set_retry_ids(-100, [5, 3, 3])
+        self.assertEqual(store.get_retry_ids(-100), [3, 5])
+        store.set_retry_ids(-100, [8])
+        self.assertEqual(store.get_retry_ids(-100), [8])
+        self.assertEqual(store.get_retry_ids(-200), [])
+        store.close()
+
+    def test_uploaded_files(self):
+        store = StateStore(self.db_path)
+        store.add_uploaded_file(-100, 1, "a.mp4")
+        self.assertTrue(store.is_uploaded_file(-100, 1, "a.mp4"))
+        self.assertFalse(store.is_uploaded_file(-100, 2, "a.mp4"))
+        store.close()
+
+    def test_migrate_app_data(self):
+        store = StateStore(self.db_path)
+        app_data = {
+            "chat": [
+                {"chat_id": -100, "ids_to_retry": [1, 2]},
+                {"chat_id": "user"},
+                {"ids_to_retry": [9]},
+            ]
+        }
+        self.assertTrue(store.migrate_app_data(app_data))
+        self.assertEqual(store.get_retry_ids(-100), [1, 2])
+        self.assertEqual(store.get_retry_ids("user"), [])
+
+        # only once
+        store.set_retry_ids(-100, [])
+        self.assertFalse(store.migrate_app_data(app_data))
+        self.assertEqual(store.get_retry_ids(-100), [])
+        store.close()
+
+    def test_migrate_legacy_app_data(self):
+        store = StateStore(self.db_path)
+        self.assertTrue(store.migrate_app_data({"ids_to_retry": [4, 5]}, 123))
+        self.assertEqual(store.get_retry_ids(123), [4, 5])
+        store.close()
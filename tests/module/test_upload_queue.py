@@ -0,0 +1,85 @@
+"""test upload queue"""
+
+import asyncio
+import sys
+import unittest
+
+from module.upload_queue import UploadQueue
+
+sys.path.append("..")  # Adds higher directory to python modules path.
+
+
+class UploadQueueTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.loop = asyncio.new_event_loop()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.close()
+
+    def test_backpressure(self):
+        upload_queue = UploadQueue(100)
+        put_items: list = []
+
+        async def _producer():
+            for item, size in [("a", 60), ("b", 30), ("c", 50), ("d", 0)]:
+                await upload_queue.put(item, size)
+                put_items.append(item)
+
+        async def _run():
+            producer = asyncio.ensure_future(_producer())
+            await asyncio.sleep(0.01)
+            # "c" waits until "a" is uploaded
+            self.assertEqual(put_items, ["a", "b"])
+            self.assertEqual(upload_queue.pending_size, 90)
+
+            item, size = await upload_queue.get()
+            self.assertEqual((item, size), ("a", 60))
+            await upload_queue.done(size)
+            await producer
+            self.assertEqual(put_items, ["a", "b", "c", "d"])
+            self.assertEqual(upload_queue.pending_size, 80)
+
+            for _ in range(3):
+                _, size = await upload_queue.get()
+                await upload_queue.done(size)
+
+        self.loop.run_until_complete(_run())
+        self.assertTrue(upload_queue.empty())
+        self.assertEqual(upload_queue.pending_size, 0)
+
+    def test_big_file(self):
+        upload_queue = UploadQueue(10)
+
+        async def _run():
+            # a file bigger than the limit still goes if nothing is pending
+            await asyncio.wait_for(upload_queue.put("a", 20), 1)
+            self.assertFalse(upload_queue.empty())
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(upload_queue.put("b", 1), 0.05)
+
+        self.loop.run_until_complete(_run())
+
+    def test_hold(self):
+        upload_queue = UploadQueue(100)
+
+        async def _run():
+            await upload_queue.put("a", 80)
+            _, size = await upload_queue.get()
+            delayed_upload = asyncio.get_running_loop().create_future()
+            upload_queue.hold(delayed_upload, size)
+            self.assertTrue(upload_queue.only_held())
+
+            # the size is kept until the delayed upload is done
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(upload_queue.put("b", 80), 0.05)
+            self.assertEqual(upload_queue.pending_size, 80)
+
+            delayed_upload.set_exception(ValueError("upload failed"))
+            await asyncio.wait_for(upload_queue.put("b", 80), 1)
+            self.assertFalse(upload_queue.only_held())
+
+        self.loop.run_until_complete(_run())
+        self.assertEqual(upload_queue.held_count, 0)
+        self.assertEqual(upload_queue.pending_count, 1)
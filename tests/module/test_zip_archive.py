@@ -0,0 +1,149 @@
+"""test zip archive"""
+
+import asyncio
+import os
+import stat
+import sys
+import tempfile
+import unittest
+from unittest import mock
+from zipfile import ZIP_DEFLATED, ZIP_STORED, ZipFile
+
+from module.cloud_drive import CloudDrive, CloudDriveConfig
+from module.zip_archive import ZipStream, get_compress_type, write_zip
+
+sys.path.append("..")  # Adds higher directory to python modules path.
+
+# rclone stand-in: `rcat <remote>` stores stdin as the local file <remote>
+FAKE_RCLONE = """#!{python}
+import shutil
+import sys
+
+if sys.argv[1] == "rcat":
+    with open(sys.argv[2], "wb") as f:
+        shutil.copyfileobj(sys.stdin.buffer, f)
+"""
+
+
+class ZipArchiveTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.loop = asyncio.new_event_loop()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.close()
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.save_path = os.path.join(self.tmp_dir.name, "save")
+        self.remote_dir = os.path.join(self.tmp_dir.name, "remote")
+        os.makedirs(os.path.join(self.save_path, "2023_01"))
+        os.makedirs(os.path.join(self.remote_dir, "2023_01"))
+        self.files = []
+        for name in ["1.jpg", "2.txt", "3.mp4"]:
+            path = os.path.join(self.save_path, "2023_01", name)
+            with open(path, "wb") as f:
+                f.write(name.encode() * 100)
+            self.files.append(path)
+
+        self.rclone_path = os.path.join(self.tmp_dir.name, "rclone")
+        with open(self.rclone_path, "w") as f:
+            f.write(FAKE_RCLONE.format(python=sys.executable))
+        os.chmod(self.rclone_path, os.stat(self.rclone_path).st_mode | stat.S_IEXEC)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def check_zip(self, zip_path: str, names: list):
+        with ZipFile(zip_path) as zip_reader:
+            self.assertEqual(zip_reader.namelist(), names)
+            for info in zip_reader.infolist():
+                self.assertEqual(
+                    info.compress_type,
+                    ZIP_DEFLATED if info.filename.endswith(".txt") else ZIP_STORED,
+                )
+                self.assertEqual(zip_reader.read(info), info.filename.encode() * 100)
+
+    def test_compress_type(self):
+        self.assertEqual(get_compress_type("a.JPG"), ZIP_STORED)
+        self.assertEqual(get_compress_type("a.mkv"), ZIP_STORED)
+        self.assertEqual(get_compress_type("a.txt"), ZIP_DEFLATED)
+        self.assertEqual(get_compress_type("a"), ZIP_DEFLATED)
+
+    def test_write_zip(self):
+        zip_path = os.path.join(self.tmp_dir.name, "a.zip")
+        write_zip(zip_path, self.files, flat=True)
+        self.check_zip(zip_path, ["1.jpg", "2.txt", "3.mp4"])
+
+    def test_zip_stream(self):
+        zip_path = os.path.join(self.tmp_dir.name, "a.zip")
+        stream = ZipStream(self.files, flat=True)
+        self.assertEqual(stream.pipe_to([self.rclone_path, "rcat", zip_path]), 0)
+        self.assertEqual(stream.written, os.path.getsize(zip_path))
+        self.check_zip(zip_path, ["1.jpg", "2.txt", "3.mp4"])
+
+        stream = ZipStream(self.files)
+        stream.stop()
+        with self.assertRaises(ValueError):
+            stream.pipe_to([self.rclone_path, "rcat", zip_path])
+
+    def test_zip_group(self):
+        drive_config = CloudDriveConfig(
+            enable_upload_file=True,
+            rclone_path=self.rclone_path,
+            remote_dir=self.remote_dir,
+            zip_group="folder",
+            zip_group_timeout=60,
+        )
+
+        async def _run():
+            groups = [
+                CloudDrive.add_zip_group_file(drive_config, self.save_path, it)
+                for it in self.files
+            ]
+            self.assertIs(groups[0], groups[2])
+            self.assertTrue(drive_config.has_zip_groups())
+            await drive_config.stop()
+            return await groups[0]
+
+        self.assertTrue(self.loop.run_until_complete(_run()))
+        self.assertFalse(drive_config.has_zip_groups())
+        self.assertEqual(drive_config.total_upload_success_file_count, 3)
+        self.assertFalse(any(os.path.exists(it) for it in self.files))
+        self.check_zip(
+            os.path.join(self.remote_dir, "2023_01", "2023_01-1.zip"),
+            ["1.jpg", "2.txt", "3.mp4"],
+        )
+
+    def test_zip_group_max_size(self):
+        drive_config = CloudDriveConfig(zip_group="media_group", zip_group_max_size=1)
+
+        async def _run():
+            # nothing is grouped if the upload is off
+            self.assertIsNone(
+                CloudDrive.add_zip_group_file(
+                    drive_config, self.save_path, self.files[0], "123"
+                )
+            )
+            drive_config.enable_upload_file = True
+            self.assertIsNone(
+                CloudDrive.add_zip_group_file(
+                    drive_config, self.save_path, self.files[0]
+                )
+            )
+            with mock.patch.object(
+                CloudDrive, "upload_zip_group", new=_upload_zip_group
+            ):
+                group = CloudDrive.add_zip_group_file(
+                    drive_config, self.save_path, self.files[0], "123"
+                )
+                # full at once
+                self.assertFalse(drive_config.zip_groups)
+                return await group
+
+        async def _upload_zip_group(drive_config, group):
+            self.assertEqual(group.name, "123.zip")
+            group.done.set_result(True)
+
+        self.assertTrue(self.loop.run_until_complete(_run()))
@@ -3,6 +3,7 @@ import asyncio
 import os
 import platform
 import queue
+import subprocess
 import sys
 import unittest
 from datetime import datetime
@@ -20,6 +21,7 @@ from media_downloader import (
     download_all_chat,
     download_media,
     download_task,
+    get_scan_range,
     main,
     worker,
 )
@@ -857,6 +859,49 @@ class MediaDownloaderTestCase(unittest.TestCase):
         self.loop.run_until_complete(download_all_chat(client))
         moc_put.assert_called()
 
+    def test_get_scan_range(self):
+        rest_app(MOCK_CONF)
+        chat_download_config = app.chat_download_config[8654123]
+        chat_download_config.last_read_message_id = 5
+        node = TaskNode(chat_id=8654123)
+
+        async def _message_id_before(client, chat_id, offset_date):
+            # one message a day since 2022-01-01
+            return max((offset_date - datetime(2022, 1, 1)).days, 0)
+
+        with mock.patch(
+            "media_downloader.get_message_id_before", new=_message_id_before
+        ):
+            for filter_str, res in (
+                ("", (5, 0)),
+                ("id > 20 || id < 3", (5, 0)),
+                ("id > 20 && id <= 30", (21, 30)),
+                ("id < 3", None),
+                (
+                    "message_date >= 2022-02-01 00:00:00"
+                    " && message_date <= 2022-02-08 00:00:00",
+                    (32, 38),
+                ),
+                ("message_date < 2021-12-01 00:00:00", None),
+            ):
+                chat_download_config.download_filter = filter_str
+                self.assertEqual(
+                    self.loop.run_until_complete(
+                        get_scan_range(None, chat_download_config, node)
+                    ),
+                    res,
+                    filter_str,
+                )
+
+            node.end_offset_id = 35
+            chat_download_config.download_filter = "id > 20"
+            self.assertEqual(
+                self.loop.run_until_complete(
+                    get_scan_range(None, chat_download_config, node)
+                ),
+                (21, 35),
+            )
+
     def test_can_download(self):
         file_formats = {
             "audio": ["mp3"],
@@ -875,6 +920,70 @@ class MediaDownloaderTestCase(unittest.TestCase):
         result3 = _can_download("document", file_formats, "epub")
         self.assertEqual(result3, True)
 
+    @mock.patch("media_downloader.app.enable_chunk_download", new=True)
+    @mock.patch("media_downloader.app.chunk_download_min_size", new=1)
+    @mock.patch("media_downloader.asyncio.sleep", return_value=None)
+    @mock.patch("media_downloader._is_exist", return_value=False)
+    @mock.patch(
+        "media_downloader._move_to_download_path", new=mock_move_to_download_path
+    )
+    @mock.patch(
+        "media_downloader._check_download_finish", new=mock_check_download_finish
+    )
+    def test_chunk_download_refetch(self, _, __):
+        reset_download_cache()
+        rest_app(MOCK_CONF)
+
+        def _message(file_id: str) -> MockMessage:
+            message = MockMessage(
+                id=14,
+                media=True,
+                video=MockVideo(file_name="chunk.mp4", mime_type="video/mp4"),
+            )
+            message.video.file_id = file_id
+            return message
+
+        file_ids: list = []
+
+        async def _fetch_message(client, message):
+            # the file reference is refreshed by every fetch
+            return _message(f"VIDEO{len(file_ids)}")
+
+        async def _download_media_parallel(client, media, file_name, *args, **kwargs):
+            file_ids.append(media.file_id)
+            if len(file_ids) == 1:
+                raise pyrogram.errors.exceptions.bad_request_400.BadRequest
+            return file_name
+
+        with mock.patch("media_downloader.fetch_message", new=_fetch_message):
+            with mock.patch(
+                "media_downloader.download_media_parallel",
+                new=_download_media_parallel,
+            ):
+                result = self.loop.run_until_complete(
+                    async_download_media(
+                        MockClient(), _message("VIDEO"), ["video"], {"video": ["all"]}
+                    )
+                )
+
+        self.assertEqual(result[0], DownloadStatus.SuccessDownload)
+        self.assertEqual(file_ids, ["VIDEO0", "VIDEO1"])
+
+    def test_lazy_imports(self):
+        # heavy optional dependencies are only imported by their features
+        project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        modules = subprocess.check_output(
+            [
+                sys.executable,
+                "-c",
+                "import sys, media_downloader; print(' '.join(sys.modules))",
+            ],
+            cwd=project_dir,
+            text=True,
+        ).split()
+        for module in ("moviepy", "flask", "aligo", "module.web"):
+            self.assertNotIn(module, modules)
+
     def test_is_exist(self):
         this_dir = os.path.dirname(os.path.abspath(__file__))
         result = _is_exist(os.path.join(this_dir, "__init__.py"))
@@ -1,11 +1,16 @@
 """Unittest module for media downloader."""
+import importlib.util
+import os
 import sys
+import tempfile
 import unittest
 from datetime import datetime
 
 import mock
+from ply import lex, yacc
 
-from module.filter import Filter, MetaData
+from module import filter_lextab, filter_parsetab
+from module.filter import BaseFilter, Filter, MetaData
 from module.pyrogram_extension import set_meta_data
 from tests.test_common import (
     Chat,
@@ -21,6 +26,7 @@ from tests.test_common import (
     get_extension,
 )
 from utils.format import replace_date_time
+from utils.meta_data import ReString
 
 sys.path.append("..")  # Adds higher directory to python modules path.
 
@@ -94,7 +100,7 @@ class FilterTestCase(unittest.TestCase):
         )
 
         self.assertEqual(
-            filter_exec(download_filter, "media_file_name == r'test\.*mp4'"), True
+            filter_exec(download_filter, r"media_file_name == r'test\.*mp4'"), True
         )
 
         self.assertEqual(
@@ -448,3 +454,98 @@ class FilterTestCase(unittest.TestCase):
         download_filter.set_debug(True)
         filter_exec(download_filter, "caption == r'.*高桥.*'")
         filter_exec(download_filter, "caption == r'.*高桥.*'")
+
+    def test_compile_cache(self):
+        download_filter = Filter()
+        download_filter.filter.compile.cache_clear()
+        filter_str = "file_size >= 10MB and media_type == r'(video|audio)'"
+
+        for file_size, media_type, res in (
+            (1024 * 1024 * 20, "video", True),
+            (1024 * 1024 * 20, "photo", False),
+            (1024, "audio", False),
+        ):
+            download_filter.set_meta_data(
+                MetaData(media_file_size=file_size, media_type=media_type)
+            )
+            self.assertEqual(download_filter.exec(filter_str), res)
+
+        cache_info = download_filter.filter.compile.cache_info()
+        self.assertEqual(cache_info.misses, 1)
+        self.assertEqual(cache_info.hits, 2)
+
+        # a name error is found without meta data values
+        with self.assertRaises(ValueError):
+            download_filter.filter.compile("not_exist == 1")
+
+    def test_invalid_regex(self):
+        download_filter = Filter()
+        download_filter.set_meta_data(MetaData(message_caption="abc"))
+        res, err = check_filter_exec(download_filter, "caption == r'(abc'")
+        self.assertFalse(res)
+        self.assertTrue(err.startswith("Invalid regex '(abc'"))
+
+        # same pattern object for the same regex
+        self.assertIs(ReString("a.*").pattern, ReString("a.*").pattern)
+
+    def test_get_bounds(self):
+        download_filter = Filter()
+        bounds = download_filter.get_bounds(
+            "id > 10 && 100 >= id && message_date >= 2022-03-04 00:00:00"
+            " && media_type == 'video' && message_date < 2022-03-08 00:00:00"
+        )
+        self.assertEqual(bounds.min_id, 11)
+        self.assertEqual(bounds.max_id, 100)
+        self.assertEqual(bounds.min_date, datetime(2022, 3, 4))
+        self.assertEqual(bounds.max_date, datetime(2022, 3, 8))
+
+        bounds = download_filter.get_bounds("id == 5 and (id < 3 or id > 7)")
+        self.assertEqual((bounds.min_id, bounds.max_id), (5, 5))
+        self.assertIsNone(bounds.min_date)
+
+        # anything under `or` is not a bound
+        bounds = download_filter.get_bounds("id > 10 || file_size > 1MB")
+        self.assertIsNone(bounds.min_id)
+        bounds = download_filter.get_bounds("id != 10 && id + 1 > 5")
+        self.assertEqual((bounds.min_id, bounds.max_id), (None, None))
+
+    def test_filter_tables(self):
+        # the shipped tables are loaded without checking the grammar,
+        # run gen_filter_cache.py if this fails
+        base_filter = Filter().filter
+        self.assertIs(base_filter.yacc, Filter().filter.yacc)
+
+        pdict = {name: getattr(base_filter, name) for name in dir(base_filter)}
+        pinfo = yacc.ParserReflect(pdict, log=yacc.NullLogger())
+        pinfo.get_all()
+        self.assertEqual(pinfo.signature(), filter_parsetab._lr_signature)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            lex.lex(
+                module=base_filter,
+                optimize=1,
+                lextab="tmp_filter_lextab",
+                outputdir=temp_dir,
+                errorlog=lex.NullLogger(),
+            )
+            spec = importlib.util.spec_from_file_location(
+                "tmp_filter_lextab", os.path.join(temp_dir, "tmp_filter_lextab.py")
+            )
+            lextab = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(lextab)
+        self.assertEqual(lextab._lexstatere, filter_lextab._lexstatere)
+        self.assertEqual(lextab._lextokens, filter_lextab._lextokens)
+
+    def test_filter_tables_startup(self):
+        # the first filter only reads the shipped tables, the slow generation
+        # of the tables is not on the startup path
+        with mock.patch.object(BaseFilter, "_lexer", None), mock.patch.object(
+            BaseFilter, "_parser", None
+        ), mock.patch.object(
+            yacc, "LRGeneratedTable", side_effect=AssertionError("parser generated")
+        ), mock.patch.object(
+            lex.Lexer, "writetab", side_effect=AssertionError("lexer generated")
+        ):
+            download_filter = Filter()
+            self.assertIsNotNone(BaseFilter._parser)
+            self.assertIs(download_filter.filter.yacc, Filter().filter.yacc)
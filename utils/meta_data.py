@@ -1,11 +1,24 @@
 """Meta data for download filter"""
 
+import re
+from functools import lru_cache
+
+
+@lru_cache(maxsize=256)
+def compile_re(re_string: str) -> re.Pattern:
+    """Compile a filter regex, shared by all filters"""
+    return re.compile(re_string, re.MULTILINE)
+
 
 class ReString:
     """for re match"""
 
     def __init__(self, re_string: str):
         self.re_string = re_string
+        try:
+            self.pattern = compile_re(re_string)
+        except re.error as e:
+            raise ValueError(f"Invalid regex '{re_string}': {e}") from e
 
 
 class NoneObj:
@@ -75,24 +88,27 @@ class MetaData:
         self.sender_name = sender_name
         self.reply_to_message_id = reply_to_message_id
 
+    # filter name: attribute
+    FILTER_NAMES = {
+        "message_date": "message_date",
+        "message_id": "message_id",
+        "message_caption": "message_caption",
+        "media_file_size": "media_file_size",
+        "media_width": "media_width",
+        "media_height": "media_height",
+        "media_file_name": "media_file_name",
+        "media_duration": "media_duration",
+        "id": "message_id",
+        "caption": "message_caption",
+        "file_size": "media_file_size",
+        "file_name": "media_file_name",
+        "media_type": "media_type",
+        "file_extension": "file_extension",
+        "sender_id": "sender_id",
+        "sender_name": "sender_name",
+        "reply_to_message_id": "reply_to_message_id",
+    }
+
     def data(self) -> dict:
         """Meta map"""
-        return {
-            "message_date": self.message_date,
-            "message_id": self.message_id,
-            "message_caption": self.message_caption,
-            "media_file_size": self.media_file_size,
-            "media_width": self.media_width,
-            "media_height": self.media_height,
-            "media_file_name": self.media_file_name,
-            "media_duration": self.media_duration,
-            "id": self.message_id,
-            "caption": self.message_caption,
-            "file_size": self.media_file_size,
-            "file_name": self.media_file_name,
-            "media_type": self.media_type,
-            "file_extension": self.file_extension,
-            "sender_id": self.sender_id,
-            "sender_name": self.sender_name,
-            "reply_to_message_id": self.reply_to_message_id,
-        }
+        return {name: getattr(self, attr) for name, attr in self.FILTER_NAMES.items()}